@@ -25,7 +25,10 @@ setup(
         'requests >= 2.32; python_version >= "3.0"',
         'requests[security] >= 2.32; python_version < "3.0"',
     ],
-    python_requires=">=3.6",
+    extras_require={
+        "http2": ["httpx[http2] >= 0.23"],
+    },
+    python_requires=">=3.8",
     project_urls={
         "Bug Tracker": "https://github.com/twikey/twikey-api-python/issues",
         "Source Code": "https://github.com/twikey/twikey-api-python",
@@ -38,10 +41,9 @@ setup(
         "Operating System :: OS Independent",
         "Programming Language :: Python",
         "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.6",
-        "Programming Language :: Python :: 3.7",
         "Programming Language :: Python :: 3.8",
         "Programming Language :: Python :: 3.9",
+        "Programming Language :: Python :: 3.10",
         "Programming Language :: Python :: Implementation :: PyPy",
         "Topic :: Software Development :: Libraries :: Python Modules",
     ],
@@ -1,6 +1,37 @@
+import json
+
+import twikey
+
 api_version = "twikey-python/v0.1.0"
 
 # Set to either 'debug' or 'info', controls console logging
 log = None
 
 # Webhooks
+
+
+# Fakes shared by the tests running without Twikey
+class FakeResponse(object):
+    """Response of a fake session, json() returns the given body"""
+
+    def __init__(self, body=None, status_code=200, headers=None):
+        self.body = body
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.text = json.dumps(body)
+        self.content = self.text.encode()
+
+    def json(self):
+        return self.body
+
+
+def feed_response(list_key, items, last) -> FakeResponse:
+    """A page of a feed, last is returned as X-LAST"""
+    return FakeResponse({list_key: items}, headers={"X-LAST": last})
+
+
+def offline_client(session, **options) -> twikey.TwikeyClient:
+    """Client sending its calls to the given fake session without logging in"""
+    client = twikey.TwikeyClient("apikey", session=session, **options)
+    client.token_expired = lambda: False
+    return client
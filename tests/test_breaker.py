@@ -0,0 +1,123 @@
+import unittest
+
+import requests
+
+import twikey
+from tests import FakeResponse, offline_client
+from twikey.breaker import (
+    CircuitBreakerSession,
+    endpoint_family,
+    CLOSED,
+    OPEN,
+    HALF_OPEN,
+)
+from twikey.model.invoice_request import DetailsRequest
+
+BASE_URL = "https://test.beta.twikey.com/api/creditor"
+
+
+class _FailingSession(object):
+    def __init__(self):
+        self.calls = 0
+        self.failing = True
+
+    def get(self, url, **kwargs):
+        self.calls += 1
+        if self.failing:
+            raise requests.exceptions.ConnectTimeout("timeout")
+        return FakeResponse({"id": "42"})
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_endpoint_family(self):
+        self.assertEqual("invoice", endpoint_family(BASE_URL + "/invoice/42", BASE_URL))
+        self.assertEqual("mandate", endpoint_family(BASE_URL + "/invite", BASE_URL))
+        self.assertEqual(
+            "paylink", endpoint_family(BASE_URL + "/payment/link/feed", BASE_URL)
+        )
+        self.assertEqual(
+            "transfer", endpoint_family(BASE_URL + "/transfers/beneficiaries", BASE_URL)
+        )
+        self.assertIsNone(endpoint_family(BASE_URL, BASE_URL))
+
+    def test_fails_fast_once_open(self):
+        session = _FailingSession()
+        policy = twikey.CircuitBreakerPolicy(window=4, min_calls=4, open_seconds=0)
+        client = offline_client(session, base_url=BASE_URL, circuit_breaker=policy)
+        breaker_session = client.session
+        self.assertIsInstance(breaker_session, CircuitBreakerSession)
+
+        for _ in range(4):
+            with self.assertRaises(twikey.TwikeyError) as ctx:
+                client.invoice.details(DetailsRequest(id="42"))
+            self.assertEqual("ConnectTimeout", ctx.exception.get_code())
+        self.assertEqual(OPEN, breaker_session.breaker("invoice").state)
+
+        # other families are not affected
+        self.assertEqual(CLOSED, breaker_session.breaker("transaction").state)
+
+        breaker_session.breaker("invoice").policy.open_seconds = 60
+        with self.assertRaises(twikey.TwikeyError) as ctx:
+            client.invoice.details(DetailsRequest(id="42"))
+        self.assertEqual("CircuitOpen", ctx.exception.get_code())
+        self.assertEqual(4, session.calls)
+        self.assertEqual(1, breaker_session.stats()["invoice"]["rejected"])
+
+    def test_half_open_probe_closes(self):
+        session = _FailingSession()
+        breaker_session = CircuitBreakerSession(
+            session,
+            twikey.CircuitBreakerPolicy(window=2, min_calls=2, open_seconds=0),
+            BASE_URL,
+        )
+        for _ in range(2):
+            with self.assertRaises(requests.exceptions.RequestException):
+                breaker_session.get(BASE_URL + "/transfer/detail")
+        breaker = breaker_session.breaker("transfer")
+        self.assertEqual(OPEN, breaker.state)
+        permit = breaker.allow()
+        self.assertTrue(permit.probe)
+        self.assertEqual(HALF_OPEN, breaker.state)
+        breaker.record(permit, True)
+        self.assertEqual(CLOSED, breaker.state)
+
+    def test_stale_outcomes_and_other_errors(self):
+        breaker = CircuitBreakerSession(
+            _FailingSession(),
+            twikey.CircuitBreakerPolicy(window=2, min_calls=2, open_seconds=0),
+            BASE_URL,
+        ).breaker("invoice")
+        slow = breaker.allow()
+        breaker.record(breaker.allow(), False)
+        breaker.record(breaker.allow(), False)
+        self.assertEqual(OPEN, breaker.state)
+        probe = breaker.allow()
+        self.assertEqual(HALF_OPEN, breaker.state)
+        # a call admitted while closed finishing during the probe doesn't count as the probe
+        breaker.record(slow, True)
+        self.assertEqual(HALF_OPEN, breaker.state)
+        self.assertIsNone(breaker.allow())
+        breaker.record(probe, False)
+        self.assertEqual(OPEN, breaker.state)
+
+        class _Broken(object):
+            def get(self, url, **kwargs):
+                raise ValueError("bug in a session")
+
+        breaker_session = CircuitBreakerSession(
+            _Broken(),
+            twikey.CircuitBreakerPolicy(window=2, min_calls=2, open_seconds=0),
+            BASE_URL,
+        )
+        breaker = breaker_session.breaker("invoice")
+        breaker.record(breaker.allow(), False)
+        breaker.record(breaker.allow(), False)
+        # an error unrelated to Twikey releases the probe without deciding the state
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                breaker_session.get(BASE_URL + "/invoice/42")
+        self.assertEqual(HALF_OPEN, breaker.state)
+
+
+if __name__ == "__main__":
+    unittest.main()
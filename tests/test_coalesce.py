@@ -0,0 +1,96 @@
+import threading
+import unittest
+
+import twikey
+from tests import FakeResponse, offline_client
+from twikey.coalesce import SingleFlight
+from twikey.model.document_request import FetchMandateRequest
+from twikey.model.invoice_request import UpdateInvoiceRequest
+from twikey.model.transaction_request import UpdateRequest
+
+
+class _SlowSession(object):
+    """Session only answering a GET once the test releases it"""
+
+    def __init__(self):
+        self.calls = 0
+        self.barrier = threading.Barrier(2)
+
+    def get(self, url, **kwargs):
+        self.calls += 1
+        self.barrier.wait(timeout=5)
+        return FakeResponse({"Mndt": {"MndtId": "MNDT1"}}, headers={"X-STATE": "SIGNED"})
+
+
+class TestCoalesce(unittest.TestCase):
+
+    def test_single_flight_shares_errors(self):
+        flight = SingleFlight()
+        with self.assertRaises(KeyError):
+            flight.do("key", lambda: {}["missing"])
+        self.assertEqual(1, flight.do("key", lambda: 1))
+        self.assertEqual(2, flight.calls)
+
+    def test_concurrent_fetches_share_one_call(self):
+        callers = 5
+        session = _SlowSession()
+        client = offline_client(session, coalesce_reads=True)
+        results = []
+
+        def fetch():
+            results.append(client.document.fetch(FetchMandateRequest("MNDT1")))
+
+        threads = [threading.Thread(target=fetch) for _ in range(callers)]
+        for t in threads:
+            t.start()
+        # wait until the other callers joined the call in flight before answering
+        while client.single_flight.shared < callers - 1:
+            threading.Event().wait(0.001)
+        session.barrier.wait(timeout=5)
+        for t in threads:
+            t.join()
+
+        self.assertEqual(1, session.calls)
+        self.assertEqual(callers, len(results))
+        self.assertTrue(all(doc is results[0] for doc in results))
+        self.assertEqual("MNDT1", results[0].mandate_number)
+
+    def test_updates_of_same_object_are_merged(self):
+        class _Service(object):
+            def __init__(self):
+                self.sent = []
+
+            def update(self, request):
+                self.sent.append(request.to_request())
+                return len(self.sent)
+
+        class _Client(object):
+            invoice = _Service()
+            transaction = _Service()
+
+        client = _Client()
+        with twikey.UpdateBuffer(client, window=10) as buffer:
+            first = buffer.update("invoice", UpdateInvoiceRequest(id="inv1", title="First"))
+            buffer.update("invoice", UpdateInvoiceRequest(id="inv2", title="Other"))
+            last = buffer.update("invoice", UpdateInvoiceRequest(id="inv1", title="Second", ref="REF"))
+            buffer.update("transaction", UpdateRequest(id=1, message="Message"))
+            buffer.update("transaction", UpdateRequest(id=1, ref="REF"))
+            self.assertIs(first, last)
+            with self.assertRaises(ValueError):
+                buffer.update("paylink", UpdateRequest(id=1))
+
+        self.assertEqual(5, buffer.updates)
+        self.assertEqual(3, buffer.sent)
+        self.assertIn({"id": "inv1", "title": "Second", "ref": "REF"}, client.invoice.sent)
+        self.assertEqual([{"id": 1, "message": "Message", "ref": "REF"}], client.transaction.sent)
+        self.assertIsNotNone(first.result())
+
+        with twikey.UpdateBuffer(client, window=0.01) as buffer:
+            # sent once the window passed, without waiting for the buffer to be closed
+            self.assertEqual(2, buffer.update("transaction", UpdateRequest(id=2, ref="REF")).result(timeout=5))
+        with self.assertRaises(RuntimeError):
+            buffer.update("transaction", UpdateRequest(id=2, ref="REF"))
+
+
+if __name__ == "__main__":
+    unittest.main()
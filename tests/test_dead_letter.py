@@ -0,0 +1,105 @@
+import os
+import tempfile
+import unittest
+
+import twikey
+from tests import feed_response, offline_client
+
+
+class _InvoiceSession(object):
+    def __init__(self, pages):
+        self.pages = list(pages)
+
+    def get(self, url, **kwargs):
+        items = self.pages.pop(0) if self.pages else []
+        return feed_response("Invoices", items, items[-1]["id"] if items else "")
+
+
+class _Invoices(twikey.InvoiceFeed):
+    def __init__(self, poison=()):
+        self.poison = poison
+        self.handled = []
+
+    def invoice(self, invoice):
+        if invoice.id in self.poison:
+            raise ValueError("Can't handle " + invoice.id)
+        if invoice.state == "unknown":
+            return "Unknown state"
+        self.handled.append(invoice.id)
+
+
+class TestDeadLetters(unittest.TestCase):
+
+    def _check_store(self, store):
+        session = _InvoiceSession([[{"id": "inv1"}, {"id": "inv2"}, {"id": "inv3", "state": "unknown"}], [{"id": "inv4"}]])
+        client = offline_client(session, dead_letters=store)
+
+        feed = _Invoices(poison=("inv2",))
+        self.assertEqual("inv4", client.invoice.feed(feed))
+        self.assertEqual(["inv1", "inv4"], feed.handled)
+
+        letters = store.list("invoice.feed")
+        self.assertEqual(["inv2", "inv3"], [letter.item["id"] for letter in letters])
+        self.assertIn("ValueError: Can't handle inv2", letters[0].error)
+        self.assertEqual("Unknown state", letters[1].error)
+        self.assertEqual([], store.list("invoice.payment"))
+
+        engine = client.invoice.feed_engine()
+        self.assertEqual(0, engine.retry_dead_letters(_Invoices(poison=("inv2",))))
+        self.assertEqual(2, store.list()[0].attempts)
+
+        fixed = _Invoices()
+        fixed.invoice = lambda invoice: fixed.handled.append(invoice.id)
+        self.assertEqual(2, engine.retry_dead_letters(fixed))
+        self.assertEqual(["inv2", "inv3"], fixed.handled)
+        self.assertEqual([], store.list())
+
+    def test_file_store(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self._check_store(twikey.FileDeadLetterStore(os.path.join(directory, "dead.ndjson")))
+
+    def test_sqlite_store(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self._check_store(twikey.SqliteDeadLetterStore(os.path.join(directory, "dead.db")))
+
+    def test_failing_batch(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = twikey.FileDeadLetterStore(os.path.join(directory, "dead.ndjson"))
+            session = _InvoiceSession([[{"id": "inv1"}, {"id": "inv2"}, {"id": "inv3"}]])
+            client = offline_client(session, dead_letters=store)
+            checkpoints = []
+
+            class _Batches(twikey.BatchFeed):
+                batch_size = 2
+
+                def batch(self, invoices):
+                    if invoices[0].id == "inv1":
+                        raise ValueError("Bulk insert failed")
+
+                def checkpoint(self, position):
+                    checkpoints.append(position)
+
+            client.invoice.feed(_Batches())
+            self.assertEqual(["inv3"], checkpoints)
+            self.assertEqual(["inv1", "inv2"], [letter.item["id"] for letter in store.list()])
+
+    def test_undecodable_item_in_batch(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = twikey.FileDeadLetterStore(os.path.join(directory, "dead.ndjson"))
+            session = _InvoiceSession([[{"id": "inv1"}, ["not", "an", "invoice"], {"id": "inv3"}]])
+            client = offline_client(session, dead_letters=store)
+            batches = []
+
+            class _Batches(twikey.BatchFeed):
+                def batch(self, invoices):
+                    batches.append([invoice.id for invoice in invoices])
+
+            engine = client.invoice.feed_engine()
+            self.assertEqual("inv3", engine.run(_Batches()))
+            self.assertEqual([["inv1", "inv3"]], batches)
+            self.assertEqual([["not", "an", "invoice"]], [letter.item for letter in store.list()])
+            self.assertEqual(3, engine.items)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,437 @@
+import contextvars
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+import twikey
+from tests import FakeResponse, feed_response, offline_client
+
+
+class _FeedSession(object):
+    """Serves the given pages one after the other, followed by empty ones"""
+
+    def __init__(self, list_key, pages):
+        self.list_key = list_key
+        self.pages = list(pages)
+        self.requests = []
+
+    def get(self, url, **kwargs):
+        self.requests.append((url, dict(kwargs["headers"])))
+        items = self.pages.pop(0) if self.pages else []
+        return feed_response(self.list_key, items, str(len(self.requests)))
+
+
+class _Recorder(twikey.PaylinkFeed):
+    def __init__(self, stop_at=None):
+        self.starts = []
+        self.links = []
+        self.stop_at = stop_at
+
+    def start(self, position, number_of_updates):
+        self.starts.append((position, number_of_updates))
+
+    def paylink(self, paylink):
+        self.links.append(paylink.id)
+        return paylink.id == self.stop_at
+
+
+class TestFeedEngine(unittest.TestCase):
+    def test_all_pages_and_resume(self):
+        session = _FeedSession("Links", [[{"id": 1}, {"id": 2}], [{"id": 3}]])
+        feed = _Recorder()
+        position = offline_client(session).paylink.feed(feed, start_position="10")
+
+        self.assertEqual([1, 2, 3], feed.links)
+        self.assertEqual([("1", 2), ("2", 1)], feed.starts)
+        self.assertEqual("2", position)
+        self.assertEqual("10", session.requests[0][1]["X-RESUME-AFTER"])
+        self.assertNotIn("X-RESUME-AFTER", session.requests[1][1])
+
+    def test_stop_within_page(self):
+        session = _FeedSession(
+            "Links", [[{"id": 1}, {"id": 2}, {"id": 3}], [{"id": 4}]]
+        )
+        feed = _Recorder(stop_at=2)
+        position = offline_client(session).paylink.feed(feed)
+
+        self.assertEqual([1, 2], feed.links)
+        self.assertEqual(1, len(session.requests))
+        self.assertFalse(position)
+
+    def test_error_response(self):
+        class _Unavailable(_FeedSession):
+            def get(self, url, **kwargs):
+                return FakeResponse(
+                    {"code": "err_unavailable", "message": "Unavailable"},
+                    status_code=503,
+                )
+
+        with self.assertRaises(twikey.TwikeyError) as raised:
+            offline_client(_Unavailable("Links", [])).paylink.feed(_Recorder())
+        self.assertEqual(503, raised.exception.status)
+
+    def test_refund_handler_result_is_ignored(self):
+        session = _FeedSession(
+            "Entries", [[{"id": "R1"}, {"id": "R2"}], [{"id": "R3"}]]
+        )
+        refunds = []
+
+        class _Refunds(twikey.RefundFeed):
+            def refund(self, refund):
+                refunds.append(refund.id)
+                return True
+
+        self.assertEqual("2", offline_client(session).refund.feed(_Refunds()))
+        self.assertEqual(["R1", "R2", "R3"], refunds)
+
+    def test_batches(self):
+        session = _FeedSession(
+            "Links", [[{"id": 1}, {"id": 2}, {"id": 3}], [{"id": 4}, {"id": 5}]]
+        )
+        calls = []
+
+        class _Batches(twikey.BatchFeed):
+            batch_size = 2
+
+            def batch(self, items):
+                calls.append([paylink.id for paylink in items])
+                return 4 in calls[-1]
+
+            def checkpoint(self, position):
+                calls.append(position)
+
+        position = offline_client(session).paylink.feed(_Batches())
+        # the checkpoint only moves once all batches of the page returned
+        self.assertEqual([[1, 2], [3], "1", [4, 5]], calls)
+        self.assertEqual("1", position)
+
+    def test_prefetch_is_bounded(self):
+        session = _FeedSession(
+            "Links", [[{"id": i * 10 + j} for j in range(10)] for i in range(20)]
+        )
+        engine = offline_client(session).paylink.feed_engine()
+        queue = twikey.PageQueue(max_items=25)
+        depths = []
+
+        class _Slow(_Recorder):
+            def paylink(self, paylink):
+                depths.append(queue.items)
+                time.sleep(0.0005)
+                return super().paylink(paylink)
+
+        feed = _Slow()
+        self.assertEqual("20", engine.run(feed, prefetch=queue))
+        self.assertEqual(list(range(200)), feed.links)
+        # at most one page above the high-water mark
+        self.assertLessEqual(max(depths), 30)
+        self.assertLessEqual(queue.peak_items, 30)
+        self.assertGreater(queue.paused, 0)
+        self.assertEqual(0, queue.stats()["pages"])
+
+        # stopping hands back the position of the last page handled, prefetched pages are dropped
+        session = _FeedSession(
+            "Links", [[{"id": 1}], [{"id": 2}], [{"id": 3}], [{"id": 4}]]
+        )
+        feed = _Recorder(stop_at=3)
+        self.assertEqual(
+            "2", offline_client(session).paylink.feed_engine().run(feed, prefetch=queue)
+        )
+        self.assertEqual([1, 2, 3], feed.links)
+
+    def test_prefetch_error(self):
+        class _Failing(_FeedSession):
+            def get(self, url, **kwargs):
+                if self.requests:
+                    raise twikey.TwikeyError(
+                        "Feed paylink", "err_unavailable", "Unavailable"
+                    )
+                return super().get(url, **kwargs)
+
+        feed = _Recorder()
+        with self.assertRaises(twikey.TwikeyError):
+            offline_client(_Failing("Links", [[{"id": 1}]])).paylink.feed_engine().run(
+                feed, prefetch=twikey.PageQueue()
+            )
+        # the pages fetched before the error are still handled
+        self.assertEqual([1], feed.links)
+
+    def test_prefetch_keeps_context(self):
+        tenant = contextvars.ContextVar("tenant", default=None)
+
+        class _Session(_FeedSession):
+            def get(self, url, **kwargs):
+                self.tenants.append(tenant.get())
+                return super().get(url, **kwargs)
+
+        session = _Session("Links", [[{"id": 1}], [{"id": 2}]])
+        session.tenants = []
+        tenant.set("merchant1")
+        offline_client(session).paylink.feed_engine().run(
+            _Recorder(), prefetch=twikey.PageQueue()
+        )
+        self.assertEqual(["merchant1"] * 3, session.tenants)
+
+    def test_record_and_replay(self):
+        with tempfile.TemporaryDirectory() as directory:
+            session = _FeedSession(
+                "Links", [[{"id": 1}, {"id": 2}], [{"id": 3}], [{"id": 4}]]
+            )
+            with twikey.FeedRecorder(directory, segment_pages=2) as recorder:
+                client = offline_client(session, feed_recorder=recorder)
+                client.paylink.feed(_Recorder())
+            self.assertEqual(2, len(os.listdir(directory)))
+
+            # replaying doesn't need Twikey
+            offline = twikey.TwikeyClient("apikey", session=None)
+            engine = offline.paylink.feed_engine()
+            feed = _Recorder()
+            self.assertEqual("3", engine.replay(feed, recorder.pages("paylink.feed")))
+            self.assertEqual([1, 2, 3, 4], feed.links)
+            self.assertEqual([("1", 2), ("2", 1), ("3", 1)], feed.starts)
+
+            feed = _Recorder()
+            engine.replay(feed, recorder.pages("paylink.feed", after="1"))
+            self.assertEqual([3, 4], feed.links)
+
+            # a segment cut off while being written is read until where it was cut
+            last_segment = os.path.join(directory, sorted(os.listdir(directory))[-1])
+            with open(last_segment, "r+b") as f:
+                f.truncate(12)
+            self.assertEqual(
+                ["1", "2"], [page.last for page in recorder.pages("paylink.feed")]
+            )
+            self.assertEqual([], list(recorder.pages("invoice.feed")))
+
+    def test_tail(self):
+        session = _FeedSession("Links", [[{"id": 1}]])
+        engine = offline_client(session).paylink.feed_engine()
+        feed = _Recorder()
+        result = []
+        thread = threading.Thread(
+            target=lambda: result.append(
+                engine.tail(feed, min_interval=0.01, max_interval=10)
+            )
+        )
+        thread.start()
+        while len(session.requests) < 4:
+            time.sleep(0.01)
+        # the interval grows while the feed remains empty
+        time.sleep(0.2)
+        polls = len(session.requests)
+        self.assertLess(polls, 12)
+
+        session.pages.append([{"id": 2}, {"id": 3}])
+        engine.wake()
+        while len(feed.links) < 3:
+            time.sleep(0.01)
+        engine.stop()
+        thread.join(timeout=5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual([1, 2, 3], feed.links)
+        self.assertEqual([str(polls + 1)], result)
+
+    def test_position_after_error(self):
+        class _Failing(_Recorder):
+            def paylink(self, paylink):
+                if paylink.id == 3 and not self.links.count(3):
+                    self.links.append(3)
+                    raise twikey.TwikeyError(
+                        "Feed paylink", "err_handler", "Handler failed"
+                    )
+                return super().paylink(paylink)
+
+        class _Session(_FeedSession):
+            """Serves the page after the position resumed after, the page at position n ends at n + 1"""
+
+            def get(self, url, **kwargs):
+                self.requests.append((url, dict(kwargs["headers"])))
+                self.next = int(kwargs["headers"].get("X-RESUME-AFTER", self.next)) + 1
+                items = (
+                    self.pages[self.next - 1] if self.next <= len(self.pages) else []
+                )
+                return feed_response(self.list_key, items, str(self.next))
+
+        # the pages handled before the error aren't handed out again
+        session = _Session("Links", [[{"id": 1}], [{"id": 2}], [{"id": 3}]])
+        session.next = 0
+        engine = offline_client(session).paylink.feed_engine()
+        with self.assertRaises(twikey.TwikeyError):
+            engine.run(_Failing())
+        self.assertEqual("2", engine.position)
+
+        session = _Session("Links", [[{"id": 1}], [{"id": 2}], [{"id": 3}]])
+        session.next = 0
+        engine = offline_client(session).paylink.feed_engine()
+        feed = _Failing(stop_at=3)
+        self.assertEqual("2", engine.tail(feed, min_interval=0.01))
+        self.assertEqual([1, 2, 3, 3], feed.links)
+        # the poll after the error resumes after the second page
+        self.assertEqual("2", session.requests[3][1]["X-RESUME-AFTER"])
+
+    def test_projections(self):
+        from twikey.document import MINIMAL_FEED_INCLUDES
+
+        # without the person include there is no originator
+        session = _FeedSession(
+            "Messages",
+            [
+                [
+                    {
+                        "OrgnlMndtId": "MNDT1",
+                        "CxlRsn": {"Rsn": "MS02"},
+                        "EvtTime": "2024-01-03T10:00:00Z",
+                    },
+                    {
+                        "OrgnlMndtId": "MNDT3",
+                        "AmdmntRsn": {"Rsn": "_T50"},
+                        "EvtTime": "2024-01-03T10:00:00Z",
+                    },
+                    {"Mndt": {"MndtId": "MNDT2"}, "EvtTime": "2024-01-03T10:00:00Z"},
+                ]
+            ],
+        )
+        client = offline_client(session)
+        numbers = []
+
+        class _Documents(twikey.DocumentFeed):
+            def new_document(self, doc, evt_time):
+                numbers.append(doc.mandate_number)
+
+            def updated_document(
+                self, original_doc_number, doc, reason, author, evt_time
+            ):
+                numbers.append((doc.mandate_number, author))
+
+            def cancelled_document(self, doc_number, reason, author, evt_time):
+                numbers.append((doc_number, author))
+
+        client.document.feed(_Documents(), projection=MINIMAL_FEED_INCLUDES)
+        self.assertEqual([("MNDT1", None), ("MNDT3", None), "MNDT2"], numbers)
+        self.assertTrue(session.requests[0][0].endswith("/mandate?include=id"))
+
+        self.assertTrue(
+            client.document.feed_engine().url.endswith(
+                "/mandate?include=id&include=mandate&include=person"
+            )
+        )
+        self.assertTrue(
+            client.invoice.feed_engine("meta").url.endswith(
+                "/invoice?include=customer&include=meta"
+            )
+        )
+        self.assertTrue(
+            client.invoice.feed_engine(projection=()).url.endswith("/invoice")
+        )
+
+    def test_document_events(self):
+        mandate = {"MndtId": "MNDT1", "Dbtr": {}}
+        orgtr = {"Orgtr": {"CtctDtls": {"EmailAdr": "info@twikey.com"}}}
+        session = _FeedSession(
+            "Messages",
+            [
+                [
+                    {"Mndt": mandate, "EvtTime": "2024-01-01T10:00:00Z"},
+                    {
+                        "OrgnlMndtId": "MNDT1",
+                        "Mndt": mandate,
+                        "AmdmntRsn": dict(Rsn="_T50", **orgtr),
+                        "EvtTime": "2024-01-02T10:00:00Z",
+                    },
+                    {
+                        "OrgnlMndtId": "MNDT1",
+                        "CxlRsn": dict(Rsn="MS02", **orgtr),
+                        "EvtTime": "2024-01-03T10:00:00Z",
+                    },
+                ]
+            ],
+        )
+        events = []
+
+        class _Documents(twikey.DocumentFeed):
+            def new_document(self, doc, evt_time):
+                events.append(("new", doc.mandate_number, evt_time.day))
+
+            def updated_document(
+                self, original_doc_number, doc, reason, author, evt_time
+            ):
+                events.append(("updated", original_doc_number, reason, author))
+
+            def cancelled_document(self, doc_number, reason, author, evt_time):
+                events.append(
+                    ("cancelled", doc_number, reason, evt_time.tzinfo is not None)
+                )
+
+        offline_client(session).document.feed(_Documents())
+        self.assertEqual(
+            [
+                ("new", "MNDT1", 1),
+                ("updated", "MNDT1", "_T50", "info@twikey.com"),
+                ("cancelled", "MNDT1", "MS02", True),
+            ],
+            events,
+        )
+
+    def test_payment_events(self):
+        session = _FeedSession(
+            "Payments",
+            [
+                [
+                    {
+                        "eventId": "E1",
+                        "eventType": "payment",
+                        "occurredAt": "2024-01-01T10:00:00Z",
+                        "amount": 1250,
+                        "currency": "EUR",
+                        "origin": {
+                            "object": "invoice",
+                            "id": "INV1",
+                            "number": "1",
+                            "ref": "R1",
+                        },
+                        "gateway": {
+                            "id": 1,
+                            "name": "Bank",
+                            "type": "transfer",
+                            "iban": "BE68539007547034",
+                        },
+                        "details": {},
+                        "newField": "ignored",
+                    },
+                    {
+                        "eventId": "E2",
+                        "eventType": "payment_fail",
+                        "occurredAt": "2024-01-02T10:00:00Z",
+                        "amount": 9.9,
+                        "error": {
+                            "code": "AM04",
+                            "description": "Insufficient funds",
+                            "actionStep": 1,
+                        },
+                    },
+                ]
+            ],
+        )
+        payments = []
+
+        class _Payments(twikey.PaymentFeed):
+            def payment(self, payment):
+                payments.append(payment)
+
+        offline_client(session, parse_timestamps=True).invoice.payment(_Payments())
+        paid, failed = payments
+        self.assertEqual(1250, paid.amount)
+        self.assertEqual(990, failed.amount)
+        self.assertEqual(1, paid.occurredAt.day)
+        self.assertEqual("INV1", paid.origin.id)
+        self.assertIs(paid.origin, paid.origin)
+        self.assertEqual("transfer", paid.gateway.type)
+        self.assertIsNone(paid.error)
+        self.assertEqual("AM04", failed.error.code)
+        self.assertIsNone(failed.error.externalCode)
+        self.assertIsNone(failed.origin)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import contextvars
+import threading
+import unittest
+
+import requests
+
+import twikey
+from twikey.hedging import HedgedSession
+
+
+class _Response(object):
+    def __init__(self, text):
+        self.text = text
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class _Session(object):
+    """Session where the first GET hangs until released, later ones answer immediately"""
+
+    def __init__(self, fail_first=False):
+        self.calls = []
+        self.responses = []
+        self.release = threading.Event()
+        self.fail_first = fail_first
+
+    def get(self, url, **kwargs):
+        self.calls.append(threading.current_thread())
+        if len(self.calls) == 1:
+            self.release.wait(timeout=5)
+            if self.fail_first:
+                raise requests.exceptions.ReadTimeout("Read timed out")
+            response = _Response("slow")
+        else:
+            # the first read only returns once the hedge answered
+            threading.Timer(0.05, self.release.set).start()
+            response = _Response("fast")
+        self.responses.append(response)
+        return response
+
+    def post(self, url, **kwargs):
+        return "posted"
+
+    def close(self):
+        pass
+
+
+class TestHedging(unittest.TestCase):
+
+    def session(self, fail_first=False, **policy):
+        session = _Session(fail_first)
+        hedged = HedgedSession(session, twikey.HedgingPolicy(initial_delay=0.01, **policy))
+        self.addCleanup(hedged.close)
+        self.addCleanup(session.release.set)
+        return session, hedged
+
+    def test_slow_read_is_hedged(self):
+        session, hedged = self.session()
+        self.assertEqual("fast", hedged.get("https://api.twikey.com/creditor/mandate/detail", params={}).text)
+        self.assertEqual(2, len(session.calls))
+        self.assertEqual(1, hedged.stats.hedge_wins)
+        # the read itself is sent from the caller's thread, the response that lost is closed
+        self.assertIs(threading.current_thread(), session.calls[0])
+        self.assertIsNot(threading.current_thread(), session.calls[1])
+        self.assertEqual(["fast", "slow"], [response.text for response in session.responses])
+        self.assertEqual([False, True], [response.closed for response in session.responses])
+
+    def test_failed_read_uses_hedge(self):
+        session, hedged = self.session(fail_first=True)
+        self.assertEqual("fast", hedged.get("https://api.twikey.com/creditor/transaction/detail").text)
+        self.assertEqual(1, hedged.stats.hedge_wins)
+
+    def test_hedge_keeps_context(self):
+        tenant = contextvars.ContextVar("tenant", default=None)
+        tenants = []
+
+        class _TenantSession(_Session):
+            def get(self, url, **kwargs):
+                tenants.append(tenant.get())
+                return super().get(url, **kwargs)
+
+        session = _TenantSession()
+        hedged = HedgedSession(session, twikey.HedgingPolicy(initial_delay=0.01))
+        self.addCleanup(hedged.close)
+        self.addCleanup(session.release.set)
+        tenant.set("merchant1")
+        hedged.get("https://api.twikey.com/creditor/mandate/detail")
+        self.assertEqual(["merchant1", "merchant1"], tenants)
+
+    def test_feeds_and_writes_are_not_hedged(self):
+        session, hedged = self.session()
+        session.release.set()
+        self.assertEqual("slow", hedged.get("https://api.twikey.com/creditor/mandate").text)
+        self.assertEqual("posted", hedged.post("https://api.twikey.com/creditor/mandate/detail"))
+        self.assertEqual(0, hedged.stats.reads)
+
+    def test_budget_caps_hedges(self):
+        session, hedged = self.session(budget=0)
+        hedged.stats.hedged = 1
+        session.release.set()
+        self.assertEqual("slow", hedged.get("https://api.twikey.com/creditor/transaction/detail").text)
+        self.assertEqual(1, len(session.calls))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import logging
+import unittest
+
+import twikey
+from twikey.log import redact
+
+
+class TestPayloadLogging(unittest.TestCase):
+
+    def test_redact(self):
+        payload = {
+            "Mndt": {"DbtrAcct": "BE51561419613262", "Dbtr": {"CtctDtls": {"EmailAdr": "info@twikey.com"}}},
+            "msg": "Paid from BE51 5614 1961 3262 by info@twikey.com",
+            "amount": 10,
+        }
+        redacted = redact(payload)
+        self.assertEqual("***", redacted["Mndt"]["DbtrAcct"])
+        self.assertEqual("***", redacted["Mndt"]["Dbtr"]["CtctDtls"]["EmailAdr"])
+        self.assertEqual("Paid from *** by ***@***", redacted["msg"])
+        self.assertEqual(10, redacted["amount"])
+
+    def test_sampling_and_truncation(self):
+        logger = logging.getLogger("twikey.test")
+        logger.setLevel(logging.DEBUG)
+        payload_logging = twikey.PayloadLogging(sample_every=3, max_length=20)
+        with self.assertLogs(logger, logging.DEBUG) as logs:
+            for i in range(6):
+                payload_logging.log(logger, "Feed handling", {"id": i, "title": "x" * 100})
+        self.assertEqual(2, len(logs.records))
+        self.assertIn("chars)", logs.output[0])
+
+    def test_disabled_debug_is_not_formatted(self):
+        logger = logging.getLogger("twikey.test.disabled")
+        logger.setLevel(logging.INFO)
+
+        class Exploding(object):
+            def __str__(self):
+                raise AssertionError("payload should not be formatted")
+
+        twikey.PayloadLogging(redact=False).log(logger, "Feed handling", Exploding())
+
+
+if __name__ == "__main__":
+    unittest.main()
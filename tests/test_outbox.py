@@ -0,0 +1,142 @@
+import os
+import tempfile
+import threading
+import unittest
+
+import requests
+
+import twikey
+from twikey.model.paylink_request import PaymentLinkRequest
+
+
+class _PaylinkService(object):
+    def __init__(self, failures):
+        self.failures = failures
+        self.payloads = []
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def create(self, request):
+        payload = request.to_request()
+        with self._lock:
+            if self.failures.get(payload["title"], 0) > 0:
+                self.failures[payload["title"]] -= 1
+                if payload["title"] == "unavailable":
+                    # html error page of a proxy in front of the api
+                    raise twikey.TwikeyError(
+                        "paylink.create", "https://api.twikey.com", "<html>", status=502
+                    )
+                raise twikey.TwikeyError(
+                    "paylink.create",
+                    "ConnectionError",
+                    requests.exceptions.ConnectionError(),
+                )
+            if payload["title"] == "invalid":
+                raise twikey.TwikeyError(
+                    "paylink.create", "err_invalid_amount", "Invalid amount"
+                )
+            if payload["title"] == "rejected":
+                self.rejected += 1
+                response = requests.Response()
+                response.status_code = 409
+                error = requests.exceptions.HTTPError(
+                    "409 Client Error", response=response
+                )
+                raise twikey.TwikeyError("paylink.create", "HTTPError", error)
+            if payload["title"] == "broken":
+                self.rejected += 1
+                raise ValueError("Unable to send")
+            self.payloads.append(payload)
+        return {"id": len(self.payloads)}
+
+
+class _Client(object):
+    def __init__(self, failures=None):
+        self.paylink = _PaylinkService(failures or {})
+
+
+class TestOutbox(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "outbox.db")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_send_with_retries(self):
+        client = _Client(failures={"retried": 2, "unavailable": 1})
+        done = []
+        outbox = twikey.Outbox(
+            client,
+            self.path,
+            workers=2,
+            backoff=0.01,
+            on_done=lambda *a: done.append(a),
+        )
+        outbox.enqueue_many(
+            "paylink.create",
+            [PaymentLinkRequest(title=f"link {i}", amount=i) for i in range(20)],
+        )
+        outbox.enqueue("paylink.create", PaymentLinkRequest(title="retried", amount=1))
+        outbox.enqueue(
+            "paylink.create", PaymentLinkRequest(title="unavailable", amount=1)
+        )
+        outbox.enqueue("paylink.create", PaymentLinkRequest(title="invalid", amount=-1))
+        outbox.start()
+        self.assertTrue(outbox.flush(timeout=10))
+        self.assertEqual({"done": 22, "failed": 1}, outbox.counts())
+        outbox.close()
+
+        self.assertEqual(22, len(client.paylink.payloads))
+        self.assertEqual(22, len(done))
+        self.assertEqual(0, client.paylink.failures["retried"])
+
+    def test_resume_after_crash(self):
+        outbox = twikey.Outbox(_Client(), self.path)
+        ids = outbox.enqueue_many(
+            "paylink.create",
+            [PaymentLinkRequest(title=f"link {i}", amount=i) for i in range(5)],
+        )
+        # simulate a crash while the first entry was being sent
+        outbox._claim(1)
+        self.assertEqual({"pending": 4, "sending": 1}, outbox.counts())
+        outbox._db.close()
+
+        client = _Client()
+        outbox = twikey.Outbox(client, self.path)
+        outbox.start()
+        self.assertTrue(outbox.flush(timeout=10))
+        self.assertEqual({"done": 5}, outbox.counts())
+        self.assertEqual(len(ids), len(client.paylink.payloads))
+        outbox.close()
+
+    def test_client_errors_are_not_retried(self):
+        client = _Client()
+        outbox = twikey.Outbox(client, self.path, backoff=0.01)
+        outbox.enqueue("paylink.create", PaymentLinkRequest(title="rejected", amount=1))
+        outbox.enqueue("paylink.create", PaymentLinkRequest(title="broken", amount=1))
+        outbox.start()
+        self.assertTrue(outbox.flush(timeout=10))
+        self.assertEqual({"failed": 2}, outbox.counts())
+        self.assertEqual(2, client.paylink.rejected)
+        outbox.close()
+
+    def test_failed_entries(self):
+        outbox = twikey.Outbox(_Client(), self.path)
+        with self.assertRaises(ValueError):
+            outbox.enqueue("paylink.remove", PaymentLinkRequest(title="x", amount=1))
+        outbox.enqueue("paylink.create", PaymentLinkRequest(title="invalid", amount=-1))
+        outbox.start()
+        self.assertTrue(outbox.flush(timeout=10))
+        failed = outbox.failed()
+        self.assertEqual(1, len(failed))
+        self.assertEqual("paylink.create", failed[0][1])
+        self.assertEqual("invalid", failed[0][2]["title"])
+        self.assertEqual(1, outbox.retry_failed())
+        self.assertTrue(outbox.flush(timeout=10))
+        self.assertEqual({"failed": 1}, outbox.counts())
+        outbox.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import threading
+import unittest
+
+import twikey
+
+
+class TestPool(unittest.TestCase):
+    def test_clients_share_session(self):
+        pool = twikey.TwikeyClientPool("https://test.beta.twikey.com/api/creditor")
+        first = pool.get("key1")
+        self.assertIs(first, pool.get("key1"))
+        self.assertIsNot(first, pool.get("key2"))
+        self.assertIs(first.session, pool.get("key2").session)
+        self.assertLess(first.token_lifetime, twikey.TwikeyClient.token_lifetime + 1)
+        self.assertEqual(2, len(pool))
+
+    def test_concurrency_limit(self):
+        pool = twikey.TwikeyClientPool(max_per_tenant=1)
+        with pool.client("key1"):
+            with self.assertRaises(twikey.TwikeyError):
+                with pool.client("key1", timeout=0.01):
+                    pass
+            # other merchants are not affected
+            with pool.client("key2", timeout=0.01):
+                pass
+
+    def test_waiting_callers_keep_the_tenant(self):
+        pool = twikey.TwikeyClientPool(max_per_tenant=1, idle_timeout=0)
+        with pool.client("key1") as client:
+            with self.assertRaises(twikey.TwikeyError):
+                with pool.client("key1", timeout=0.01):
+                    pass
+            pool.evict_idle()
+            self.assertIs(client, pool.get("key1"))
+        pool.evict_idle()
+        self.assertNotIn("key1", pool)
+
+    def test_evict_idle(self):
+        pool = twikey.TwikeyClientPool(idle_timeout=0)
+        pool.get("key1")
+        started, release = threading.Event(), threading.Event()
+
+        def busy():
+            with pool.client("key2"):
+                started.set()
+                release.wait()
+
+        worker = threading.Thread(target=busy, daemon=True)
+        worker.start()
+        try:
+            started.wait()
+            pool.evict_idle()
+            self.assertNotIn("key1", pool)
+            self.assertIn("key2", pool)
+        finally:
+            release.set()
+            worker.join()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import threading
+import time
+import unittest
+
+import twikey
+from twikey.scheduler import HIGH, NORMAL, BULK
+
+
+class TestScheduler(unittest.TestCase):
+    @staticmethod
+    def _queue(scheduler, prio, tenant, order):
+        """Start a thread waiting for a slot, returns once it is queued"""
+        waiting = scheduler.stats()[prio]["waiting"]
+
+        def run():
+            scheduler.acquire(prio, tenant)
+            order.append(tenant)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        while scheduler.stats()[prio]["waiting"] == waiting and thread.is_alive():
+            time.sleep(0.001)
+        return thread
+
+    def test_classify(self):
+        scheduler = twikey.RequestScheduler()
+        base = "https://api.twikey.com/creditor"
+        self.assertEqual(HIGH, scheduler.classify("POST", base + "/payment/link"))
+        self.assertEqual(BULK, scheduler.classify("GET", base + "/payment/link/feed"))
+        self.assertEqual(
+            BULK, scheduler.classify("GET", base + "/invoice?include=customer")
+        )
+        self.assertEqual(BULK, scheduler.classify("POST", base + "/invoice/bulk"))
+        self.assertEqual(NORMAL, scheduler.classify("POST", base + "/invoice"))
+        with twikey.TwikeyClient.priority("bulk"):
+            self.assertEqual(BULK, scheduler.classify("POST", base + "/invoice"))
+
+    def test_reserved_capacity_and_priorities(self):
+        scheduler = twikey.RequestScheduler(max_concurrent=2, reserved_high=1)
+        scheduler.acquire(BULK)
+        order = []
+        bulk = self._queue(scheduler, BULK, "bulk", order)
+        normal = self._queue(scheduler, NORMAL, "normal", order)
+        # the reserved slot is only for high priority
+        scheduler.acquire(HIGH)
+        self.assertEqual([], order)
+
+        scheduler.release(HIGH)
+        scheduler.release(BULK)
+        normal.join(timeout=5)
+        self.assertEqual(["normal"], order)
+        scheduler.release(NORMAL)
+        bulk.join(timeout=5)
+        self.assertEqual(["normal", "bulk"], order)
+        self.assertEqual(2, scheduler.stats()[BULK]["started"])
+
+    def test_tenants_take_turns(self):
+        scheduler = twikey.RequestScheduler(max_concurrent=2, reserved_high=1)
+        scheduler.acquire(NORMAL, "a")
+        order = []
+        threads = [
+            self._queue(scheduler, NORMAL, tenant, order)
+            for tenant in ("a", "a", "a", "b")
+        ]
+        for i in range(4):
+            scheduler.release(NORMAL)
+            while len(order) <= i:
+                time.sleep(0.001)
+        for thread in threads:
+            thread.join(timeout=5)
+        self.assertEqual(["a", "b", "a", "a"], order)
+
+    def test_deadline_while_queued(self):
+        scheduler = twikey.RequestScheduler(max_concurrent=2, reserved_high=1)
+        scheduler.acquire(NORMAL)
+        with twikey.TwikeyClient.deadline(0.05):
+            with self.assertRaises(twikey.TwikeyError) as ctx:
+                scheduler.acquire(NORMAL, "tenant")
+        self.assertEqual("DeadlineExceeded", ctx.exception.get_code())
+        self.assertEqual(0, scheduler.stats()[NORMAL]["waiting"])
+
+
+if __name__ == "__main__":
+    unittest.main()
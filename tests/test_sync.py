@@ -0,0 +1,179 @@
+import contextvars
+import threading
+import time
+import unittest
+from urllib.parse import urlsplit
+
+import twikey
+from tests import feed_response, offline_client
+from twikey.sync import RateLimiter
+
+
+class _FeedsSession(object):
+    """Serves the given pages per feed path, followed by empty ones"""
+
+    def __init__(self, feeds):
+        self.feeds = feeds
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def get(self, url, **kwargs):
+        path = urlsplit(url).path.split("/creditor", 1)[1]
+        with self._lock:
+            self.calls += 1
+            list_key, pages = self.feeds[path]
+            items = pages.pop(0) if pages else []
+        return feed_response(list_key, items, str(items[-1]["id"]) if items else "")
+
+
+class _Collect(object):
+    def __init__(self, handled, name):
+        self.handled = handled
+        self.name = name
+
+    def paylink(self, paylink):
+        self.handled.append((self.name, paylink.id))
+
+    def refund(self, refund):
+        self.handled.append((self.name, refund.id))
+
+    def transaction(self, transaction):
+        self.handled.append((self.name, transaction.id))
+
+
+class TestFeedOrchestrator(unittest.TestCase):
+    def test_feeds_run_concurrently_with_adaptive_intervals(self):
+        session = _FeedsSession(
+            {
+                "/payment/link/feed": ("Links", [[{"id": 1}, {"id": 2}], [{"id": 3}]]),
+                "/transfer": ("Entries", [[{"id": "R1"}]]),
+                "/transaction": ("Entries", []),
+            }
+        )
+        client = offline_client(session)
+        handled = []
+        checkpoints = {}
+        orchestrator = twikey.FeedOrchestrator(
+            client,
+            min_interval=1,
+            max_interval=8,
+            checkpoint=lambda name, position: checkpoints.update({name: position}),
+        )
+        orchestrator.add(
+            "paylink", client.paylink.feed_engine(), _Collect(handled, "paylink")
+        )
+        orchestrator.add(
+            "refund",
+            client.refund.feed_engine(),
+            _Collect(handled, "refund"),
+            start_position="R0",
+        )
+        orchestrator.add(
+            "transaction",
+            client.transaction.feed_engine(),
+            _Collect(handled, "transaction"),
+        )
+
+        stats = orchestrator.run_once()
+        self.assertEqual(
+            [("paylink", 1), ("paylink", 2), ("paylink", 3), ("refund", "R1")],
+            sorted(handled, key=str),
+        )
+        self.assertEqual({"paylink": "3", "refund": "R1"}, checkpoints)
+        self.assertEqual(3, stats["paylink"].last_items)
+        self.assertEqual(1, stats["paylink"].interval)
+        self.assertEqual(2, stats["transaction"].interval)
+        self.assertLess(stats["transaction"].lag, 5)
+
+        stats = orchestrator.run_once()
+        self.assertEqual(2, stats["paylink"].interval)
+        self.assertEqual(4, stats["transaction"].interval)
+        self.assertEqual(2, stats["refund"].runs)
+
+    def test_failing_feed_backs_off(self):
+        class _Failing(object):
+            def get(self, url, **kwargs):
+                raise twikey.TwikeyError("Feed", "err_unavailable", "Unavailable")
+
+        client = offline_client(_Failing())
+        orchestrator = twikey.FeedOrchestrator(client, min_interval=1)
+        orchestrator.add(
+            "paylink", client.paylink.feed_engine(), _Collect([], "paylink")
+        )
+        stats = orchestrator.run_once()["paylink"]
+        self.assertEqual(1, stats.errors)
+        self.assertEqual("err_unavailable", stats.last_error.get_code())
+        self.assertEqual(2, stats.interval)
+        self.assertIsNone(stats.lag)
+
+    def test_failing_feed_keeps_position(self):
+        class _Session(_FeedsSession):
+            def get(self, url, **kwargs):
+                if self.calls == 1:
+                    self.calls += 1
+                    raise twikey.TwikeyError("Feed", "err_unavailable", "Unavailable")
+                return super().get(url, **kwargs)
+
+        session = _Session(
+            {"/payment/link/feed": ("Links", [[{"id": 1}], [{"id": 2}]])}
+        )
+        client = offline_client(session)
+        checkpoints = []
+        orchestrator = twikey.FeedOrchestrator(
+            client, checkpoint=lambda name, position: checkpoints.append(position)
+        )
+        orchestrator.add(
+            "paylink", client.paylink.feed_engine(), _Collect([], "paylink")
+        )
+        stats = orchestrator.run_once()["paylink"]
+        # the page handled before the error is checkpointed and isn't read again
+        self.assertEqual(1, stats.errors)
+        self.assertEqual(1, stats.items)
+        self.assertEqual("1", stats.position)
+        self.assertEqual(["1"], checkpoints)
+
+    def test_wake_during_run_and_context(self):
+        orchestrator = None
+
+        class _Session(_FeedsSession):
+            def get(self, url, **kwargs):
+                response = super().get(url, **kwargs)
+                if self.calls == 2:
+                    # a webhook arriving while the end of the feed is being read
+                    self.feeds["/payment/link/feed"][1].append([{"id": 2}])
+                    orchestrator.wake("paylink")
+                return response
+
+        client = offline_client(
+            _Session({"/payment/link/feed": ("Links", [[{"id": 1}]])})
+        )
+        orchestrator = twikey.FeedOrchestrator(client, min_interval=60, max_interval=60)
+        tenant = contextvars.ContextVar("tenant", default=None)
+        handled = []
+        done = threading.Event()
+
+        class _Links(object):
+            def paylink(self, paylink):
+                handled.append((paylink.id, tenant.get()))
+                if paylink.id == 2:
+                    done.set()
+
+        orchestrator.add("paylink", client.paylink.feed_engine(), _Links())
+        tenant.set("merchant1")
+        orchestrator.start()
+        try:
+            self.assertTrue(done.wait(5))
+        finally:
+            orchestrator.stop()
+        self.assertEqual([(1, "merchant1"), (2, "merchant1")], handled)
+
+    def test_rate_limiter(self):
+        limiter = RateLimiter(rate=100, burst=2)
+        start = time.monotonic()
+        for _ in range(7):
+            limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.04)
+
+
+if __name__ == "__main__":
+    unittest.main()
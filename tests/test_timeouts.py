@@ -0,0 +1,55 @@
+import time
+import unittest
+
+import twikey
+from tests import FakeResponse, offline_client
+from twikey.model.paylink_request import PaymentLinkStatusRequest
+
+
+class _Session(object):
+    def __init__(self):
+        self.timeouts = []
+
+    def get(self, url, **kwargs):
+        self.timeouts.append(kwargs["timeout"])
+        return FakeResponse({"Links": [{"id": 1, "state": "paid"}]})
+
+
+class TestTimeouts(unittest.TestCase):
+
+    def test_endpoint_timeouts(self):
+        timeouts = twikey.Timeouts(connect=3, read=10, endpoints={"invoice": 20, "invoice.create": (1, 2)})
+        self.assertEqual((1, 2), timeouts.get("invoice.create"))
+        self.assertEqual((3, 20), timeouts.get("invoice.feed"))
+        self.assertEqual((3, 10), timeouts.get("paylink.create"))
+        self.assertEqual((60, 60), timeouts.get("transaction.batch_send"))
+
+    def test_configured_timeouts_beat_the_defaults(self):
+        timeouts = twikey.Timeouts(endpoints={"transaction": 5, "invoice.bulk_create": [2, 3]})
+        self.assertEqual((15, 5), timeouts.get("transaction.batch_send"))
+        self.assertEqual((2, 3), timeouts.get("invoice.bulk_create"))
+        self.assertEqual((15, 15), timeouts.get("invoice.create"))
+
+    def test_deadline_caps_and_fails_fast(self):
+        session = _Session()
+        client = offline_client(session)
+
+        client.paylink.status_details(PaymentLinkStatusRequest(id=1))
+        self.assertEqual((15, 15), session.timeouts[-1])
+
+        with client.deadline(2):
+            client.paylink.status_details(PaymentLinkStatusRequest(id=1))
+            connect, read = session.timeouts[-1]
+            self.assertLessEqual(connect, 2)
+            self.assertLessEqual(read, 2)
+
+        with client.deadline(0.01):
+            time.sleep(0.02)
+            with self.assertRaises(twikey.TwikeyError) as ctx:
+                client.paylink.status_details(PaymentLinkStatusRequest(id=1))
+            self.assertEqual("DeadlineExceeded", ctx.exception.get_code())
+        self.assertEqual(2, len(session.timeouts))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+
+import twikey
+from tests import feed_response, offline_client
+from twikey.timestamps import parse_timestamp
+
+
+class _TransactionSession(object):
+    def __init__(self, items):
+        self.pages = [items]
+
+    def get(self, url, **kwargs):
+        items = self.pages.pop(0) if self.pages else []
+        return feed_response("Entries", items, "1" if items else "")
+
+
+class _Transactions(twikey.TransactionFeed):
+    def __init__(self):
+        self.transactions = []
+
+    def transaction(self, transaction):
+        self.transactions.append(transaction)
+
+
+class TestTimestamps(unittest.TestCase):
+
+    def test_parse(self):
+        self.assertEqual(datetime(2024, 3, 1, 10, 11, 12, tzinfo=timezone.utc), parse_timestamp("2024-03-01T10:11:12Z"))
+        self.assertEqual(
+            datetime(2024, 3, 1, 10, 11, 12, 120000, tzinfo=timezone(timedelta(hours=1))),
+            parse_timestamp("2024-03-01T10:11:12.12+01:00"),
+        )
+        self.assertEqual(datetime(2024, 3, 1), parse_timestamp("2024-03-01"))
+        self.assertIsNone(parse_timestamp(None))
+        self.assertIsNone(parse_timestamp(""))
+        self.assertIs(parse_timestamp("2024-03-01T10:11:12Z"), parse_timestamp("2024-03-01T10:11:12Z"))
+        with self.assertLogs("twikey.timestamps", "WARNING"):
+            self.assertEqual("yesterday", parse_timestamp("yesterday"))
+
+    def _transactions(self, **options):
+        session = _TransactionSession([{"id": 1, "bkdate": "2024-03-01T00:00:00Z", "lastupdate": "2024-03-02T10:00:00Z"}])
+        client = offline_client(session, **options)
+        feed = _Transactions()
+        client.transaction.feed(feed)
+        return feed.transactions
+
+    def test_feed_items_are_parsed(self):
+        transaction = self._transactions(parse_timestamps=True)[0]
+        self.assertEqual(datetime(2024, 3, 1, tzinfo=timezone.utc), transaction.bkdate)
+        self.assertEqual(datetime(2024, 3, 2, 10, tzinfo=timezone.utc), transaction.lastupdate)
+
+    def test_raw_timestamps_by_default(self):
+        transaction = self._transactions()[0]
+        self.assertEqual("2024-03-01T00:00:00Z", transaction.bkdate)
+        self.assertEqual("2024-03-02T10:00:00Z", transaction.lastupdate)
+
+    def test_mandate_events_are_parsed(self):
+        class _Session(object):
+            def get(self, url, **kwargs):
+                return feed_response("Messages", [{"Mndt": {"MndtId": "MNDT1"}, "EvtTime": "2024-03-01T10:00:00Z"}], "")
+
+        times = []
+
+        class _Documents(twikey.DocumentFeed):
+            def new_document(self, doc, evt_time):
+                times.append(evt_time)
+                return True
+
+        for parse_timestamps in (False, True):
+            offline_client(_Session(), parse_timestamps=parse_timestamps).document.feed(_Documents())
+        self.assertEqual([datetime(2024, 3, 1, 10, tzinfo=timezone.utc)] * 2, times)
+
+
+if __name__ == "__main__":
+    unittest.main()
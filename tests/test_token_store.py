@@ -0,0 +1,46 @@
+import os
+import tempfile
+import time
+import unittest
+
+import twikey
+from twikey.token_store import StoredToken
+
+
+class TestTokenStore(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+    def _stores(self):
+        return [
+            twikey.FileTokenStore(os.path.join(self.dir.name, "tokens.json")),
+            twikey.SqliteTokenStore(os.path.join(self.dir.name, "tokens.db")),
+        ]
+
+    def test_roundtrip(self):
+        for store in self._stores():
+            key = store.key("apikey", "https://api.twikey.com/creditor")
+            self.assertNotIn("apikey", key)
+            self.assertIsNone(store.get(key))
+            with store.lock(key):
+                store.put(key, StoredToken("token", "123"))
+                self.assertEqual("token", store.get(key).token)
+            self.assertEqual("123", store.get(key).merchant_id)
+            store.delete(key)
+            self.assertIsNone(store.get(key))
+
+    def test_client_reuses_stored_token(self):
+        for store in self._stores():
+            base_url = "https://test.beta.twikey.com/api/creditor"
+            store.put(store.key("apikey", base_url), StoredToken("stored-token", "123", time.time() - 60))
+            client = twikey.TwikeyClient("apikey", base_url, token_store=store)
+            # no login is done as the stored token is still valid
+            client.refresh_token_if_required()
+            self.assertEqual("stored-token", client.headers()["Authorization"])
+            self.assertFalse(client.token_expired())
+
+
+if __name__ == "__main__":
+    unittest.main()
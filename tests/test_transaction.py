@@ -121,6 +121,27 @@ class TestTransaction(unittest.TestCase):
         )
         self.assertIsNotNone(mandates)
 
+    def test_iter_query(self):
+        tx = self._twikey.transaction.create(
+            NewTransactionRequest(
+                mndt_id=self.mndt_id,
+                message="Test Message",
+                ref="Merchant Reference",
+                amount=50.00,
+                place="Here",
+            )
+        )
+        checkpoints = []
+        ids = [t.id for t in self._twikey.transaction.iter_query(
+            QueryTransactionsRequest(from_id=(tx.id - 2)),
+            checkpoint=checkpoints.append,
+            mandates=[self.mndt_id],
+        )]
+        self.assertIn(tx.id, ids)
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertTrue(checkpoints)
+        self.assertEqual(self.mndt_id, checkpoints[-1].mndt_id)
+
     def test_remove(self):
         tx = self._twikey.transaction.create(
             NewTransactionRequest(
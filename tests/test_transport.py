@@ -0,0 +1,62 @@
+import unittest
+
+import twikey
+from twikey.model.invoice_request import DetailsRequest
+
+try:
+    import httpx
+    from twikey.transport import Http2Session
+except ImportError:
+    httpx = None
+
+BASE_URL = "https://test.beta.twikey.com/api/creditor"
+
+
+@unittest.skipIf(httpx is None, "httpx not installed")
+class TestHttp2Transport(unittest.TestCase):
+    def client(self, handler):
+        def dispatch(request):
+            if request.method == "POST" and str(request.url) == BASE_URL:
+                return httpx.Response(
+                    200, headers={"Authorization": "token", "X-MERCHANT-ID": "1"}
+                )
+            return handler(request)
+
+        session = Http2Session(transport=httpx.MockTransport(dispatch))
+        return twikey.TwikeyClient("apikey", BASE_URL, session=session)
+
+    def test_details(self):
+        def handler(request):
+            self.assertEqual("token", request.headers["Authorization"])
+            self.assertEqual("include=meta", request.url.query.decode())
+            return httpx.Response(
+                200, json={"id": "42", "number": "Inv-1", "state": "PAID"}
+            )
+
+        invoice = self.client(handler).invoice.details(
+            DetailsRequest(id="42", include_meta=True)
+        )
+        self.assertEqual("Inv-1", invoice.number)
+
+    def test_error_mapping(self):
+        def api_error(request):
+            return httpx.Response(
+                400,
+                headers={"ApiErrorCode": "err_not_found"},
+                json={"code": "err_not_found", "message": "Not found"},
+            )
+
+        with self.assertRaises(twikey.TwikeyError) as ctx:
+            self.client(api_error).invoice.details(DetailsRequest(id="42"))
+        self.assertEqual("err_not_found", ctx.exception.get_code())
+
+        def timeout(request):
+            raise httpx.ConnectTimeout("timed out", request=request)
+
+        with self.assertRaises(twikey.TwikeyError) as ctx:
+            self.client(timeout).invoice.details(DetailsRequest(id="42"))
+        self.assertEqual("Timeout", ctx.exception.get_code())
+
+
+if __name__ == "__main__":
+    unittest.main()
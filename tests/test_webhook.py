@@ -0,0 +1,111 @@
+import subprocess
+import sys
+import time
+import unittest
+
+import twikey
+from twikey.webhook import InvoiceEvent, SeenSet, parse_event
+
+
+class TestWebhook(unittest.TestCase):
+    payload = "msg=dummytest&type=event"
+
+    def test_verify_signature(self):
+        signature = twikey.WebhookVerifier("1234").sign(self.payload)
+        self.assertTrue(twikey.Webhook.verify_signature(self.payload, signature, "1234"))
+        self.assertFalse(twikey.Webhook.verify_signature(self.payload, signature, "5678"))
+        self.assertFalse(twikey.Webhook.verify_signature(self.payload, None, "1234"))
+
+    def test_verify_bytes_and_batches(self):
+        verifier = twikey.WebhookVerifier("1234")
+        signature = verifier.sign(self.payload)
+        self.assertEqual(signature, verifier.sign(self.payload.encode()))
+        self.assertEqual(
+            [True, False, False],
+            verifier.verify_batch([
+                (self.payload.encode(), signature),
+                ("msg=other&type=event", signature),
+                (self.payload, ""),
+            ]),
+        )
+
+    def test_key_rotation(self):
+        old_signature = twikey.WebhookVerifier("old").sign(self.payload)
+        new_signature = twikey.WebhookVerifier("new").sign(self.payload)
+        verifier = twikey.WebhookVerifier("new", "old")
+        self.assertTrue(verifier.verify(self.payload, old_signature))
+        self.assertTrue(verifier.verify(self.payload, new_signature))
+        verifier.remove_key("old")
+        self.assertFalse(verifier.verify(self.payload, old_signature))
+        self.assertTrue(verifier.verify(self.payload, new_signature))
+
+    def test_parse_event(self):
+        event = parse_event(b"type=invoice&id=42&number=Inv-1&state=PAID")
+        self.assertIsInstance(event, InvoiceEvent)
+        self.assertEqual("Inv-1", event.number)
+        self.assertEqual("PAID", event.state)
+        self.assertEqual("dummytest", parse_event(self.payload).get("msg"))
+        # values are unquoted once, a quoted '&' or '=' remains part of the value
+        event = parse_event("type=event&msg=50%2541%20off%26more%3D")
+        self.assertEqual("50%41 off&more=", event.get("msg"))
+        self.assertEqual("", parse_event("type=event&msg=").get("msg"))
+
+    def test_event_key(self):
+        self.assertEqual("eventId=E1", parse_event("type=contract&mndtId=MNDT1&eventId=E1").key)
+        # without an event id, the timestamp tells later updates apart from redeliveries
+        first = parse_event("type=contract&mndtId=MNDT1&timestamp=1700000000")
+        second = parse_event("type=contract&mndtId=MNDT1&timestamp=1700000060")
+        self.assertNotEqual(first.key, second.key)
+        self.assertEqual("mndtId=MNDT1&type=contract", parse_event("type=contract&mndtId=MNDT1").key)
+
+    def test_dispatch_deduplicates(self):
+        verifier = twikey.WebhookVerifier("1234")
+        dispatcher = twikey.WebhookDispatcher(verifier, seen=SeenSet(max_size=10))
+        self.addCleanup(dispatcher.shutdown)
+        received = []
+        dispatcher.on("event", received.append)
+
+        payload = "type=event&msg=50%25%20off"
+        signature = verifier.sign("type=event&msg=50% off")
+        self.assertIsNone(dispatcher.dispatch(payload, "invalid"))
+        dispatcher.dispatch(payload.encode(), signature).result()
+        self.assertFalse(dispatcher.dispatch(payload, signature))
+        self.assertEqual(1, len(received))
+        self.assertEqual("event", received[0].type)
+        self.assertEqual("50% off", received[0].get("msg"))
+
+    def test_seen_keys_expire(self):
+        seen = SeenSet(ttl=0.05)
+        self.assertTrue(seen.add("type=contract&mndtId=MNDT1"))
+        self.assertFalse(seen.add("type=contract&mndtId=MNDT1"))
+        time.sleep(0.1)
+        # a later update of the same mandate is not taken for a redelivery
+        self.assertTrue(seen.add("type=contract&mndtId=MNDT1"))
+        self.assertEqual(300, SeenSet().ttl)
+
+    def test_failed_handler_allows_redelivery(self):
+        dispatcher = twikey.WebhookDispatcher()
+        self.addCleanup(dispatcher.shutdown)
+        calls = []
+
+        @dispatcher.on("*")
+        def failing(event):
+            calls.append(event)
+            raise ValueError("ERP unavailable")
+
+        with self.assertRaises(ValueError):
+            dispatcher.dispatch(self.payload).result()
+        with self.assertRaises(ValueError):
+            dispatcher.dispatch(self.payload).result()
+        self.assertEqual(2, len(calls))
+
+    def test_verification_does_not_load_the_client(self):
+        script = (
+            "import sys, twikey; twikey.Webhook.verify_signature('a', 'b', 'c'); "
+            "assert 'requests' not in sys.modules and 'twikey.client' not in sys.modules"
+        )
+        subprocess.run([sys.executable, "-c", script], check=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
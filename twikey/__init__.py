@@ -1,20 +1,108 @@
-from .webhook import Webhook
-from .client import TwikeyClient, TwikeyError
-from .model.document_response import Document
-from .model.document_request import InviteRequest, SignRequest
-from .document import DocumentFeed
-from .model.transaction_response import Transaction
-from .model.transaction_response import TransactionFeed
-from .paylink import PaylinkFeed
-from .model.invoice_response import InvoiceFeed, PaymentFeed
-from .refund import RefundFeed
+import importlib
+from typing import TYPE_CHECKING
+
+# Attributes are only imported on first access, so eg. verifying a webhook
+# doesn't load the http stack nor the services that aren't used.
+_exports = {
+    "TwikeyClient": ".client",
+    "TwikeyError": ".client",
+    "TwikeyClientPool": ".pool",
+    "PayloadLogging": ".log",
+    "HedgingPolicy": ".hedging",
+    "CircuitBreakerPolicy": ".breaker",
+    "Timeouts": ".timeouts",
+    "RequestScheduler": ".scheduler",
+    "Outbox": ".outbox",
+    "UpdateBuffer": ".coalesce",
+    "DeadLetterStore": ".dead_letter",
+    "FileDeadLetterStore": ".dead_letter",
+    "SqliteDeadLetterStore": ".dead_letter",
+    "TokenStore": ".token_store",
+    "FileTokenStore": ".token_store",
+    "SqliteTokenStore": ".token_store",
+    "FeedOrchestrator": ".sync",
+    "Webhook": ".webhook",
+    "WebhookVerifier": ".webhook",
+    "WebhookDispatcher": ".webhook",
+    "WebhookEvent": ".webhook",
+    "BatchFeed": ".feed",
+    "FeedRecorder": ".feed",
+    "PageQueue": ".feed",
+    "Document": ".model.document_response",
+    "DocumentFeed": ".model.document_response",
+    "InviteRequest": ".model.document_request",
+    "SignRequest": ".model.document_request",
+    "Transaction": ".model.transaction_response",
+    "TransactionFeed": ".model.transaction_response",
+    "PaylinkFeed": ".model.paylink_response",
+    "InvoiceFeed": ".model.invoice_response",
+    "PaymentFeed": ".model.invoice_response",
+    "RefundFeed": ".model.refund_response",
+}
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .webhook import Webhook, WebhookVerifier, WebhookDispatcher, WebhookEvent
+    from .client import TwikeyClient, TwikeyError
+    from .pool import TwikeyClientPool
+    from .log import PayloadLogging
+    from .hedging import HedgingPolicy
+    from .breaker import CircuitBreakerPolicy
+    from .timeouts import Timeouts
+    from .scheduler import RequestScheduler
+    from .outbox import Outbox
+    from .coalesce import UpdateBuffer
+    from .sync import FeedOrchestrator
+    from .dead_letter import DeadLetterStore, FileDeadLetterStore, SqliteDeadLetterStore
+    from .token_store import TokenStore, FileTokenStore, SqliteTokenStore
+    from .feed import BatchFeed, FeedRecorder, PageQueue
+    from .model.document_response import Document, DocumentFeed
+    from .model.document_request import InviteRequest, SignRequest
+    from .model.transaction_response import Transaction, TransactionFeed
+    from .model.paylink_response import PaylinkFeed
+    from .model.invoice_response import InvoiceFeed, PaymentFeed
+    from .model.refund_response import RefundFeed
+
+
+def __getattr__(name):
+    module = _exports.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_exports))
+
 
 __all__ = [
     "TwikeyClient",
+    "TwikeyClientPool",
+    "PayloadLogging",
+    "HedgingPolicy",
+    "CircuitBreakerPolicy",
+    "Timeouts",
+    "RequestScheduler",
+    "Outbox",
+    "UpdateBuffer",
+    "DeadLetterStore",
+    "FileDeadLetterStore",
+    "SqliteDeadLetterStore",
+    "TokenStore",
+    "FileTokenStore",
+    "SqliteTokenStore",
+    "FeedOrchestrator",
     "Webhook",
+    "WebhookVerifier",
+    "WebhookDispatcher",
+    "WebhookEvent",
 
     "Document",
     "DocumentFeed",
+    "BatchFeed",
+    "FeedRecorder",
+    "PageQueue",
     "InviteRequest",
     "SignRequest",
 
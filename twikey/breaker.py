@@ -0,0 +1,258 @@
+import collections
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+
+from .client import TwikeyError
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+# endpoint family per first segment of the url path
+_FAMILIES = {
+    "invoice": "invoice",
+    "mandate": "mandate",
+    "invite": "mandate",
+    "sign": "mandate",
+    "customer": "mandate",
+    "customeraccess": "mandate",
+    "transaction": "transaction",
+    "collect": "transaction",
+    "reporting": "transaction",
+    "payment": "paylink",
+    "transfer": "transfer",
+    "transfers": "transfer",
+}
+
+
+def endpoint_family(url: str, api_base: str = "") -> str:
+    """
+    :return: the family (invoice, mandate, transaction, paylink or transfer) of the endpoint, None for the login
+    """
+    path = urlsplit(url).path
+    base_path = urlsplit(api_base).path.rstrip("/")
+    if base_path and path.startswith(base_path):
+        path = path[len(base_path) :]
+    segment = path.strip("/").split("/", 1)[0]
+    return _FAMILIES.get(segment)
+
+
+class CircuitBreakerPolicy(object):
+    """
+    Attributes:
+        failure_rate (float): fraction of failed calls in the window opening the circuit
+        window (int): number of most recent calls the failure rate is computed on
+        min_calls (int): minimum number of calls in the window before the circuit can open
+        open_seconds (float): time the circuit stays open before letting probes through
+        half_open_probes (int): number of concurrent probes allowed while half-open
+    """
+
+    __slots__ = [
+        "failure_rate",
+        "window",
+        "min_calls",
+        "open_seconds",
+        "half_open_probes",
+    ]
+
+    def __init__(
+        self,
+        failure_rate=0.5,
+        window=20,
+        min_calls=10,
+        open_seconds=30,
+        half_open_probes=1,
+    ) -> None:
+        self.failure_rate = failure_rate
+        self.window = window
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+
+
+class _Permit(object):
+    """
+    Admission of a call by a CircuitBreaker, to be passed to record() once the call finished
+    """
+
+    __slots__ = ["generation", "probe"]
+
+    def __init__(self, generation, probe) -> None:
+        self.generation = generation
+        self.probe = probe
+
+
+class CircuitBreaker(object):
+    """
+    Circuit breaker of a single endpoint family.
+
+    Closed: calls pass and their outcome is recorded. Once the failure rate over the window reaches the
+    threshold the circuit opens and calls fail fast. After open_seconds it becomes half-open: a limited number
+    of probes pass, a successful probe closes the circuit and a failed one opens it again. Outcomes of calls
+    admitted before the last change of state are ignored.
+    """
+
+    def __init__(self, name, policy: CircuitBreakerPolicy) -> None:
+        self.name = name
+        self.policy = policy
+        self.state = CLOSED
+        self.rejected = 0
+        self.opened = 0
+        self._outcomes = collections.deque(maxlen=policy.window)
+        self._opened_at = 0.0
+        self._probes = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        :return: a permit to pass to record() once the call finished, None when the call is rejected
+        """
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.policy.open_seconds:
+                    self.rejected += 1
+                    return None
+                self._change(HALF_OPEN)
+                self._probes = 0
+            if self.state == HALF_OPEN:
+                if self._probes >= self.policy.half_open_probes:
+                    self.rejected += 1
+                    return None
+                self._probes += 1
+                return _Permit(self._generation, True)
+            return _Permit(self._generation, False)
+
+    def record(self, permit: _Permit, success):
+        """
+        :param permit: the permit returned by allow()
+        :param success: whether the call succeeded, None when it failed for a reason unrelated to Twikey
+        """
+        with self._lock:
+            if permit.generation != self._generation:
+                return
+            if permit.probe:
+                self._probes -= 1
+                if success:
+                    self._change(CLOSED)
+                    self._outcomes.clear()
+                elif success is not None:
+                    self._open()
+                return
+            if success is None:
+                return
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if len(
+                self._outcomes
+            ) >= self.policy.min_calls and failures >= self.policy.failure_rate * len(
+                self._outcomes
+            ):
+                self._open()
+
+    def retry_after(self) -> float:
+        return max(0.0, self.policy.open_seconds - (time.monotonic() - self._opened_at))
+
+    def failure_rate(self) -> float:
+        with self._lock:
+            if not self._outcomes:
+                return 0.0
+            return self._outcomes.count(False) / len(self._outcomes)
+
+    def _open(self):
+        self._change(OPEN)
+        self.opened += 1
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+
+    def _change(self, state):
+        self.state = state
+        self._generation += 1
+
+
+class CircuitBreakerSession(object):
+    """
+    Wraps the session of a TwikeyClient with a circuit breaker per endpoint family. Connection errors,
+    timeouts and 5xx responses count as failures, while the circuit of a family is open its calls
+    immediately raise a TwikeyError with error code 'CircuitOpen'.
+    """
+
+    def __init__(self, session, policy: CircuitBreakerPolicy, api_base="") -> None:
+        self.session = session
+        self.policy = policy
+        self.api_base = api_base
+        self.breakers = {}
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+
+    def breaker(self, family) -> CircuitBreaker:
+        with self._lock:
+            breaker = self.breakers.get(family)
+            if breaker is None:
+                breaker = self.breakers[family] = CircuitBreaker(family, self.policy)
+            return breaker
+
+    def stats(self) -> dict:
+        """
+        :return: per endpoint family its state, failure rate, number of rejected calls and times opened
+        """
+        return {
+            family: {
+                "state": breaker.state,
+                "failure_rate": breaker.failure_rate(),
+                "rejected": breaker.rejected,
+                "opened": breaker.opened,
+            }
+            for family, breaker in list(self.breakers.items())
+        }
+
+    def request(self, method, url, **kwargs):
+        family = endpoint_family(url, self.api_base)
+        send = getattr(self.session, method.lower())
+        if family is None:
+            return send(url, **kwargs)
+        breaker = self.breaker(family)
+        permit = breaker.allow()
+        if permit is None:
+            raise TwikeyError(
+                ctx=family,
+                error_code="CircuitOpen",
+                error="Too many failures, retry after %.0f sec" % breaker.retry_after(),
+            )
+        success = None
+        try:
+            response = send(url, **kwargs)
+            success = response.status_code < 500
+            return response
+        except requests.exceptions.RequestException:
+            success = False
+            raise
+        finally:
+            breaker.record(permit, success)
+            self._log_state(breaker)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request("PATCH", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+    def _log_state(self, breaker):
+        if breaker.state != CLOSED:
+            self.logger.warning("Circuit for %s is %s", breaker.name, breaker.state)
@@ -1,14 +1,35 @@
 import datetime
+import importlib
 import json
 import logging
+import threading
 
 import requests
 
-from .document import DocumentService
-from .invoice import InvoiceService
-from .transaction import TransactionService
-from .paylink import PaylinkService
-from .refund import RefundService
+from .coalesce import SingleFlight
+from .log import PayloadLogging
+from . import timeouts as _timeouts
+from .timestamps import parse_timestamp, raw_timestamp
+
+
+class _Service(object):
+    """
+    Creates the service on first access, so only the services in use (and their models) get imported
+    """
+
+    def __init__(self, module, name):
+        self.module = module
+        self.name = name
+
+    def __set_name__(self, owner, attr):
+        self.attr = attr
+
+    def __get__(self, client, owner=None):
+        if client is None:
+            return self
+        service_class = getattr(importlib.import_module(self.module, __package__), self.name)
+        service = client.__dict__[self.attr] = service_class(client)
+        return service
 
 
 class TwikeyClient(object):
@@ -19,12 +40,13 @@ class TwikeyClient(object):
     private_key = None
     vendorPrefix = b"own"
     api_base = "https://api.twikey.com"
+    token_lifetime = 23 * 3600  # seconds before logging in again
 
-    document = None
-    transaction = None
-    paylink = None
-    invoice = None
-    refund = None
+    document = _Service(".document", "DocumentService")
+    transaction = _Service(".transaction", "TransactionService")
+    paylink = _Service(".paylink", "PaylinkService")
+    invoice = _Service(".invoice", "InvoiceService")
+    refund = _Service(".refund", "RefundService")
 
     def __init__(
         self,
@@ -32,17 +54,73 @@ class TwikeyClient(object):
         base_url="https://api.twikey.com/creditor",
         user_agent="twikey-python/v0.1.0",
         private_key=None,
+        session=None,
+        token_store=None,
+        payload_logging=None,
+        http2=False,
+        coalesce_reads=False,
+        hedging=None,
+        circuit_breaker=None,
+        timeouts=None,
+        scheduler=None,
+        feed_recorder=None,
+        dead_letters=None,
+        parse_timestamps=False,
     ) -> None:
+        """
+        :param session: Optional requests.Session to send the requests with, allows sharing
+                        the connection pool between several clients (see TwikeyClientPool)
+        :param token_store: Optional TokenStore allowing tokens to be reused across processes and restarts
+        :param payload_logging: Optional PayloadLogging configuring sampling, truncation and redaction
+                                of the payloads logged on debug level
+        :param http2: Send the requests over HTTP/2 (requires httpx[http2]), ignored when a session is given
+        :param coalesce_reads: Let concurrent identical reads (eg. fetching the same mandate or invoice) share
+                               a single call, all callers then receive the same response object
+        :param hedging: Optional HedgingPolicy, sending a second request for slow idempotent reads
+        :param circuit_breaker: Optional CircuitBreakerPolicy, failing fast per endpoint family
+                                (invoice, mandate, transaction, paylink, transfer) while the api is failing
+        :param timeouts: Optional Timeouts with the connect and read timeouts per endpoint
+        :param scheduler: Optional RequestScheduler, possibly shared with the clients of other merchants,
+                          giving interactive calls precedence over bulk calls
+        :param feed_recorder: Optional FeedRecorder storing every page read from the feeds for an offline replay
+        :param dead_letters: Optional DeadLetterStore keeping the feed items that failed to be handled,
+                             instead of stopping the feed
+        :param parse_timestamps: Parse the timestamps of the transactions, paylinks and payment events into
+                                 datetimes instead of keeping the strings returned by Twikey
+        """
         self.user_agent = user_agent
         self.api_key = api_key
         self.private_key = private_key
         self.api_base = base_url
         self.merchant_id = 0
-        self.document = DocumentService(self)
-        self.invoice = InvoiceService(self)
-        self.transaction = TransactionService(self)
-        self.paylink = PaylinkService(self)
-        self.refund = RefundService(self)
+        if session is None:
+            if http2:
+                from .transport import Http2Session
+
+                session = Http2Session()
+            else:
+                session = requests.Session()
+        if circuit_breaker is not None:
+            from .breaker import CircuitBreakerSession
+
+            session = CircuitBreakerSession(session, circuit_breaker, base_url)
+        if hedging is not None:
+            from .hedging import HedgedSession
+
+            session = HedgedSession(session, hedging)
+        if scheduler is not None:
+            from .scheduler import ScheduledSession
+
+            session = ScheduledSession(session, scheduler, tenant=api_key)
+        self.session = session
+        self.token_store = token_store
+        self.payload_logging = payload_logging or PayloadLogging()
+        self.timeouts = timeouts or _timeouts.Timeouts()
+        self.single_flight = SingleFlight() if coalesce_reads else None
+        self.feed_recorder = feed_recorder
+        self.dead_letters = dead_letters
+        self.parse_timestamp = parse_timestamp if parse_timestamps else raw_timestamp
+        self._login_lock = threading.Lock()
         self.logger = logging.getLogger(__name__)
 
     def instance_url(self, url=""):
@@ -78,11 +156,7 @@ class TwikeyClient(object):
 
     def refresh_token_if_required(self):
         if self.lastLogin:
-            self.logger.debug(
-                "Last authenticated with {} with {}".format(
-                    self.lastLogin, self.api_token
-                )
-            )
+            self.logger.debug("Last authenticated with %s with %s", self.lastLogin, self.api_token)
 
         if not self.api_base:
             raise TwikeyError(
@@ -98,53 +172,129 @@ class TwikeyClient(object):
                 error="No key defined - %s" % self.api_base,
             )
 
-        now = datetime.datetime.now()
-        if self.lastLogin is None or (now - self.lastLogin).seconds > 23 * 3600:
-            payload = {"apiToken": self.api_key}
-            if self.private_key:
-                payload["otp"] = self.get_totp(self.vendorPrefix, self.private_key)
+        if self.token_expired():
+            with self._login_lock:
+                # another thread might have logged in while we were waiting
+                if self.token_expired():
+                    if self.token_store:
+                        self._login_using_store()
+                    else:
+                        self._login()
+        else:
+            self.logger.debug("Reusing token %s valid till %s", self.api_token, self.lastLogin)
+
+    def token_expired(self) -> bool:
+        if self.lastLogin is None:
+            return True
+        return (datetime.datetime.now() - self.lastLogin).total_seconds() > self.token_lifetime
 
-            self.logger.debug(
-                "Authenticating with {} using {}...".format(
-                    self.api_base, self.api_key[0:10]
-                )
-            )
-            response = requests.post(
-                self.instance_url(),
-                data=payload,
-                headers={"User-Agent": self.user_agent},
-                timeout=15,
+    def _login_using_store(self):
+        from .token_store import StoredToken
+
+        key = self.token_store.key(self.api_key, self.api_base)
+        with self.token_store.lock(key):
+            stored = self.token_store.get(key)
+            if stored and stored.age() < self.token_lifetime:
+                self.logger.debug("Reusing stored token for %s", self.api_base)
+                self.api_token = stored.token
+                self.merchant_id = stored.merchant_id
+                self.lastLogin = datetime.datetime.fromtimestamp(stored.created)
+                return
+            self._login()
+            self.token_store.put(
+                key, StoredToken(self.api_token, self.merchant_id, self.lastLogin.timestamp())
             )
 
-            if "ApiErrorCode" in response.headers:
-                error_json = response.json()
-                self.logger.error(error_json)
-                error_code = response.headers["ApiErrorCode"]
-                error_json_message = "Error authenticating : %s" % error_json["message"]
-                raise TwikeyError(
-                    ctx="Config", error_code=error_code, error=error_json_message
-                )
+    def _login(self):
+        payload = {"apiToken": self.api_key}
+        if self.private_key:
+            payload["otp"] = self.get_totp(self.vendorPrefix, self.private_key)
 
-            if "X-Rate-Limit-Retry-After-Seconds" in response.headers:
-                retry_after_seconds = response.headers[
-                    "X-Rate-Limit-Retry-After-Seconds"
-                ]
-                error_message = f"Too many login's, please try again after #{retry_after_seconds} sec."
-                raise TwikeyError(
-                    ctx="Config", error_code="Rate limit", error=error_message
-                )
+        self.logger.debug("Authenticating with %s using %s...", self.api_base, self.api_key[0:10])
+        response = self.session.post(
+            self.instance_url(),
+            data=payload,
+            headers={"User-Agent": self.user_agent},
+            timeout=self.timeout("login"),
+        )
 
-            if "Authorization" in response.headers:
-                self.api_token = response.headers["Authorization"]
-                self.merchant_id = response.headers["X-MERCHANT-ID"]
-                self.lastLogin = datetime.datetime.now()
-            else:
-                error_message = f"Invalid response for url=#{self.instance_url()} : #{response}"
-                raise TwikeyError(
-                    ctx="Config", error_code="Authentication", error=error_message
-                )
+        if "ApiErrorCode" in response.headers:
+            error_json = response.json()
+            self.logger.error(error_json)
+            error_code = response.headers["ApiErrorCode"]
+            error_json_message = "Error authenticating : %s" % error_json["message"]
+            raise TwikeyError(
+                ctx="Config", error_code=error_code, error=error_json_message
+            )
+
+        if "X-Rate-Limit-Retry-After-Seconds" in response.headers:
+            retry_after_seconds = response.headers[
+                "X-Rate-Limit-Retry-After-Seconds"
+            ]
+            error_message = f"Too many login's, please try again after #{retry_after_seconds} sec."
+            raise TwikeyError(
+                ctx="Config", error_code="Rate limit", error=error_message
+            )
+
+        if "Authorization" in response.headers:
+            self.api_token = response.headers["Authorization"]
+            self.merchant_id = response.headers["X-MERCHANT-ID"]
+            self.lastLogin = datetime.datetime.now()
         else:
-            self.logger.debug("Reusing token {} valid till {}".format(self.api_token, self.lastLogin))
+            error_message = f"Invalid response for url=#{self.instance_url()} : #{response}"
+            raise TwikeyError(
+                ctx="Config", error_code="Authentication", error=error_message
+            )
+
+    @staticmethod
+    def deadline(seconds):
+        """
+        Context manager limiting the time all calls within the block may take, eg.
+
+            with twikey_client.deadline(2):
+                twikey_client.document.fetch(...)
+                twikey_client.invoice.feed(...)
+
+        Calls starting after the deadline raise a TwikeyError 'DeadlineExceeded' and the
+        timeouts of the others are capped to the remaining time.
+        """
+        return _timeouts.deadline(seconds)
+
+    @staticmethod
+    def priority(name):
+        """
+        Context manager sending all calls within the block with the given priority
+        ('high', 'normal' or 'bulk') when a scheduler is configured, eg.
+
+            with twikey_client.priority("bulk"):
+                twikey_client.invoice.create(...)
+        """
+        from .scheduler import priority
+
+        return priority(name)
+
+    def timeout(self, endpoint):
+        """
+        :param endpoint: name of the call eg. 'invoice.create'
+        :return: (connect, read) timeout for the call, capped by the current deadline
+        """
+        connect, read = self.timeouts.get(endpoint)
+        remaining = _timeouts.remaining()
+        if remaining is None:
+            return connect, read
+        if remaining <= 0:
+            raise TwikeyError(ctx=endpoint, error_code="DeadlineExceeded", error="Deadline passed before the call")
+        return min(connect, remaining), min(read, remaining)
+
+    def coalesce(self, url, params, fn):
+        """
+        Run the read fn, sharing its result with concurrent callers for the same url and params
+        when coalescing of reads is enabled.
+        """
+        if self.single_flight is None:
+            return fn()
+        key = (url, tuple(sorted((k, tuple(v) if isinstance(v, list) else v) for k, v in (params or {}).items())))
+        return self.single_flight.do(key, fn)
 
     def headers(self, content_type="application/x-www-form-urlencoded"):
         return {
@@ -155,28 +305,28 @@ class TwikeyClient(object):
         }
 
     def raise_error(self, context, response):
-        self.logger.error("Error in '%s' response %s " % (context, response.text))
+        self.logger.error("Error in '%s' response %s ", context, response.text)
         try:
             error_json = response.json()
             extra = error_json["extra"] if "extra" in error_json else False
             return TwikeyError(
-                context, error_json["code"], error_json["message"], extra
+                context, error_json["code"], error_json["message"], extra, status=response.status_code
             )
         except requests.exceptions.JSONDecodeError:
-            return TwikeyError(context, response.url, response.text)
+            return TwikeyError(context, response.url, response.text, status=response.status_code)
 
     def raise_error_from_request(self, context, request_exception):
-        self.logger.error("Error in '%s' request %s " % (context, request_exception))
+        self.logger.error("Error in '%s' request %s ", context, request_exception)
         return TwikeyError(
             context, request_exception.__class__.__name__, request_exception
         )
 
     def logout(self):
         self.logger.info("Logging out of Twikey")
-        response = requests.get(
+        response = self.session.get(
             self.instance_url(),
             headers={"User-Agent": self.user_agent},
-            timeout=15,
+            timeout=self.timeout("logout"),
         )
         response_text = json.loads(response.text)
         if "code" in response_text:
@@ -187,17 +337,20 @@ class TwikeyClient(object):
 
         self.api_token = None
         self.lastLogin = None
+        if self.token_store:
+            self.token_store.delete(self.token_store.key(self.api_key, self.api_base))
 
 
 class TwikeyError(Exception):
     """Twikey error."""
 
     def __init__(
-        self, ctx, error_code, error, extra=False, *args, **kwargs
+        self, ctx, error_code, error, extra=False, *args, status=None, **kwargs
     ):  # real signature unknown
         super().__init__(args, kwargs)
         self.ctx = ctx
         self.error_code = error_code
+        self.status = status
         self.error = error
         self.extra = extra
 
@@ -216,3 +369,9 @@ class TwikeyError(Exception):
 
     def get_extra(self):
         return self.extra
+
+    def get_status(self):
+        """
+        :return: the http status of the response with the error, None when no response was received
+        """
+        return self.status
@@ -0,0 +1,178 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+
+class SingleFlight(object):
+    """
+    Coalesces concurrent calls for the same key: while a call is in flight, other callers for
+    the same key wait for it and receive the same result (or exception) instead of calling again.
+
+    Attributes:
+        calls (int): number of calls actually executed
+        shared (int): number of callers that received the result of a call in flight
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.shared += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class _Call(object):
+    __slots__ = ["done", "result", "error"]
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class UpdateBuffer(object):
+    """
+    Merges the updates of the same invoice or transaction issued within a short window into a single call.
+    Fields of later updates overwrite those of earlier ones, the returned future resolves with the result
+    (or exception) of the combined call.
+
+    Sample usage
+
+        with UpdateBuffer(twikey_client, window=2) as buffer:
+            buffer.update("invoice", UpdateInvoiceRequest(id=invoice_id, title="..."))
+            buffer.update("invoice", UpdateInvoiceRequest(id=invoice_id, duedate="..."))
+
+    Attributes:
+        updates (int): number of updates received
+        sent (int): number of calls sent to Twikey
+    """
+
+    SERVICES = ("invoice", "transaction")
+
+    def __init__(self, client, window=2.0, max_workers=4) -> None:
+        """
+        :param client: the TwikeyClient sending the updates
+        :param window: seconds an update waits for others of the same object
+        :param max_workers: number of combined updates sent in parallel
+        """
+        self.client = client
+        self.window = window
+        self.updates = 0
+        self.sent = 0
+        self._pending = {}
+        self._closed = False
+        self._condition = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="twikey-update")
+        self._thread = threading.Thread(target=self._run, name="twikey-update-buffer", daemon=True)
+        self._thread.start()
+
+    def update(self, service: str, request) -> Future:
+        """
+        :param service: 'invoice' (UpdateInvoiceRequest) or 'transaction' (UpdateRequest)
+        :param request: the update, only its fields that are set are sent
+        """
+        if service not in self.SERVICES:
+            raise ValueError("Unsupported service %s" % service)
+        data = request.to_request()
+        key = (service, data.get("id"))
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("UpdateBuffer is closed")
+            self.updates += 1
+            pending = self._pending.get(key)
+            if pending is None:
+                pending = self._pending[key] = _PendingUpdate(time.monotonic() + self.window)
+                self._condition.notify()
+            pending.data.update(data)
+            return pending.future
+
+    def flush(self):
+        """
+        Send all pending updates now and wait for them to complete
+        """
+        with self._condition:
+            futures = [self._send(key, update) for key, update in self._pending.items()]
+            self._pending = {}
+        wait(futures)
+
+    def close(self):
+        """
+        Refuse new updates and send the pending ones
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        self.flush()
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _run(self):
+        with self._condition:
+            while not self._closed:
+                now = time.monotonic()
+                due = [key for key, update in self._pending.items() if update.due <= now]
+                for key in due:
+                    self._send(key, self._pending.pop(key))
+                timeout = min((update.due for update in self._pending.values()), default=now + self.window) - now
+                self._condition.wait(timeout=max(0.0, timeout))
+
+    def _send(self, key, update) -> Future:
+        service, _ = key
+        self.sent += 1
+        return self._executor.submit(self._call, getattr(self.client, service), update)
+
+    @staticmethod
+    def _call(service, update):
+        try:
+            update.future.set_result(service.update(_MergedRequest(update.data)))
+        except BaseException as e:
+            update.future.set_exception(e)
+
+
+class _PendingUpdate(object):
+    __slots__ = ["due", "data", "future"]
+
+    def __init__(self, due):
+        self.due = due
+        self.data = {}
+        self.future = Future()
+
+
+class _MergedRequest(object):
+    __slots__ = ["data"]
+
+    def __init__(self, data: dict):
+        self.data = data
+
+    def to_request(self) -> dict:
+        return self.data
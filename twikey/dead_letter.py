@@ -0,0 +1,176 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+
+class DeadLetter(object):
+    """
+    Feed item that couldn't be handled.
+
+    Attributes:
+        id (str): id of the dead letter in the store
+        feed (str): name of the feed (eg. 'invoice.feed')
+        item (dict): the raw item as returned by Twikey
+        error (str): the exception (with traceback) or the error returned by the handler
+        attempts (int): number of times handling the item failed
+        created (float): epoch seconds the item failed the first time
+    """
+
+    __slots__ = ["id", "feed", "item", "error", "attempts", "created"]
+
+    def __init__(self, id, feed, item, error, attempts=1, created=None):
+        self.id = id
+        self.feed = feed
+        self.item = item
+        self.error = error
+        self.attempts = attempts
+        self.created = created or time.time()
+
+    def to_dict(self) -> dict:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+
+def describe(error) -> str:
+    """
+    :return: the traceback of an exception or the error returned by a handler
+    """
+    if isinstance(error, BaseException):
+        return "".join(traceback.format_exception(type(error), error, error.__traceback__)).strip()
+    return str(error)
+
+
+class DeadLetterStore(ABC):
+    """
+    Storage for the feed items whose handler failed, so the feed can continue and the items be retried later
+    (see FeedEngine.retry_dead_letters).
+
+    Implement put, failed_again, list and delete to provide your own backend.
+    """
+
+    @abstractmethod
+    def put(self, feed: str, item: dict, error) -> DeadLetter:
+        pass
+
+    @abstractmethod
+    def failed_again(self, letter: DeadLetter, error):
+        pass
+
+    @abstractmethod
+    def list(self, feed: str = None) -> list:
+        pass
+
+    @abstractmethod
+    def delete(self, letter: DeadLetter):
+        pass
+
+
+class FileDeadLetterStore(DeadLetterStore):
+    """
+    Keeps the dead letters in an NDJSON file, one letter per line. Only meant to be used by a single process.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+
+    def put(self, feed: str, item: dict, error) -> DeadLetter:
+        letter = DeadLetter(uuid.uuid4().hex, feed, item, describe(error))
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(letter.to_dict()) + "\n")
+        return letter
+
+    def failed_again(self, letter: DeadLetter, error):
+        letter.error = describe(error)
+        letter.attempts += 1
+        with self._lock:
+            self._write([letter if other.id == letter.id else other for other in self._read()])
+
+    def list(self, feed: str = None) -> list:
+        with self._lock:
+            return [letter for letter in self._read() if feed is None or letter.feed == feed]
+
+    def delete(self, letter: DeadLetter):
+        with self._lock:
+            self._write([other for other in self._read() if other.id != letter.id])
+
+    def _read(self) -> list:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return [DeadLetter(**json.loads(line)) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def _write(self, letters: list):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".twikey-dead-letters")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                for letter in letters:
+                    f.write(json.dumps(letter.to_dict()) + "\n")
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+
+class SqliteDeadLetterStore(DeadLetterStore):
+    """
+    Keeps the dead letters in a sqlite database.
+    """
+
+    def __init__(self, path: str, timeout=30) -> None:
+        self.path = path
+        self.timeout = timeout
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS twikey_dead_letter "
+                "(id TEXT PRIMARY KEY, feed TEXT, item TEXT, error TEXT, attempts INTEGER, created REAL)"
+            )
+
+    def put(self, feed: str, item: dict, error) -> DeadLetter:
+        letter = DeadLetter(uuid.uuid4().hex, feed, item, describe(error))
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT INTO twikey_dead_letter (id, feed, item, error, attempts, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (letter.id, feed, json.dumps(item), letter.error, letter.attempts, letter.created),
+            )
+        return letter
+
+    def failed_again(self, letter: DeadLetter, error):
+        letter.error = describe(error)
+        letter.attempts += 1
+        with self._connection() as conn:
+            conn.execute(
+                "UPDATE twikey_dead_letter SET error = ?, attempts = ? WHERE id = ?",
+                (letter.error, letter.attempts, letter.id),
+            )
+
+    def list(self, feed: str = None) -> list:
+        with self._connection() as conn:
+            if feed is None:
+                rows = conn.execute("SELECT * FROM twikey_dead_letter ORDER BY created").fetchall()
+            else:
+                rows = conn.execute(
+                    "SELECT * FROM twikey_dead_letter WHERE feed = ? ORDER BY created", (feed,)
+                ).fetchall()
+        return [DeadLetter(row[0], row[1], json.loads(row[2]), row[3], row[4], row[5]) for row in rows]
+
+    def delete(self, letter: DeadLetter):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM twikey_dead_letter WHERE id = ?", (letter.id,))
+
+    @contextmanager
+    def _connection(self):
+        conn = sqlite3.connect(self.path, timeout=self.timeout)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
@@ -3,11 +3,17 @@ import logging
 import requests
 from datetime import datetime
 
+from .feed import FeedEngine, include_query
 from .model.document_request import InviteRequest, SignRequest, FetchMandateRequest, QueryMandateRequest, \
     MandateActionRequest, UpdateMandateRequest, PdfUploadRequest
 
 from .model.document_response import InviteResponse, SignResponse, Document, QueryMandateResponse, PdfResponse, \
     CustomerAccessResponse, DocumentFeed
+from .timestamps import parse_timestamp
+
+# includes of the mandate feed, the minimal projection only returns the mandate number with the event
+FEED_INCLUDES = ("id", "mandate", "person")
+MINIMAL_FEED_INCLUDES = ("id",)
 
 
 class DocumentService(object):
@@ -41,13 +47,13 @@ class DocumentService(object):
         data = request.to_request()
         try:
             self.client.refresh_token_if_required()
-            response = requests.post(
-                url=url, data=data, headers=self.client.headers(), timeout=15
+            response = self.client.session.post(
+                url=url, data=data, headers=self.client.headers(), timeout=self.client.timeout("document.create")
             )
             if "ApiErrorCode" in response.headers:
                 raise self.client.raise_error("Invite", response)
             json_response = response.json()
-            # self.logger.debug("Added new mandate : %s" % json_response["mndtId"])
+            # self.logger.debug("Added new mandate : %s", json_response["mndtId"])
             return InviteResponse(**json_response)
         except requests.exceptions.RequestException as e:
             raise self.client.raise_error_from_request("Invite", e)
@@ -80,13 +86,13 @@ class DocumentService(object):
             raise self.client.raise_error("Missing method")
         try:
             self.client.refresh_token_if_required()
-            response = requests.post(
-                url=url, data=data, headers=self.client.headers(), timeout=15
+            response = self.client.session.post(
+                url=url, data=data, headers=self.client.headers(), timeout=self.client.timeout("document.sign")
             )
             if "ApiErrorCode" in response.headers:
                 raise self.client.raise_error("Sign", response)
             json_response = response.json()
-            self.logger.debug("Added new mandate : %s" % json_response["MndtId"])
+            self.logger.debug("Added new mandate : %s", json_response["MndtId"])
             return SignResponse(**json_response)
         except requests.exceptions.RequestException as e:
             raise self.client.raise_error_from_request("Sign", e)
@@ -112,19 +118,23 @@ class DocumentService(object):
 
         data = request.to_request()
         url = self.client.instance_url("/mandate/detail")
-        try:
-            self.client.refresh_token_if_required()
-            response = requests.get(
-                url=url, params=data, headers=self.client.headers(), timeout=15
-            )
-            if "ApiErrorCode" in response.headers:
-                raise self.client.raise_error("detail", response)
-            json_response = response.json()
-            json_response["headers"] = response.headers
-            self.logger.debug("Mandate details : %s" % json_response)
-            return Document(mandate=json_response.get("Mndt"), headers=json_response.get("headers"))
-        except requests.exceptions.RequestException as e:
-            raise self.client.raise_error_from_request("detail", e)
+
+        def fetch():
+            try:
+                self.client.refresh_token_if_required()
+                response = self.client.session.get(
+                    url=url, params=data, headers=self.client.headers(), timeout=self.client.timeout("document.fetch")
+                )
+                if "ApiErrorCode" in response.headers:
+                    raise self.client.raise_error("detail", response)
+                json_response = response.json()
+                json_response["headers"] = response.headers
+                self.client.payload_logging.log(self.logger, "Mandate details", json_response)
+                return Document(mandate=json_response.get("Mndt"), headers=json_response.get("headers"))
+            except requests.exceptions.RequestException as e:
+                raise self.client.raise_error_from_request("detail", e)
+
+        return self.client.coalesce(url, data, fetch)
 
     def query(self, request: QueryMandateRequest) -> list:
         """
@@ -148,22 +158,26 @@ class DocumentService(object):
 
         data = request.to_request()
         url = self.client.instance_url("/mandate/query")
-        try:
-            self.client.refresh_token_if_required()
-            response = requests.get(
-                url=url,
-                params=data,
-                headers=self.client.headers(),
-                timeout=15,
-            )
-            if "ApiErrorCode" in response.headers:
-                raise self.client.raise_error("query", response)
-            json_response = response.json()
-            contracts_data = json_response.get("Contracts", [])
-            self.logger.debug("Mandate query result: %s" % json_response)
-            return QueryMandateResponse(contracts_data)
-        except requests.exceptions.RequestException as e:
-            raise self.client.raise_error_from_request("query", e)
+
+        def query():
+            try:
+                self.client.refresh_token_if_required()
+                response = self.client.session.get(
+                    url=url,
+                    params=data,
+                    headers=self.client.headers(),
+                    timeout=self.client.timeout("document.query"),
+                )
+                if "ApiErrorCode" in response.headers:
+                    raise self.client.raise_error("query", response)
+                json_response = response.json()
+                contracts_data = json_response.get("Contracts", [])
+                self.client.payload_logging.log(self.logger, "Mandate query result", json_response)
+                return QueryMandateResponse(contracts_data)
+            except requests.exceptions.RequestException as e:
+                raise self.client.raise_error_from_request("query", e)
+
+        return self.client.coalesce(url, data, query)
 
     def action(self, request: MandateActionRequest):
         """
@@ -192,8 +206,8 @@ class DocumentService(object):
         url = self.client.instance_url(f"/mandate/{data.get('mndtId')}/action")
         try:
             self.client.refresh_token_if_required()
-            response = requests.post(
-                url=url, data=data, headers=self.client.headers(), timeout=15
+            response = self.client.session.post(
+                url=url, data=data, headers=self.client.headers(), timeout=self.client.timeout("document.action")
             )
             if "ApiErrorCode" in response.headers:
                 raise self.client.raise_error("action", response)
@@ -224,10 +238,10 @@ class DocumentService(object):
         data = request.to_request()
         try:
             self.client.refresh_token_if_required()
-            response = requests.post(
-                url=url, data=data, headers=self.client.headers(), timeout=15
+            response = self.client.session.post(
+                url=url, data=data, headers=self.client.headers(), timeout=self.client.timeout("document.update")
             )
-            self.logger.debug("Updated mandate : {} response={}".format(data, response))
+            self.client.payload_logging.log(self.logger, "Updated mandate", data)
             if "ApiErrorCode" in response.headers:
                 raise self.client.raise_error("Update", response)
         except requests.exceptions.RequestException as e:
@@ -259,18 +273,16 @@ class DocumentService(object):
         url = self.client.instance_url(f"/mandate?mndtId={mandate_number}&rsn={reason}")
         try:
             self.client.refresh_token_if_required()
-            response = requests.delete(
-                url=url, headers=self.client.headers(), timeout=15
-            )
-            self.logger.debug(
-                "Cancel mandate : %s status=%d" % (mandate_number, response.status_code)
+            response = self.client.session.delete(
+                url=url, headers=self.client.headers(), timeout=self.client.timeout("document.cancel")
             )
+            self.logger.debug("Cancel mandate : %s status=%d", mandate_number, response.status_code)
             if "ApiErrorCode" in response.headers:
                 raise self.client.raise_error("Cancel", response)
         except requests.exceptions.RequestException as e:
             raise self.client.raise_error_from_request("Cancel", e)
 
-    def feed(self, document_feed: DocumentFeed, start_position=False):
+    def feed(self, document_feed: DocumentFeed, start_position=False, projection=FEED_INCLUDES):
         """
         See https://www.twikey.com/api/#mandate-feed
 
@@ -284,88 +296,43 @@ class DocumentService(object):
         Args:
             document_feed (DocumentFeed): Custom handler class with methods for processing
                 new, updated, or cancelled mandate events.
+            start_position (str): Optional position (eg. the value returned by a previous run) to resume after.
+            projection (tuple[str]): Parts of the mandates to return (id, mandate, person, signature, tracker, ...),
+                MINIMAL_FEED_INCLUDES when only the mandate numbers and events are needed.
 
         Returns:
-            None
+            str: Position of the last page handled.
 
         Raises:
             Exception: If the request to the feed endpoint fails or response is invalid.
         """
 
-        url = self.client.instance_url(
-            "/mandate?include=id&include=mandate&include=person"
-        )
-        try:
-            self.client.refresh_token_if_required()
-            initheaders = self.client.headers()
-            if start_position:
-                initheaders["X-RESUME-AFTER"] = str(start_position)
-            response = requests.get(
-                url=url,
-                headers=initheaders,
-                timeout=15,
-            )
-            if "ApiErrorCode" in response.headers:
-                raise self.client.raise_error("Feed", response)
-            feed_response = response.json()
-            while len(feed_response["Messages"]) > 0:
-                self.logger.debug(
-                    "Feed handling : %d from %s till %s"
-                    % (
-                        len(feed_response["Messages"]),
-                        start_position,
-                        response.headers["X-LAST"],
-                    )
-                )
-                document_feed.start(
-                    response.headers["X-LAST"], len(feed_response["Messages"])
-                )
-                error = False
-                for msg in feed_response["Messages"]:
-                    if "AmdmntRsn" in msg:
-                        mndt_id_ = msg["OrgnlMndtId"]
-                        self.logger.debug("Feed update : %s" % mndt_id_)
-                        mndt_ = msg["Mndt"]
-                        amdmnt_rsn_ = msg["AmdmntRsn"]
-                        rsn_ = amdmnt_rsn_.get("Rsn")
-                        author_ = amdmnt_rsn_["Orgtr"]["CtctDtls"]["EmailAdr"]
-                        at_ = msg["EvtTime"]
-                        if at_.endswith("Z"):
-                            at_ = at_.replace("Z", "+00:00")
-                        error = document_feed.updated_document(mndt_id_, Document(mandate=mndt_), rsn_, author_, datetime.fromisoformat(at_))
-                    elif "CxlRsn" in msg:
-                        mndt_ = msg["OrgnlMndtId"]
-                        cxl_rsn_ = msg["CxlRsn"]
-                        rsn_ = cxl_rsn_.get("Rsn")
-                        author_ = cxl_rsn_["Orgtr"]["CtctDtls"]["EmailAdr"]
-                        at_ = msg["EvtTime"]
-                        if at_.endswith("Z"):
-                            at_ = at_.replace("Z", "+00:00")
-                        self.logger.debug("Feed cancel : %s" % mndt_)
-                        error = document_feed.cancelled_document(mndt_, rsn_, author_, datetime.fromisoformat(at_))
-                    else:
-                        mndt_ = msg["Mndt"]
-                        at_ = msg["EvtTime"]
-                        if at_.endswith("Z"):
-                            at_ = at_.replace("Z", "+00:00")
-                        self.logger.debug("Feed create : %s" % mndt_)
-                        error = document_feed.new_document(Document(mandate=mndt_), datetime.fromisoformat(at_))
-                    if error:
-                        break
-                if error:
-                    self.logger.debug("Error while handing invoice, stopping")
-                    break
-                response = requests.get(
-                    url=url,
-                    headers=self.client.headers(),
-                    timeout=15,
-                )
-                if "ApiErrorCode" in response.headers:
-                    raise self.client.raise_error("Feed", response)
-                feed_response = response.json()
-            self.logger.debug("Done handing mandate feed")
-        except requests.exceptions.RequestException as e:
-            raise self.client.raise_error_from_request("Mandate feed", e)
+        return self.feed_engine(projection).run(document_feed, start_position)
+
+    def tail(self, document_feed: DocumentFeed, start_position=False, projection=FEED_INCLUDES, min_interval=1.0, max_interval=60.0):
+        """
+        Keeps reading the mandate feed like feed(), polling for new items once it's read until the end,
+        see FeedEngine.tail(). Use feed_engine().tail() to wake or stop it from another thread.
+
+        Args:
+            document_feed (DocumentFeed): Custom handler class, see feed().
+            start_position (str): Optional position (eg. the value returned by a previous run) to resume after.
+            projection (tuple[str]): Parts of the mandates to return, see feed().
+            min_interval (float): Seconds between polls right after items were handled.
+            max_interval (float): Maximum seconds between polls while the feed remains empty.
+
+        Returns:
+            str: Position of the last page handled, once the handler asked to stop.
+        """
+
+        return self.feed_engine(projection).tail(document_feed, start_position, min_interval, max_interval)
+
+    def feed_engine(self, projection=FEED_INCLUDES) -> FeedEngine:
+        """
+        :return: the engine reading the mandate feed, see feed()
+        """
+        url = self.client.instance_url("/mandate" + include_query(projection))
+        return FeedEngine(self.client, "document.feed", url, "Messages", _handle_document, "Mandate feed", self.logger)
 
     def upload_pdf(self, request: PdfUploadRequest):
         """
@@ -388,8 +355,8 @@ class DocumentService(object):
         try:
             self.client.refresh_token_if_required()
             with open(request.pdf_path, "rb") as file:
-                response = requests.post(
-                    url=url, data=file, headers=self.client.headers('application/pdf'), timeout=15
+                response = self.client.session.post(
+                    url=url, data=file, headers=self.client.headers('application/pdf'), timeout=self.client.timeout("document.upload_pdf")
                 )
             if "ApiErrorCode" in response.headers:
                 raise self.client.raise_error("pdf", response)
@@ -415,8 +382,8 @@ class DocumentService(object):
         url = self.client.instance_url(f"/mandate/pdf?mndtId={mndt_id}")
         try:
             self.client.refresh_token_if_required()
-            response = requests.get(
-                url=url, headers=self.client.headers(), timeout=15
+            response = self.client.session.get(
+                url=url, headers=self.client.headers(), timeout=self.client.timeout("document.retrieve_pdf")
             )
             if "ApiErrorCode" in response.headers:
                 raise self.client.raise_error("pdf", response)
@@ -453,8 +420,8 @@ class DocumentService(object):
         url = self.client.instance_url("/customer/" + str(customer_id))
         try:
             self.client.refresh_token_if_required()
-            response = requests.patch(
-                url=url, params=data, headers=self.client.headers(), timeout=15
+            response = self.client.session.patch(
+                url=url, params=data, headers=self.client.headers(), timeout=self.client.timeout("document.update_customer")
             )
             if "ApiErrorCode" in response.headers:
                 raise self.client.raise_error("Cancel", response)
@@ -480,11 +447,47 @@ class DocumentService(object):
         url = self.client.instance_url("/customeraccess")
         try:
             self.client.refresh_token_if_required()
-            response = requests.post(
-                url=url, data={"mndtId": mndt_id}, headers=self.client.headers(), timeout=15
+            response = self.client.session.post(
+                url=url, data={"mndtId": mndt_id}, headers=self.client.headers(), timeout=self.client.timeout("document.customer_access")
             )
             if "ApiErrorCode" in response.headers:
                 raise self.client.raise_error("Cancel", response)
             return CustomerAccessResponse(**response.json())
         except requests.exceptions.RequestException as e:
-            raise self.client.raise_error_from_request("customer access", e)
\ No newline at end of file
+            raise self.client.raise_error_from_request("customer access", e)
+
+
+def _event_time(msg) -> datetime:
+    # the mandate feed always handed out datetimes, regardless of TwikeyClient(parse_timestamps=...)
+    return parse_timestamp(msg["EvtTime"])
+
+
+def _mandate(msg) -> Document:
+    # without the mandate include only the mandate number is known
+    return Document(mandate=msg.get("Mndt") or {"MndtId": msg.get("OrgnlMndtId")})
+
+
+def _author(reason) -> str:
+    # the originator is left out with the minimal includes
+    return (reason.get("Orgtr") or {}).get("CtctDtls", {}).get("EmailAdr")
+
+
+def _handle_document(document_feed: DocumentFeed, msg) -> bool:
+    if "AmdmntRsn" in msg:
+        amdmnt_rsn = msg["AmdmntRsn"]
+        return document_feed.updated_document(
+            msg["OrgnlMndtId"],
+            _mandate(msg),
+            amdmnt_rsn.get("Rsn"),
+            _author(amdmnt_rsn),
+            _event_time(msg),
+        )
+    if "CxlRsn" in msg:
+        cxl_rsn = msg["CxlRsn"]
+        return document_feed.cancelled_document(
+            msg["OrgnlMndtId"],
+            cxl_rsn.get("Rsn"),
+            _author(cxl_rsn),
+            _event_time(msg),
+        )
+    return document_feed.new_document(_mandate(msg), _event_time(msg))
@@ -0,0 +1,624 @@
+import collections
+import contextvars
+import glob
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
+
+from .client import TwikeyError
+
+
+def include_query(includes) -> str:
+    """
+    :return: the query string requesting the given includes, eg. '?include=id&include=mandate'
+    """
+    if not includes:
+        return ""
+    return "?" + "&".join("include=" + include for include in includes)
+
+
+class FeedPage(object):
+    """
+    A single page of a feed
+
+    Attributes:
+        items (list): raw items of the page
+        last (str): position of the last item ('X-LAST' header), to resume after
+        size (int): size of the response in bytes
+    """
+
+    __slots__ = ["items", "last", "size"]
+
+    def __init__(self, items, last, size=0):
+        self.items = items
+        self.last = last
+        self.size = size
+
+    def __len__(self):
+        return len(self.items)
+
+
+class PageQueue(object):
+    """
+    Bounded queue between fetching the pages of a feed in the background and handling them. Fetching pauses once
+    the pages waiting to be handled reach either high-water mark, a single page is always let through.
+
+    Attributes:
+        max_items (int): high-water mark of the number of items waiting
+        max_bytes (int): high-water mark of the size of the pages waiting
+        pages (int): number of pages waiting
+        items (int): number of items waiting
+        bytes (int): size of the pages waiting
+        peak_items (int): highest number of items that were waiting
+        peak_bytes (int): highest size of the pages that were waiting
+        paused (int): number of times fetching paused because the handler lagged
+    """
+
+    def __init__(self, max_items=5000, max_bytes=16 * 1024 * 1024) -> None:
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.items = 0
+        self.bytes = 0
+        self.peak_items = 0
+        self.peak_bytes = 0
+        self.paused = 0
+        self._pages = collections.deque()
+        self._error = None
+        self._closed = False
+        self._condition = threading.Condition()
+
+    @property
+    def pages(self) -> int:
+        return len(self._pages)
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                "pages": len(self._pages),
+                "items": self.items,
+                "bytes": self.bytes,
+                "peak_items": self.peak_items,
+                "peak_bytes": self.peak_bytes,
+                "paused": self.paused,
+            }
+
+    def put(self, page: FeedPage) -> bool:
+        """
+        Add a page, waiting while the queue is above a high-water mark
+        :return: False when the queue was closed by the consumer
+        """
+        with self._condition:
+            if self._pages and self._full():
+                self.paused += 1
+                while self._pages and self._full() and not self._closed:
+                    self._condition.wait()
+            if self._closed:
+                return False
+            self._pages.append(page)
+            self.items += len(page)
+            self.bytes += page.size
+            self.peak_items = max(self.peak_items, self.items)
+            self.peak_bytes = max(self.peak_bytes, self.bytes)
+            self._condition.notify_all()
+            return True
+
+    def fail(self, error: BaseException):
+        with self._condition:
+            self._error = error
+            self._condition.notify_all()
+
+    def get(self) -> FeedPage:
+        """
+        Take the next page, raising the error of the fetcher once all pages before it were taken
+        """
+        with self._condition:
+            while not self._pages and self._error is None:
+                self._condition.wait()
+            if not self._pages:
+                raise self._error
+            page = self._pages.popleft()
+            self.items -= len(page)
+            self.bytes -= page.size
+            self._condition.notify_all()
+            return page
+
+    def open(self):
+        with self._condition:
+            self._pages.clear()
+            self.items = self.bytes = 0
+            self._error = None
+            self._closed = False
+
+    def close(self):
+        """
+        Drop the pages waiting and let the fetcher stop
+        """
+        with self._condition:
+            self._closed = True
+            self._pages.clear()
+            self.items = self.bytes = 0
+            self._condition.notify_all()
+
+    def _full(self) -> bool:
+        return self.items >= self.max_items or self.bytes >= self.max_bytes
+
+
+class BatchFeed(object):
+    """
+    Feed handler receiving the items of a page in batches instead of one at a time, allowing eg. bulk inserts.
+    It can be passed to any feed instead of its regular handler, the items are decoded as for that handler
+    (eg. Invoice objects for the invoice feed, the mandate feed passes its raw messages).
+
+    Attributes:
+        batch_size (int): maximum number of items per batch, 0 passes the whole page at once
+    """
+
+    batch_size = 0
+
+    def start(self, position: str, number_of_updates: int):
+        """
+        Allow storing the start of the feed
+        :param position: position where the page ends returned by the 'X-LAST' header
+        :param number_of_updates: number of items in the page
+        """
+        pass
+
+    def batch(self, items: list) -> bool:
+        """
+        Handle a batch of items
+        :return: True to stop the feed, the items of the batch are then handled again on the next run
+        """
+        pass
+
+    def checkpoint(self, position: str):
+        """
+        Called once all items of a page were handled, the position can be stored to resume after
+        """
+        pass
+
+
+class FeedEngine(object):
+    """
+    Reads a feed page by page and hands its items to a feed handler, used by all feeds of the services.
+
+    Every page starts with handler.start(position, number_of_items). Items are decoded and passed to the handler
+    by the handle function of the feed, returning True (or an error) to stop, in which case no further items nor
+    pages are handled. A BatchFeed receives the decoded items in batches instead.
+
+    When the client has a DeadLetterStore, items whose handler raised or returned an error are stored there
+    and the feed continues with the next item.
+
+    Attributes:
+        pages (int): number of pages handled
+        items (int): number of items handled
+        position (str): position of the last page handled, also when handling or fetching a later page raised
+    """
+
+    def __init__(
+        self,
+        client,
+        name: str,
+        url: str,
+        list_key: str,
+        handle,
+        ctx: str,
+        logger=None,
+        decode=None,
+    ) -> None:
+        """
+        :param client: the TwikeyClient
+        :param name: name of the endpoint (eg. 'invoice.feed') used for its timeouts
+        :param url: full url of the feed
+        :param list_key: key of the items in the response (eg. 'Invoices')
+        :param handle: function(handler, item) passing a decoded item to the handler, returning True to stop
+        :param ctx: context of the errors raised
+        :param decode: Optional function converting a raw item into its model (eg. Invoice)
+        """
+        self.client = client
+        self.name = name
+        self.url = url
+        self.list_key = list_key
+        self.handle = handle
+        self.decode = decode
+        self.ctx = ctx
+        self.logger = logger or logging.getLogger(__name__)
+        self.pages = 0
+        self.items = 0
+        self.position = None
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+
+    def fetch(self, start_position=False) -> FeedPage:
+        """
+        Fetch the next page of the feed, or the page after the given position
+        """
+        try:
+            self.client.refresh_token_if_required()
+            headers = self.client.headers()
+            if start_position:
+                headers["X-RESUME-AFTER"] = str(start_position)
+            response = self.client.session.get(
+                url=self.url,
+                headers=headers,
+                timeout=self.client.timeout(self.name),
+            )
+            if "ApiErrorCode" in response.headers or response.status_code >= 400:
+                raise self.client.raise_error(self.ctx, response)
+            page = FeedPage(
+                response.json()[self.list_key],
+                response.headers.get("X-LAST"),
+                len(response.content or b""),
+            )
+            if self.client.feed_recorder is not None and len(page) > 0:
+                self.client.feed_recorder.record(self.name, page)
+            return page
+        except requests.exceptions.RequestException as e:
+            raise self.client.raise_error_from_request(self.ctx, e)
+
+    def run(self, handler, start_position=False, throttle=None, prefetch=None) -> str:
+        """
+        Handle all pages of the feed
+
+        :param handler: the feed handler (eg. an InvoiceFeed)
+        :param start_position: Optional position to resume after
+        :param throttle: Optional function called before fetching every page, eg. to respect a rate limit
+        :param prefetch: Optional PageQueue, fetching the next pages in the background while handling a page.
+                         The pages fetched but not handled when stopping are read again when resuming
+                         from the position returned.
+        :return: position of the last page handled
+        """
+        self.position = start_position
+        self._drain(handler, throttle, prefetch)
+        return self.position
+
+    def tail(
+        self,
+        handler,
+        start_position=False,
+        min_interval=1.0,
+        max_interval=60.0,
+        throttle=None,
+        prefetch=None,
+    ) -> str:
+        """
+        Keep handling the feed until stop() is called or the handler asks to stop. After reading the feed until
+        the end, the wait before the next poll doubles (up to max_interval) as long as nothing new arrived.
+        wake() (eg. from a webhook) polls immediately.
+
+        :param handler: the feed handler (eg. an InvoiceFeed)
+        :param start_position: Optional position to resume after
+        :param min_interval: seconds between polls right after items were handled
+        :param max_interval: maximum seconds between polls
+        :param throttle: Optional function called before fetching every page
+        :param prefetch: Optional PageQueue, see run()
+        :return: position of the last page handled
+        """
+        self._stopping.clear()
+        self.position = start_position
+        interval = min_interval
+        while not self._stopping.is_set():
+            items = self.items
+            try:
+                # resumes after the last page handled, even when a previous poll failed halfway
+                completed = self._drain(handler, throttle, prefetch)
+            except TwikeyError as e:
+                self.logger.warning(
+                    "Reading %s failed, retrying in %.1fs: %s", self.name, interval, e
+                )
+                completed = True
+            if not completed:
+                break
+            if self.items > items:
+                interval = min_interval
+            if self._wait(interval):
+                interval = min_interval
+            else:
+                interval = min(max_interval, interval * 2)
+        return self.position
+
+    def wake(self):
+        """
+        Let a tail() poll immediately, eg. when a webhook signals new items
+        """
+        self._wakeup.set()
+
+    def stop(self):
+        """
+        Stop a tail() once the current page is handled
+        """
+        self._stopping.set()
+        self._wakeup.set()
+
+    def _wait(self, seconds) -> bool:
+        """
+        :return: True when woken up before the time passed
+        """
+        woken = self._wakeup.wait(timeout=seconds)
+        self._wakeup.clear()
+        return woken
+
+    def _drain(self, handler, throttle, prefetch=None) -> bool:
+        """
+        Handle the pages after self.position, which moves along with every page handled
+
+        :return: False when the handler asked to stop
+        """
+        if prefetch is not None:
+            return self._drain_prefetched(handler, throttle, prefetch)
+        if throttle:
+            throttle()
+        page = self.fetch(self.position)
+        while len(page) > 0:
+            if not self._handle_fetched(handler, page):
+                return False
+            self.position = page.last
+            if throttle:
+                throttle()
+            page = self.fetch()
+        self.logger.debug("Done handling %s", self.name)
+        return True
+
+    def _drain_prefetched(self, handler, throttle, queue: PageQueue) -> bool:
+        queue.open()
+        # fetch within the caller's deadline and priority
+        fetcher = threading.Thread(
+            target=contextvars.copy_context().run,
+            args=(self._prefetch, self.position, throttle, queue),
+            name="twikey-prefetch-" + self.name,
+            daemon=True,
+        )
+        fetcher.start()
+        try:
+            page = queue.get()
+            while len(page) > 0:
+                if not self._handle_fetched(handler, page):
+                    return False
+                self.position = page.last
+                page = queue.get()
+        finally:
+            queue.close()
+            fetcher.join()
+        self.logger.debug("Done handling %s", self.name)
+        return True
+
+    def _prefetch(self, position, throttle, queue: PageQueue):
+        try:
+            if throttle:
+                throttle()
+            page = self.fetch(position)
+            while queue.put(page) and len(page) > 0:
+                if throttle:
+                    throttle()
+                page = self.fetch()
+        except BaseException as e:
+            queue.fail(e)
+
+    def _handle_fetched(self, handler, page) -> bool:
+        self.logger.debug(
+            "Feed handling : %d items from %s till %s",
+            len(page),
+            self.position,
+            page.last,
+        )
+        if not self.handle_page(handler, page):
+            self.logger.debug("Error while handling %s, stopping", self.name)
+            return False
+        return True
+
+    def replay(self, handler, pages) -> str:
+        """
+        Handle recorded pages instead of reading them from Twikey, eg.
+
+            engine.replay(MyInvoiceFeed(), recorder.pages(engine.name))
+
+        :param handler: the feed handler
+        :param pages: iterable of FeedPage, see FeedRecorder.pages()
+        :return: position of the last page handled
+        """
+        position = None
+        for page in pages:
+            if not self.handle_page(handler, page):
+                break
+            position = page.last
+        return position
+
+    def handle_page(self, handler, page: FeedPage) -> bool:
+        """
+        :return: False when the handler asked to stop
+        """
+        start = getattr(handler, "start", None)
+        if start is not None:
+            start(page.last, len(page))
+        self.pages += 1
+        if isinstance(handler, BatchFeed):
+            return self._handle_batches(handler, page)
+        dead_letters = self.client.dead_letters
+        for item in page.items:
+            self.client.payload_logging.log(self.logger, "Feed handling", item)
+            self.items += 1
+            if dead_letters is None:
+                if self.handle(handler, self.decode(item) if self.decode else item):
+                    return False
+                continue
+            error = self._try_handle(handler, item)
+            if error:
+                self.logger.warning(
+                    "Handling an item of %s failed, stored as dead letter: %s",
+                    self.name,
+                    error,
+                )
+                dead_letters.put(self.name, item, error)
+        return True
+
+    def retry_dead_letters(self, handler) -> int:
+        """
+        Handle the dead letters of this feed again, those that are handled successfully are removed from the store
+
+        :param handler: the (fixed) feed handler
+        :return: number of dead letters handled successfully
+        """
+        dead_letters = self.client.dead_letters
+        handled = 0
+        for letter in dead_letters.list(self.name):
+            error = self._try_handle(handler, letter.item)
+            if error:
+                dead_letters.failed_again(letter, error)
+            else:
+                dead_letters.delete(letter)
+                handled += 1
+        return handled
+
+    def _try_handle(self, handler, item):
+        """
+        :return: the exception raised or the error returned by the handler, None when the item was handled
+        """
+        try:
+            if isinstance(handler, BatchFeed):
+                error = handler.batch([self.decode(item) if self.decode else item])
+            else:
+                error = self.handle(handler, self.decode(item) if self.decode else item)
+        except Exception as e:
+            return e
+        return error or None
+
+    def _handle_batches(self, handler: BatchFeed, page: FeedPage) -> bool:
+        dead_letters = self.client.dead_letters
+        if dead_letters is None:
+            raw = page.items
+            items = [self.decode(item) for item in raw] if self.decode else raw
+        else:
+            raw, items = self._decode_or_dead_letter(page.items)
+        size = handler.batch_size or len(items) or 1
+        for offset in range(0, len(items), size):
+            batch = items[offset : offset + size]
+            if dead_letters is None:
+                if handler.batch(batch):
+                    return False
+            else:
+                try:
+                    error = handler.batch(batch)
+                except Exception as e:
+                    error = e
+                if error:
+                    # the failing item is unknown, each item of the batch can be retried on its own
+                    self.logger.warning(
+                        "Handling a batch of %s failed, stored as dead letters: %s",
+                        self.name,
+                        error,
+                    )
+                    for item in raw[offset : offset + size]:
+                        dead_letters.put(self.name, item, error)
+            self.items += len(batch)
+        handler.checkpoint(page.last)
+        return True
+
+    def _decode_or_dead_letter(self, items) -> tuple:
+        """
+        :return: the raw and decoded items that could be decoded, the others are stored as dead letters
+        """
+        if not self.decode:
+            return items, items
+        raw, decoded = [], []
+        for item in items:
+            try:
+                decoded.append(self.decode(item))
+            except Exception as e:
+                self.logger.warning(
+                    "Decoding an item of %s failed, stored as dead letter: %s",
+                    self.name,
+                    e,
+                )
+                self.client.dead_letters.put(self.name, item, e)
+                self.items += 1
+                continue
+            raw.append(item)
+        return raw, decoded
+
+
+class FeedRecorder(object):
+    """
+    Records the raw pages of the feeds with their position to gzip compressed NDJSON files in a directory,
+    so they can be replayed later without calling Twikey (see FeedEngine.replay).
+
+    Every feed is written to its own segments named '<feed>-<timestamp>.ndjson.gz' (eg. 'invoice.feed-...'),
+    a new segment is started every segment_pages pages and when the recorder is reopened.
+    """
+
+    def __init__(self, directory, segment_pages=1000) -> None:
+        self.directory = directory
+        self.segment_pages = segment_pages
+        self.logger = logging.getLogger(__name__)
+        self._segments = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def record(self, name: str, page: FeedPage):
+        line = (
+            json.dumps({"last": page.last, "items": page.items}, separators=(",", ":"))
+            + "\n"
+        )
+        with self._lock:
+            segment = self._segments.get(name)
+            if segment is None or segment.pages >= self.segment_pages:
+                if segment is not None:
+                    segment.file.close()
+                path = os.path.join(
+                    self.directory, "%s-%020d.ndjson.gz" % (name, time.time_ns())
+                )
+                segment = self._segments[name] = _Segment(
+                    gzip.open(path, "wt", encoding="utf-8")
+                )
+            segment.file.write(line)
+            segment.pages += 1
+
+    def pages(self, name: str, after=None):
+        """
+        Iterate over the recorded pages of a feed in the order they were read
+
+        :param name: name of the feed (eg. 'invoice.feed')
+        :param after: Optional position, only the pages recorded after the page ending at it are returned
+        """
+        skipping = after is not None
+        for path in sorted(
+            glob.glob(
+                os.path.join(
+                    glob.escape(self.directory), glob.escape(name) + "-*.ndjson.gz"
+                )
+            )
+        ):
+            try:
+                with gzip.open(path, "rt", encoding="utf-8") as f:
+                    for line in f:
+                        record = json.loads(line)
+                        if skipping:
+                            skipping = record["last"] != after
+                            continue
+                        yield FeedPage(record["items"], record["last"])
+            except (EOFError, gzip.BadGzipFile, json.JSONDecodeError) as e:
+                # eg. the segment that was being written when the process was killed
+                self.logger.warning("Stopped reading truncated segment %s: %s", path, e)
+
+    def close(self):
+        with self._lock:
+            for segment in self._segments.values():
+                segment.file.close()
+            self._segments = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _Segment(object):
+    __slots__ = ["file", "pages"]
+
+    def __init__(self, file):
+        self.file = file
+        self.pages = 0
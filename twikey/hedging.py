@@ -0,0 +1,235 @@
+import collections
+import contextvars
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+# Reads that can safely be sent twice, feeds are excluded as every call moves their position
+DEFAULT_HEDGED_PATHS = (
+    r"/mandate/detail$",
+    r"/mandate/query$",
+    r"/invoice/[^/]+$",
+    r"/transaction/detail$",
+    r"/payment/link$",
+    r"/transfer/detail$",
+)
+
+
+class HedgingPolicy(object):
+    """
+    Configures the hedging of idempotent reads: when no response arrived after the delay, an identical
+    request is sent and the first response is used.
+
+    Attributes:
+        percentile (float): the delay is this percentile of the recently observed latencies
+        min_delay (float): lower bound of the delay in seconds
+        initial_delay (float): delay in seconds used until enough latencies were observed
+        budget (float): maximum fraction of the reads that may be hedged, capping the extra load
+        window (int): number of latencies used to compute the percentile
+        paths (tuple[str]): regexes of the url paths of the reads that may be hedged
+        max_workers (int): threads available to send the (hedged) reads
+    """
+
+    __slots__ = ["percentile", "min_delay", "initial_delay", "budget", "window", "paths", "max_workers"]
+
+    def __init__(
+        self,
+        percentile=95,
+        min_delay=0.05,
+        initial_delay=1.0,
+        budget=0.05,
+        window=200,
+        paths=DEFAULT_HEDGED_PATHS,
+        max_workers=32,
+    ) -> None:
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.initial_delay = initial_delay
+        self.budget = budget
+        self.window = window
+        self.paths = paths
+        self.max_workers = max_workers
+
+
+class HedgingStats(object):
+    """
+    Attributes:
+        reads (int): number of reads eligible for hedging
+        hedged (int): number of reads for which a second request was sent
+        hedge_wins (int): number of hedged reads where the second request answered first
+        over_budget (int): number of reads that weren't hedged because the budget was used up
+    """
+
+    __slots__ = ["reads", "hedged", "hedge_wins", "over_budget"]
+
+    def __init__(self):
+        self.reads = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.over_budget = 0
+
+    def __str__(self):
+        return f"reads={self.reads}, hedged={self.hedged}, hedge_wins={self.hedge_wins}, over_budget={self.over_budget}"
+
+
+class HedgedSession(object):
+    """
+    Wraps the session of a TwikeyClient, hedging the GET requests matching the policy.
+    All other requests are passed on unchanged.
+
+    The read is sent from the caller's thread. When it didn't answer within the delay, an identical request
+    is sent from the pool, whose response is used when it arrived first or when the first read failed.
+    The response that isn't used is closed.
+    """
+
+    def __init__(self, session, policy: HedgingPolicy) -> None:
+        self.session = session
+        self.policy = policy
+        self.stats = HedgingStats()
+        self.logger = logging.getLogger(__name__)
+        self._paths = [re.compile(p) for p in policy.paths]
+        self._latencies = collections.deque(maxlen=policy.window)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=policy.max_workers, thread_name_prefix="twikey-hedge")
+
+    def get(self, url, **kwargs):
+        path = urlsplit(url).path
+        if not any(p.search(path) for p in self._paths):
+            return self.session.get(url, **kwargs)
+        with self._lock:
+            self.stats.reads += 1
+        race = _Race()
+        # the hedge is sent within the caller's deadline and priority
+        self._executor.submit(contextvars.copy_context().run, self._hedge, race, self.delay(), url, kwargs)
+        try:
+            response = self._timed_get(url, kwargs)
+        except Exception:
+            hedge = race.primary_failed()
+            if hedge is None:
+                raise
+            self._count_win()
+            return hedge
+        hedge = race.primary_answered()
+        if hedge is None:
+            return response
+        self._count_win()
+        _close(response)
+        return hedge
+
+    def request(self, method, url, **kwargs):
+        if method.upper() == "GET":
+            return self.get(url, **kwargs)
+        return self.session.request(method, url, **kwargs)
+
+    def delay(self) -> float:
+        """
+        :return: seconds to wait for a response before hedging
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < min(20, self.policy.window):
+            return self.policy.initial_delay
+        index = min(len(latencies) - 1, int(len(latencies) * self.policy.percentile / 100))
+        return max(self.policy.min_delay, latencies[index])
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+    def __getattr__(self, name):
+        # post, put, delete, ... are handled by the wrapped session
+        return getattr(self.session, name)
+
+    def _hedge(self, race, delay, url, kwargs):
+        if race.primary_done.wait(delay) or not race.send(self._take_budget):
+            return
+        self.logger.debug("Hedging read of %s after %.3fs", urlsplit(url).path, delay)
+        try:
+            response = self._timed_get(url, kwargs)
+        except Exception as e:
+            self.logger.debug("Hedged read of %s failed: %s", urlsplit(url).path, e)
+            response = None
+        race.hedge_answered(response)
+
+    def _count_win(self):
+        with self._lock:
+            self.stats.hedge_wins += 1
+
+    def _timed_get(self, url, kwargs):
+        start = time.monotonic()
+        response = self.session.get(url, **kwargs)
+        with self._lock:
+            self._latencies.append(time.monotonic() - start)
+        return response
+
+    def _take_budget(self) -> bool:
+        with self._lock:
+            if self.stats.hedged >= self.policy.budget * self.stats.reads + 1:
+                self.stats.over_budget += 1
+                return False
+            self.stats.hedged += 1
+            return True
+
+
+class _Race(object):
+    """
+    The two requests of a hedged read, the caller takes the response of the hedge when it arrived first
+    or when its own request failed. A response nobody takes is closed.
+    """
+
+    __slots__ = ["primary_done", "hedge_done", "hedge", "sent", "abandoned", "_lock"]
+
+    def __init__(self):
+        self.primary_done = threading.Event()
+        self.hedge_done = threading.Event()
+        self.hedge = None
+        self.sent = False
+        self.abandoned = False
+        self._lock = threading.Lock()
+
+    def send(self, take_budget) -> bool:
+        """
+        :return: True when the hedge is to be sent, ie. the caller is still waiting and the budget allows it
+        """
+        with self._lock:
+            if self.abandoned or not take_budget():
+                return False
+            self.sent = True
+            return True
+
+    def hedge_answered(self, response):
+        with self._lock:
+            self.hedge = response
+            close = self.abandoned
+        self.hedge_done.set()
+        if close:
+            _close(response)
+
+    def primary_answered(self):
+        """
+        :return: the response of the hedge when it arrived first, otherwise None
+        """
+        self.primary_done.set()
+        with self._lock:
+            self.abandoned = True
+            return self.hedge
+
+    def primary_failed(self):
+        """
+        :return: the response of the hedge, after waiting for it when it was sent, otherwise None
+        """
+        self.primary_done.set()
+        with self._lock:
+            if not self.sent:
+                self.abandoned = True
+                return None
+        self.hedge_done.wait()
+        return self.hedge
+
+
+def _close(response):
+    if response is not None and hasattr(response, "close"):
+        response.close()
@@ -2,11 +2,17 @@ import logging
 
 import requests
 
+from .feed import FeedEngine, include_query
 from .model.invoice_request import InvoiceRequest, UpdateInvoiceRequest, DetailsRequest, ActionRequest, \
     UblUploadRequest, BulkInvoiceRequest
 from .model.invoice_response import Event, Invoice, BulkInvoiceResponse, \
     BulkBatchDetailsResponse, InvoiceFeed, PaymentFeed
 
+# includes of the invoice feed, the minimal projection leaves out the customer (id, number, state, ... only)
+FEED_INCLUDES = ("customer",)
+MINIMAL_FEED_INCLUDES = ()
+
+
 class InvoiceService(object):
     def __init__(self, client) -> None:
         super().__init__()
@@ -45,16 +51,16 @@ class InvoiceService(object):
                 headers["X-Purpose"] = purpose
             if manual:
                 headers["X-MANUAL"] = "true"
-            response = requests.post(
+            response = self.client.session.post(
                 url=url,
                 json=data,
                 headers=headers,
-                timeout=15,
+                timeout=self.client.timeout("invoice.create"),
             )
             json_response = response.json()
             if "ApiErrorCode" in response.headers:
                 raise self.client.raise_error("Create invoice", response)
-            self.logger.debug("Added invoice : %s" % json_response["url"])
+            self.logger.debug("Added invoice : %s", json_response["url"])
             return Invoice(**json_response)
         except requests.exceptions.RequestException as e:
             raise self.client.raise_error_from_request("Create invoice", e)
@@ -84,11 +90,11 @@ class InvoiceService(object):
         try:
             self.client.refresh_token_if_required()
             headers = self.client.headers("application/json")
-            response = requests.put(url=url, json=data, headers=headers, timeout=15)
+            response = self.client.session.put(url=url, json=data, headers=headers, timeout=self.client.timeout("invoice.update"))
             json_response = response.json()
             if "ApiErrorCode" in response.headers:
                 raise self.client.raise_error("Update invoice", response)
-            self.logger.debug("Updated invoice : %s" % json_response["url"])
+            self.logger.debug("Updated invoice : %s", json_response["url"])
             return Invoice(**json_response)
         except requests.exceptions.RequestException as e:
             raise self.client.raise_error_from_request("Update invoice", e)
@@ -119,16 +125,21 @@ class InvoiceService(object):
         if includes:
             query_string = "&".join(f"include={param}" for param in includes)
             url += f"?{query_string}"
-        try:
-            self.client.refresh_token_if_required()
-            headers = self.client.headers("application/json")
-            response = requests.get(url=url, headers=headers, timeout=15)
-            if "ApiErrorCode" in response.headers:
-                raise self.client.raise_error("details invoice", response)
-            self.logger.debug("details invoice: %s", response.text)
-            return Invoice(**response.json())
-        except requests.exceptions.RequestException as e:
-            raise self.client.raise_error_from_request("details invoice", e)
+
+        def details():
+            try:
+                self.client.refresh_token_if_required()
+                headers = self.client.headers("application/json")
+                response = self.client.session.get(url=url, headers=headers, timeout=self.client.timeout("invoice.details"))
+                if "ApiErrorCode" in response.headers:
+                    raise self.client.raise_error("details invoice", response)
+                json_response = response.json()
+                self.client.payload_logging.log(self.logger, "details invoice", json_response)
+                return Invoice(**json_response)
+            except requests.exceptions.RequestException as e:
+                raise self.client.raise_error_from_request("details invoice", e)
+
+        return self.client.coalesce(url, None, details)
 
     def action(self, request: ActionRequest):
         """
@@ -155,7 +166,7 @@ class InvoiceService(object):
         try:
             self.client.refresh_token_if_required()
             headers = self.client.headers("application/x-www-form-urlencoded")
-            response = requests.post(url=url, data=payload, headers=headers, timeout=15)
+            response = self.client.session.post(url=url, data=payload, headers=headers, timeout=self.client.timeout("invoice.action"))
             if response.status_code != 204:
                 raise self.client.raise_error("action invoice", response)
             self.logger.debug("action invoice [%s]: %s", invoice_id, payload["type"])
@@ -184,16 +195,17 @@ class InvoiceService(object):
             headers = self.client.headers("application/x-www-form-urlencoded")
             headers.update(request.to_headers())
             with open(request.xml_path, "rb") as file:
-                response = requests.post(
+                response = self.client.session.post(
                     url=url,
                     headers=headers,
                     data=file,
-                    timeout=15
+                    timeout=self.client.timeout("invoice.upload_ubl")
                 )
             if response.status_code != 200:
                 raise self.client.raise_error("UBL upload", response)
-            self.logger.debug("UBL upload response: %s", response.text)
-            return Invoice(**response.json())
+            json_response = response.json()
+            self.client.payload_logging.log(self.logger, "UBL upload response", json_response)
+            return Invoice(**json_response)
         except requests.exceptions.RequestException as e:
             raise self.client.raise_error_from_request("UBL upload", e)
 
@@ -221,10 +233,10 @@ class InvoiceService(object):
         try:
             self.client.refresh_token_if_required()
             headers = self.client.headers("application/json")
-            response = requests.delete(url=url, headers=headers, timeout=15)
+            response = self.client.session.delete(url=url, headers=headers, timeout=self.client.timeout("invoice.delete"))
             if "ApiErrorCode" in response.headers:
                 raise self.client.raise_error("delete invoice", response)
-            self.logger.debug("delete invoice : %s")
+            self.logger.debug("delete invoice : %s", invoice_id)
         except requests.exceptions.RequestException as e:
             raise self.client.raise_error_from_request("delete invoice", e)
 
@@ -249,16 +261,17 @@ class InvoiceService(object):
             self.client.refresh_token_if_required()
             headers = self.client.headers("application/json")
             data = request.to_request()
-            response = requests.post(
+            response = self.client.session.post(
                 url=url,
                 headers=headers,
                 json=data,
-                timeout=30
+                timeout=self.client.timeout("invoice.bulk_create")
             )
             if response.status_code != 200:
                 raise self.client.raise_error("bulk create invoices", response)
-            self.logger.debug("bulk create invoices response: %s", response.text)
-            return BulkInvoiceResponse(**response.json())
+            json_response = response.json()
+            self.client.payload_logging.log(self.logger, "bulk create invoices response", json_response)
+            return BulkInvoiceResponse(**json_response)
         except requests.exceptions.RequestException as e:
             raise self.client.raise_error_from_request("bulk create invoices", e)
 
@@ -281,23 +294,24 @@ class InvoiceService(object):
         try:
             self.client.refresh_token_if_required()
             headers = self.client.headers("application/json")
-            response = requests.get(
+            response = self.client.session.get(
                 url=url,
                 headers=headers,
-                timeout=15
+                timeout=self.client.timeout("invoice.bulk_details")
             )
             if response.status_code == 409:
                 self.logger.debug("bulk batch still processing: %s", batch_id)
                 return None
             elif response.status_code == 200:
-                self.logger.debug("bulk batch details response: %s", response.text)
-                return BulkBatchDetailsResponse(response.json())
+                json_response = response.json()
+                self.client.payload_logging.log(self.logger, "bulk batch details response", json_response)
+                return BulkBatchDetailsResponse(json_response)
             else:
                 raise self.client.raise_error("bulk batch details", response)
         except requests.exceptions.RequestException as e:
             raise self.client.raise_error_from_request("bulk batch details", e)
 
-    def feed(self, invoice_feed: InvoiceFeed, start_position=False, *includes):
+    def feed(self, invoice_feed: InvoiceFeed, start_position=False, *includes, projection=None):
         """
         See https://www.twikey.com/api/#invoice-feed
 
@@ -311,63 +325,50 @@ class InvoiceService(object):
         Args:
             invoice_feed (InvoiceFeed): Custom handler class with methods for processing
                 new, updated, or cancelled invoice events.
+            start_position (str): Optional position (eg. the value returned by a previous run) to resume after.
+            includes (str): Parts to include next to the customer (meta, lastpayment).
+            projection (tuple[str]): Optional exact parts to include instead, eg. MINIMAL_FEED_INCLUDES
+                when only the state changes are needed.
 
         Returns:
-            None
+            str: Position of the last page handled.
 
         Raises:
             Exception: If the request to the feed endpoint fails or response is invalid.
         """
 
-        _includes = ""
-        for include in includes:
-            _includes += "&include=" + include
+        return self.feed_engine(*includes, projection=projection).run(invoice_feed, start_position)
 
-        url = self.client.instance_url("/invoice?include=customer" + _includes)
-        try:
-            self.client.refresh_token_if_required()
-            initheaders = self.client.headers()
-            if start_position:
-                initheaders["X-RESUME-AFTER"] = str(start_position)
-            response = requests.get(
-                url=url,
-                headers=initheaders,
-                timeout=15,
-            )
-            if "ApiErrorCode" in response.headers:
-                raise self.client.raise_error("Feed invoice", response)
-            feed_response = response.json()
-            while len(feed_response["Invoices"]) > 0:
-                number_of_invoices = len(feed_response["Invoices"])
-                last_invoice = response.headers["X-LAST"]
-                self.logger.debug(
-                    "Feed handling : %d invoices from %s till %s"
-                    % (number_of_invoices, start_position, last_invoice)
-                )
-                invoice_feed.start(
-                    response.headers["X-LAST"], len(feed_response["Invoices"])
-                )
-                error = False
-                for invoice in feed_response["Invoices"]:
-                    self.logger.debug("Feed handling : %s" % invoice)
-                    error = invoice_feed.invoice(Invoice(**invoice))
-                    if error:
-                        break
-                if error:
-                    self.logger.debug("Error while handing invoice, stopping")
-                    break
-                response = requests.get(
-                    url=url,
-                    headers=self.client.headers(),
-                    timeout=15,
-                )
-                if "ApiErrorCode" in response.headers:
-                    raise self.client.raise_error("Feed invoice", response)
-                feed_response = response.json()
-            self.logger.debug("Done handing invoice feed")
-        except requests.exceptions.RequestException as e:
-            raise self.client.raise_error_from_request("Invoice feed", e)
+    def tail(self, invoice_feed: InvoiceFeed, start_position=False, *includes, projection=None, min_interval=1.0, max_interval=60.0):
+        """
+        Keeps reading the invoice feed like feed(), polling for new items once it's read until the end,
+        see FeedEngine.tail(). Use feed_engine().tail() to wake or stop it from another thread.
+
+        Args:
+            invoice_feed (InvoiceFeed): Custom handler class, see feed().
+            start_position (str): Optional position (eg. the value returned by a previous run) to resume after.
+            includes, projection: Parts of the invoices to return, see feed().
+            min_interval (float): Seconds between polls right after items were handled.
+            max_interval (float): Maximum seconds between polls while the feed remains empty.
+
+        Returns:
+            str: Position of the last page handled, once the handler asked to stop.
+        """
 
+        return self.feed_engine(*includes, projection=projection).tail(invoice_feed, start_position, min_interval, max_interval)
+
+    def feed_engine(self, *includes, projection=None) -> FeedEngine:
+        """
+        :return: the engine reading the invoice feed, see feed()
+        """
+        if projection is None:
+            projection = FEED_INCLUDES + includes
+        url = self.client.instance_url("/invoice" + include_query(projection))
+        return FeedEngine(
+            self.client, "invoice.feed", url, "Invoices",
+            lambda feed, invoice: feed.invoice(invoice), "Invoice feed", self.logger,
+            decode=lambda invoice: Invoice(**invoice),
+        )
 
     def payment(self, payment_feed: PaymentFeed, start_position=False):
         """
@@ -380,56 +381,26 @@ class InvoiceService(object):
         Args:
             payment_feed (PaymentFeed): Custom handler class with methods for processing
                 new, updated, or cancelled payment events.
+            start_position (str): Optional position (eg. the value returned by a previous run) to resume after.
 
         Returns:
-            None
+            str: Position of the last page handled.
 
         Raises:
             Exception: If the request to the feed endpoint fails or response is invalid.
         """
 
+        return self.payment_engine().run(payment_feed, start_position)
+
+    def payment_engine(self) -> FeedEngine:
+        """
+        :return: the engine reading the payment feed, see payment()
+        """
         url = self.client.instance_url("/invoice/payment/feed")
-        try:
-            self.client.refresh_token_if_required()
-            initheaders = self.client.headers()
-            if start_position:
-                initheaders["X-RESUME-AFTER"] = str(start_position)
-            response = requests.get(
-                url=url,
-                headers=initheaders,
-                timeout=15,
-            )
-            if "ApiErrorCode" in response.headers:
-                raise self.client.raise_error("Feed payments", response)
-            feed_response = response.json()
-            while len(feed_response["Payments"]) > 0:
-                number_of_invoices = len(feed_response["Payments"])
-                last_invoice = response.headers["X-LAST"]
-                self.logger.debug(
-                    "Feed handling : %d payments from %s till %s"
-                    % (number_of_invoices, start_position, last_invoice)
-                )
-                payment_feed.start(
-                    response.headers["X-LAST"], len(feed_response["Payments"])
-                )
-                error = False
-                for payment in feed_response["Payments"]:
-                    self.logger.debug("Feed handling : %s" % payment)
-                    error = payment_feed.payment(Event(**payment))
-                    if error:
-                        break
-                if error:
-                    self.logger.debug("Error while handing payment, stopping")
-                    break
-                response = requests.get(
-                    url=url,
-                    headers=self.client.headers(),
-                    timeout=15,
-                )
-                if "ApiErrorCode" in response.headers:
-                    raise self.client.raise_error("Feed payment", response)
-                feed_response = response.json()
-            self.logger.debug("Done handing payment feed")
-        except requests.exceptions.RequestException as e:
-            raise self.client.raise_error_from_request("Payment feed", e)
+        parse_timestamp = self.client.parse_timestamp
+        return FeedEngine(
+            self.client, "invoice.payment", url, "Payments",
+            lambda feed, payment: feed.payment(payment), "Payment feed", self.logger,
+            decode=lambda payment: Event.from_dict(payment, parse_timestamp),
+        )
 
@@ -0,0 +1,62 @@
+import itertools
+import json
+import logging
+import re
+
+_IBAN = re.compile(r"\b[A-Z]{2}\d{2}(?: ?[A-Z0-9]){10,30}\b")
+_EMAIL = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+_SENSITIVE_KEYS = {"iban", "dbtracct", "email", "emailadr", "mobile", "cc"}
+
+
+def redact(value):
+    """
+    Mask the IBANs and email addresses in a (nested) payload
+    """
+    if isinstance(value, dict):
+        return {
+            k: "***" if isinstance(k, str) and k.lower() in _SENSITIVE_KEYS and value[k] else redact(value[k])
+            for k in value
+        }
+    if isinstance(value, (list, tuple)):
+        return [redact(v) for v in value]
+    if isinstance(value, str):
+        return _EMAIL.sub("***@***", _IBAN.sub("***", value))
+    return value
+
+
+class PayloadLogging(object):
+    """
+    Controls how request and feed payloads are logged on debug level. Payloads are only
+    formatted when debug logging is enabled for the logger and the item is sampled.
+
+    Attributes:
+        sample_every (int): only log 1 out of every n payloads
+        max_length (int): truncate the logged payload after this number of characters (0 to disable)
+        redact (bool): mask IBANs and email addresses
+        structured (bool): also pass the (redacted) payload as 'twikey_payload' in the extra of the log record
+    """
+
+    __slots__ = ["sample_every", "max_length", "redact", "structured", "_counter"]
+
+    def __init__(self, sample_every=1, max_length=1000, redact=True, structured=False) -> None:
+        self.sample_every = max(1, sample_every)
+        self.max_length = max_length
+        self.redact = redact
+        self.structured = structured
+        self._counter = itertools.count()
+
+    def log(self, logger: logging.Logger, msg: str, payload):
+        """
+        Log the payload with the message on debug level, if enabled and sampled
+        """
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
+        if self.sample_every > 1 and next(self._counter) % self.sample_every:
+            return
+        if self.redact:
+            payload = redact(payload)
+        text = json.dumps(payload, default=str) if isinstance(payload, (dict, list)) else str(payload)
+        if self.max_length and len(text) > self.max_length:
+            text = "%s...(%d chars)" % (text[:self.max_length], len(text))
+        extra = {"twikey_payload": payload} if self.structured else None
+        logger.debug("%s : %s", msg, text, extra=extra)
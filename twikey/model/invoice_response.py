@@ -1,4 +1,5 @@
 from datetime import datetime
+from decimal import Decimal
 from typing import Dict, Any
 
 class PaymentEvent:
@@ -169,6 +170,10 @@ class Origin:
         self.number = number
         self.ref = ref
 
+    @classmethod
+    def from_dict(cls, raw: dict) -> "Origin":
+        return cls(raw.get("object"), raw.get("id"), raw.get("number"), raw.get("ref"))
+
 class Gateway:
     __slots__ = ("id", "name", "type", "iban")
 
@@ -178,6 +183,10 @@ class Gateway:
         self.type = type
         self.iban = iban
 
+    @classmethod
+    def from_dict(cls, raw: dict) -> "Gateway":
+        return cls(raw.get("id"), raw.get("name"), raw.get("type"), raw.get("iban"))
+
 class EventError:
     __slots__ = (
         "code",
@@ -204,19 +213,72 @@ class EventError:
         self.action = action
         self.actionStep = actionStep
 
+    @classmethod
+    def from_dict(cls, raw: dict) -> "EventError":
+        return cls(
+            raw.get("code"),
+            raw.get("description"),
+            raw.get("category"),
+            raw.get("externalCode"),
+            raw.get("action"),
+            raw.get("actionStep"),
+        )
+
+class _Nested:
+    """
+    Attribute holding a nested model, built from the raw dict on first access
+    """
+
+    def __init__(self, model):
+        self.model = model
+
+    def __set_name__(self, owner, name):
+        self.slot = "_" + name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        value = getattr(instance, self.slot)
+        if isinstance(value, dict):
+            value = self.model.from_dict(value)
+            setattr(instance, self.slot, value)
+        return value
+
+    def __set__(self, instance, value):
+        setattr(instance, self.slot, value)
+
 class Event:
+    """
+    Represents a single event of the payment feed.
+
+    Attributes:
+        eventId (str): Unique identifier of the event.
+        eventType (str): Type of the event (eg. 'payment' or 'payment_fail').
+        occurredAt (datetime): When the event occurred.
+        amount (int): Amount in cents.
+        currency (str): Currency of the amount.
+        origin (Origin): The object (eg. invoice) the payment is for.
+        gateway (Gateway): The gateway the payment was received through.
+        details (dict): Details depending on the type of event.
+        error (EventError, optional): Why the payment failed.
+    """
+
     __slots__ = (
         "eventId",
         "eventType",
         "occurredAt",
         "amount",
         "currency",
-        "origin",
-        "gateway",
+        "_origin",
+        "_gateway",
         "details",
-        "error",
+        "_error",
     )
 
+    origin = _Nested(Origin)
+    gateway = _Nested(Gateway)
+    error = _Nested(EventError)
+
     def __init__(
             self,
             eventId: str,
@@ -239,6 +301,37 @@ class Event:
         self.details = details
         self.error = error
 
+    @classmethod
+    def from_dict(cls, raw: dict, parse_timestamp=None) -> "Event":
+        """
+        Build the event from an item of the payment feed, ignoring unknown fields. Origin, gateway and error
+        are only built when accessed.
+
+        :param raw: the item as returned by Twikey
+        :param parse_timestamp: Optional function parsing occurredAt (eg. twikey.timestamps.parse_timestamp)
+        """
+        event = cls.__new__(cls)
+        get = raw.get
+        event.eventId = get("eventId")
+        event.eventType = get("eventType")
+        occurred_at = get("occurredAt")
+        event.occurredAt = parse_timestamp(occurred_at) if parse_timestamp else occurred_at
+        event.amount = _cents(get("amount"))
+        event.currency = get("currency")
+        event._origin = get("origin")
+        event._gateway = get("gateway")
+        event.details = get("details")
+        event._error = get("error")
+        return event
+
+
+def _cents(amount):
+    # the amount of an event is in cents, an amount sent in euro (eg. 12.5) is converted
+    if amount is None or isinstance(amount, int):
+        return amount
+    return int(round(Decimal(str(amount)) * 100))
+
+
 class PaymentFeed:
     def start(self, position: str, lenght: int):
         """
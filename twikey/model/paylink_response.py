@@ -38,9 +38,13 @@ class MetaInfo:
 class TimeInfo:
     __slots__ = ["creation", "expiration", "lastupdate"]
 
-    def __init__(self, raw: dict):
+    def __init__(self, raw: dict, parse_timestamp=None):
+        """
+        :param parse_timestamp: Optional function parsing the timestamps (eg. twikey.timestamps.parse_timestamp)
+        """
         for key in self.__slots__:
-            setattr(self, key, raw.get(key))
+            value = raw.get(key)
+            setattr(self, key, parse_timestamp(value) if parse_timestamp else value)
 
 class Paylink:
     """
@@ -49,17 +53,28 @@ class Paylink:
 
     __slots__ = ["id", "ct", "amount", "msg", "ref", "state", "customer", "meta", "time"]
 
-    def __init__(self, raw: dict):
+    def __init__(self, raw: dict, parse_timestamp=None):
+        """
+        :param parse_timestamp: Optional function parsing the timestamps in time (eg. twikey.timestamps.parse_timestamp)
+        """
         for key in ["id", "ct", "amount", "msg", "ref", "state"]:
             setattr(self, key, raw.get(key))
         self.customer = CustomerInfo(raw["customer"]) if "customer" in raw else None
         self.meta = MetaInfo(raw["meta"]) if "meta" in raw else None
-        self.time = TimeInfo(raw["time"]) if "time" in raw else None
+        self.time = TimeInfo(raw["time"], parse_timestamp) if "time" in raw else None
 
     def __str__(self):
         return f"Paylink ID: {self.id}, Ref: {self.ref}, Amount: {self.amount}, State: {self.state}"
 
 class PaylinkFeed:
+    def start(self, position: str, number_of_updates: int):
+        """
+        Allow storing the start of the feed
+        :param position: position where the feed started returned by the 'X-LAST' header
+        :param number_of_updates: number of items in the feed
+        """
+        pass
+
     def paylink(self, paylink:Paylink) -> bool:
         """
         Custom logic for handeling the paylinks gained from the api call
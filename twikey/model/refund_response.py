@@ -79,6 +79,14 @@ class GetbeneficiarieResponse:
 
 
 class RefundFeed:
+    def start(self, position: str, number_of_updates: int):
+        """
+        Allow storing the start of the feed
+        :param position: position where the feed started returned by the 'X-LAST' header
+        :param number_of_updates: number of items in the feed
+        """
+        pass
+
     def refund(self, refund: Refund):
         """
         :refund: – Class object containing
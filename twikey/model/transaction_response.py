@@ -10,9 +10,15 @@ class Transaction:
         "reqcolldt", "admincharge", "final", "bkerror", "bkmsg", "bkdate", "lastupdate", "collection", "link"
     ]
 
-    def __init__(self, raw: dict):
+    def __init__(self, raw: dict, parse_timestamp=None):
+        """
+        :param parse_timestamp: Optional function parsing bkdate and lastupdate (eg. twikey.timestamps.parse_timestamp)
+        """
         for key in self.__slots__:
             setattr(self, key, raw.get(key))
+        if parse_timestamp:
+            self.bkdate = parse_timestamp(self.bkdate)
+            self.lastupdate = parse_timestamp(self.lastupdate)
 
     def is_paid(self):
         """
@@ -27,6 +33,14 @@ class Transaction:
         return f"Transaction ID: {self.id}, Amount: {self.amount}, State: {self.state}"
 
 class TransactionFeed:
+    def start(self, position: str, number_of_updates: int):
+        """
+        Allow storing the start of the feed
+        :param position: position where the feed started returned by the 'X-LAST' header
+        :param number_of_updates: number of items in the feed
+        """
+        pass
+
     def transaction(self, transaction: Transaction):
         """
         Handle a transaction from the feed.
@@ -44,8 +58,8 @@ class TransactionStatusResponse:
 
     __slots__ = ["entries"]
 
-    def __init__(self, raw: dict):
-        self.entries = [Transaction(entry) for entry in raw.get("Entries", [])]
+    def __init__(self, raw: dict, parse_timestamp=None):
+        self.entries = [Transaction(entry, parse_timestamp) for entry in raw.get("Entries", [])]
 
     def __str__(self):
         return "\n".join(str(entry) for entry in self.entries)
@@ -0,0 +1,360 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from .client import TwikeyError
+
+PENDING = "pending"
+SENDING = "sending"
+DONE = "done"
+FAILED = "failed"
+
+# operations that can be sent through the outbox, mapped on the service and method handling them
+OPERATIONS = {
+    "document.create": ("document", "create"),
+    "invoice.create": ("invoice", "create"),
+    "transaction.create": ("transaction", "create"),
+    "refund.create": ("refund", "create"),
+    "paylink.create": ("paylink", "create"),
+}
+
+# errors raised by the client itself before reaching Twikey
+_RETRYABLE_CODES = {"CircuitOpen", "DeadlineExceeded"}
+
+
+class Outbox(object):
+    """
+    Durable outbox for the creation of mandates, invoices, transactions, refunds and paylinks.
+
+    Writes are stored in a local sqlite journal and sent by a background sender with a number of parallel
+    workers, retrying with exponential backoff when the call failed due to the network or an unavailable api.
+    Entries are marked done once Twikey accepted them, so after a crash the remaining entries are sent on the
+    next start. Entries that were being sent during a crash are sent again, so prefer writes that Twikey can
+    recognise as duplicates (eg. invoices with an id or transactions with a ref).
+
+    Sample usage
+
+        outbox = Outbox(twikey_client, "twikey-outbox.db")
+        outbox.start()
+        for invoice in invoices:
+            outbox.enqueue("invoice.create", invoice)
+        outbox.flush()
+        outbox.stop()
+    """
+
+    def __init__(
+        self,
+        client,
+        path,
+        workers=4,
+        max_attempts=5,
+        backoff=1.0,
+        on_done=None,
+        on_failed=None,
+    ) -> None:
+        """
+        :param client: the TwikeyClient sending the writes
+        :param path: path of the sqlite journal
+        :param workers: number of writes sent in parallel
+        :param max_attempts: number of attempts before an entry is marked failed
+        :param backoff: seconds to wait before the first retry, doubled for every next attempt
+        :param on_done: Optional callback(entry_id, operation, result) called once an entry was sent
+        :param on_failed: Optional callback(entry_id, operation, error) called once an entry failed permanently
+        """
+        self.client = client
+        self.path = path
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.on_done = on_done
+        self.on_failed = on_failed
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._in_flight = 0
+        self._thread = None
+        self._executor = None
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS twikey_outbox ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, operation TEXT NOT NULL, payload TEXT NOT NULL, "
+            "options TEXT, state TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, last_error TEXT, "
+            "created REAL NOT NULL, next_attempt REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS twikey_outbox_state ON twikey_outbox (state, next_attempt)"
+        )
+
+    def enqueue(self, operation: str, request, **options) -> int:
+        """
+        Store a write to be sent in the background
+
+        :param operation: one of 'document.create', 'invoice.create', 'transaction.create', 'refund.create'
+                          or 'paylink.create'
+        :param request: the request as it would be passed to the service
+        :param options: extra keyword arguments of the service method (eg. manual=True for invoice.create)
+        :return: id of the entry
+        """
+        return self.enqueue_many(operation, [request], **options)[0]
+
+    def enqueue_many(self, operation: str, requests_, **options) -> list:
+        """
+        Store several writes of the same operation in a single transaction
+        :return: ids of the entries
+        """
+        if operation not in OPERATIONS:
+            raise ValueError("Unsupported operation %s" % operation)
+        now = time.time()
+        encoded_options = json.dumps(options) if options else None
+        ids = []
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                for request in requests_:
+                    cursor = self._db.execute(
+                        "INSERT INTO twikey_outbox (operation, payload, options, state, created, next_attempt) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (
+                            operation,
+                            json.dumps(request.to_request(), default=str),
+                            encoded_options,
+                            PENDING,
+                            now,
+                            now,
+                        ),
+                    )
+                    ids.append(cursor.lastrowid)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        self._wakeup.set()
+        return ids
+
+    def start(self):
+        """
+        Start the background sender, entries interrupted by a previous crash are sent again
+        """
+        if self._thread is not None:
+            return
+        with self._lock:
+            self._db.execute(
+                "UPDATE twikey_outbox SET state = ? WHERE state = ?", (PENDING, SENDING)
+            )
+        self._stopping.clear()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="twikey-outbox"
+        )
+        self._thread = threading.Thread(
+            target=self._run, name="twikey-outbox", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, wait=True):
+        """
+        Stop the background sender, entries not sent yet remain in the journal
+        """
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    def flush(self, timeout=None) -> bool:
+        """
+        Wait until all entries were sent (or failed permanently)
+        :return: False if entries remain after the timeout
+        """
+        end = None if timeout is None else time.monotonic() + timeout
+        while self.counts().get(PENDING, 0) + self.counts().get(SENDING, 0) > 0:
+            if end is not None and time.monotonic() > end:
+                return False
+            self._wakeup.set()
+            time.sleep(0.05)
+        return True
+
+    def counts(self) -> dict:
+        """
+        :return: number of entries per state (pending, sending, done, failed)
+        """
+        with self._lock:
+            return dict(
+                self._db.execute(
+                    "SELECT state, count(*) FROM twikey_outbox GROUP BY state"
+                ).fetchall()
+            )
+
+    def failed(self) -> list:
+        """
+        :return: list of (id, operation, payload, last_error) of the entries that failed permanently
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, operation, payload, last_error FROM twikey_outbox WHERE state = ?",
+                (FAILED,),
+            ).fetchall()
+        return [(row[0], row[1], json.loads(row[2]), row[3]) for row in rows]
+
+    def retry_failed(self) -> int:
+        """
+        Send the failed entries again
+        :return: number of entries rescheduled
+        """
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE twikey_outbox SET state = ?, attempts = 0, next_attempt = ? WHERE state = ?",
+                (PENDING, time.time(), FAILED),
+            )
+        self._wakeup.set()
+        return cursor.rowcount
+
+    def purge_done(self) -> int:
+        """
+        Remove the entries that were sent from the journal
+        """
+        with self._lock:
+            return self._db.execute(
+                "DELETE FROM twikey_outbox WHERE state = ?", (DONE,)
+            ).rowcount
+
+    def close(self):
+        self.stop()
+        self._db.close()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            for entry in self._claim(self.workers - self._in_flight):
+                with self._lock:
+                    self._in_flight += 1
+                self._executor.submit(self._send, *entry)
+            self._wakeup.wait(timeout=self._next_wakeup())
+            self._wakeup.clear()
+
+    def _claim(self, limit) -> list:
+        if limit <= 0:
+            return []
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._db.execute(
+                    "SELECT id, operation, payload, options, attempts FROM twikey_outbox "
+                    "WHERE state = ? AND next_attempt <= ? ORDER BY id LIMIT ?",
+                    (PENDING, time.time(), limit),
+                ).fetchall()
+                self._db.executemany(
+                    "UPDATE twikey_outbox SET state = ? WHERE id = ?",
+                    [(SENDING, row[0]) for row in rows],
+                )
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+        return rows
+
+    def _next_wakeup(self) -> float:
+        if self._in_flight >= self.workers:
+            return 1.0
+        with self._lock:
+            row = self._db.execute(
+                "SELECT min(next_attempt) FROM twikey_outbox WHERE state = ?",
+                (PENDING,),
+            ).fetchone()
+        if row[0] is None:
+            return 1.0
+        return min(1.0, max(0.0, row[0] - time.time()))
+
+    def _send(self, entry_id, operation, payload, options, attempts):
+        try:
+            service_name, method_name = OPERATIONS[operation]
+            method = getattr(getattr(self.client, service_name), method_name)
+            result = method(
+                _StoredRequest(json.loads(payload)),
+                **(json.loads(options) if options else {})
+            )
+        except Exception as e:
+            self._failed(entry_id, operation, attempts + 1, e)
+        else:
+            self._update(
+                "UPDATE twikey_outbox SET state = ?, attempts = ? WHERE id = ?",
+                (DONE, attempts + 1, entry_id),
+            )
+            if self.on_done:
+                self.on_done(entry_id, operation, result)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._wakeup.set()
+
+    def _failed(self, entry_id, operation, attempts, error):
+        if _retryable(error) and attempts < self.max_attempts:
+            delay = self.backoff * 2 ** (attempts - 1)
+            self.logger.warning(
+                "Sending %s #%d failed, retrying in %.1fs: %s",
+                operation,
+                entry_id,
+                delay,
+                error,
+            )
+            self._update(
+                "UPDATE twikey_outbox SET state = ?, attempts = ?, last_error = ?, next_attempt = ? WHERE id = ?",
+                (PENDING, attempts, str(error), time.time() + delay, entry_id),
+            )
+            return
+        self.logger.error("Sending %s #%d failed: %s", operation, entry_id, error)
+        self._update(
+            "UPDATE twikey_outbox SET state = ?, attempts = ?, last_error = ? WHERE id = ?",
+            (FAILED, attempts, str(error), entry_id),
+        )
+        if self.on_failed:
+            self.on_failed(entry_id, operation, error)
+
+    def _update(self, sql, params):
+        with self._lock:
+            self._db.execute(sql, params)
+
+
+class _StoredRequest(object):
+    """
+    Request replayed from the journal, its payload is already in the format sent to Twikey
+    """
+
+    __slots__ = ["payload"]
+
+    def __init__(self, payload: dict):
+        self.payload = payload
+
+    def to_request(self) -> dict:
+        return self.payload
+
+
+def _retryable(error) -> bool:
+    if not isinstance(error, TwikeyError):
+        # eg. a request that can't be sent as is, sending it again won't help
+        return False
+    status = error.status
+    if (
+        status is None
+        and isinstance(error.error, requests.exceptions.HTTPError)
+        and error.error.response is not None
+    ):
+        # raised by raise_for_status()
+        status = error.error.response.status_code
+    if status is not None:
+        # the api is unavailable or overloaded, other errors returned by the api are final
+        return status >= 500 or status == 429
+    # transport errors carry the original exception
+    return (
+        isinstance(error.error, requests.exceptions.RequestException)
+        or error.error_code in _RETRYABLE_CODES
+    )
@@ -1,5 +1,6 @@
 import requests
 
+from .feed import FeedEngine
 from .model.paylink_request import PaymentLinkRequest, PaymentLinkStatusRequest, PaymentLinkRefundRequest
 from .model.paylink_response import CreatedPaylinkResponse, Paylink, PaylinkFeed
 
@@ -34,11 +35,11 @@ class PaylinkService(object):
         data = request.to_request()
         try:
             self.client.refresh_token_if_required()
-            response = requests.post(
+            response = self.client.session.post(
                 url=url,
                 data=data,
                 headers=self.client.headers(),
-                timeout=15,
+                timeout=self.client.timeout("paylink.create"),
             )
             if "ApiErrorCode" in response.headers:
                 raise self.client.raise_error("Create paylink", response)
@@ -68,18 +69,22 @@ class PaylinkService(object):
 
         params = request.to_request()
         url = self.client.instance_url("/payment/link")
-        try:
-            self.client.refresh_token_if_required()
-            headers = self.client.headers("application/json")
-            response = requests.get(url=url, params=params, headers=headers, timeout=15)
-            if response.status_code != 200:
-                raise self.client.raise_error("Transaction detail", response)
-            _links = response.json()["Links"]
-            if len(_links) > 0:
-                return Paylink(_links[0])
-            raise self.client.raise_error("Missing link")
-        except requests.exceptions.RequestException as e:
-            raise self.client.raise_error_from_request("Transaction detail", e)
+
+        def status_details():
+            try:
+                self.client.refresh_token_if_required()
+                headers = self.client.headers("application/json")
+                response = self.client.session.get(url=url, params=params, headers=headers, timeout=self.client.timeout("paylink.status_details"))
+                if response.status_code != 200:
+                    raise self.client.raise_error("Transaction detail", response)
+                _links = response.json()["Links"]
+                if len(_links) > 0:
+                    return Paylink(_links[0], self.client.parse_timestamp)
+                raise self.client.raise_error("Missing link")
+            except requests.exceptions.RequestException as e:
+                raise self.client.raise_error_from_request("Transaction detail", e)
+
+        return self.client.coalesce(url, params, status_details)
 
     def refund(self, request: PaymentLinkRefundRequest) -> Paylink:
         """
@@ -104,11 +109,11 @@ class PaylinkService(object):
         url = self.client.instance_url("/payment/link/refund")
         try:
             self.client.refresh_token_if_required()
-            response = requests.post(url=url, data=data, headers=self.client.headers(), timeout=15)
+            response = self.client.session.post(url=url, data=data, headers=self.client.headers(), timeout=self.client.timeout("paylink.refund"))
             response.raise_for_status()
             if "ApiErrorCode" in response.headers:
                 raise self.client.raise_error("Update transaction", response)
-            return Paylink(response.json())
+            return Paylink(response.json(), self.client.parse_timestamp)
         except requests.exceptions.RequestException as e:
             raise self.client.raise_error_from_request("Update transaction", e)
 
@@ -135,14 +140,14 @@ class PaylinkService(object):
         url = self.client.instance_url(f"/payment/link?id={link_id}")
         try:
             self.client.refresh_token_if_required()
-            response = requests.delete(url=url, headers=self.client.headers(), timeout=15)
+            response = self.client.session.delete(url=url, headers=self.client.headers(), timeout=self.client.timeout("paylink.remove"))
             response.raise_for_status()
             if "ApiErrorCode" in response.headers:
                 raise self.client.raise_error("Update transaction", response)
         except requests.exceptions.RequestException as e:
             raise self.client.raise_error_from_request("Update transaction", e)
 
-    def feed(self, paylink_feed: PaylinkFeed):
+    def feed(self, paylink_feed: PaylinkFeed, start_position=False):
         """
         See https://www.twikey.com/api/#paymentlink-feed
 
@@ -156,39 +161,42 @@ class PaylinkService(object):
         Args:
             paylink_feed (PaylinkFeed): Custom handler class with methods for processing
                 new, updated, or cancelled paylink events.
+            start_position (str): Optional position (eg. the value returned by a previous run) to resume after.
 
         Returns:
-            None
+            str: Position of the last page handled.
 
         Raises:
             Exception: If the request to the feed endpoint fails or response is invalid.
         """
 
-        url = self.client.instance_url("/payment/link/feed")
-        try:
-            self.client.refresh_token_if_required()
-            response = requests.get(
-                url=url,
-                headers=self.client.headers(),
-                timeout=15,
-            )
-            if "ApiErrorCode" in response.headers:
-                raise self.client.raise_error("Feed paylink", response)
-            feed_response = response.json()
-            while len(feed_response["Links"]) > 0:
-                error = False
-                for msg in feed_response["Links"]:
-                    error = paylink_feed.paylink(Paylink(msg))
-                if error:
-                    break
-                response = requests.get(
-                    url=url,
-                    headers=self.client.headers(),
-                    timeout=15,
-                )
-                if "ApiErrorCode" in response.headers:
-                    raise self.client.raise_error("Feed paylink", response)
-                feed_response = response.json()
-        except requests.exceptions.RequestException as e:
-            raise self.client.raise_error_from_request("Feed paylink", e)
+        return self.feed_engine().run(paylink_feed, start_position)
+
+    def tail(self, paylink_feed: PaylinkFeed, start_position=False, min_interval=1.0, max_interval=60.0):
+        """
+        Keeps reading the paylink feed like feed(), polling for new items once it's read until the end,
+        see FeedEngine.tail(). Use feed_engine().tail() to wake or stop it from another thread.
+
+        Args:
+            paylink_feed (PaylinkFeed): Custom handler class, see feed().
+            start_position (str): Optional position (eg. the value returned by a previous run) to resume after.
+            min_interval (float): Seconds between polls right after items were handled.
+            max_interval (float): Maximum seconds between polls while the feed remains empty.
+
+        Returns:
+            str: Position of the last page handled, once the handler asked to stop.
+        """
+
+        return self.feed_engine().tail(paylink_feed, start_position, min_interval, max_interval)
 
+    def feed_engine(self) -> FeedEngine:
+        """
+        :return: the engine reading the paylink feed, see feed()
+        """
+        url = self.client.instance_url("/payment/link/feed")
+        parse_timestamp = self.client.parse_timestamp
+        return FeedEngine(
+            self.client, "paylink.feed", url, "Links",
+            lambda feed, paylink: feed.paylink(paylink), "Feed paylink",
+            decode=lambda paylink: Paylink(paylink, parse_timestamp),
+        )
@@ -0,0 +1,204 @@
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from http.cookiejar import DefaultCookiePolicy
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .client import TwikeyClient, TwikeyError
+
+
+class TwikeyClientPool(object):
+    """
+    Pool of TwikeyClients for platforms handling many merchants, keyed by api key.
+
+    All clients share a single HTTP connection pool, logins are staggered by giving every
+    client a slightly different token lifetime, the number of concurrent calls per merchant
+    is limited and clients that haven't been used for a while are evicted.
+
+    Sample usage
+
+        pool = TwikeyClientPool("https://api.twikey.com/creditor")
+        with pool.client(merchant_api_key) as twikey_client:
+            twikey_client.invoice.create(...)
+    """
+
+    def __init__(
+        self,
+        base_url="https://api.twikey.com/creditor",
+        user_agent="twikey-python/v0.1.0",
+        max_connections=100,
+        max_per_tenant=4,
+        idle_timeout=15 * 60,
+        refresh_jitter=30 * 60,
+        session=None,
+        token_store=None,
+        http2=False,
+        scheduler=None,
+    ) -> None:
+        """
+        :param max_connections: size of the shared connection pool
+        :param max_per_tenant: maximum number of concurrent calls per api key
+        :param idle_timeout: seconds after which an unused client is evicted
+        :param refresh_jitter: maximum number of seconds a token is refreshed early to spread the logins
+        :param session: Optional requests.Session to share, by default one is created
+        :param token_store: Optional TokenStore allowing the tokens to be reused across processes
+        :param http2: multiplex the calls of all merchants over HTTP/2 connections (requires httpx[http2])
+        :param scheduler: Optional RequestScheduler shared by all merchants, prioritising interactive calls
+                          and letting merchants take turns
+        """
+        self.base_url = base_url
+        self.user_agent = user_agent
+        self.max_per_tenant = max_per_tenant
+        self.idle_timeout = idle_timeout
+        self.refresh_jitter = refresh_jitter
+        self.session = session or self._create_session(max_connections, http2)
+        self.token_store = token_store
+        self.scheduler = scheduler
+        self.logger = logging.getLogger(__name__)
+        self._tenants = {}
+        self._lock = threading.Lock()
+        self._last_eviction = time.monotonic()
+
+    @staticmethod
+    def _create_session(max_connections, http2):
+        if http2:
+            from .transport import Http2Session
+
+            return Http2Session(max_connections=max_connections)
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_connections)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        # never leak cookies of one merchant into the calls of another
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        return session
+
+    def get(self, api_key, private_key=None) -> TwikeyClient:
+        """
+        Return the client for this api key, creating it if required.
+        Note that this doesn't apply the concurrency limit, see client()
+        """
+        return self._tenant(api_key, private_key).client
+
+    @contextmanager
+    def client(self, api_key, private_key=None, timeout=None):
+        """
+        Borrow the client for this api key, waiting while the merchant already has
+        max_per_tenant calls in flight.
+
+        :param timeout: maximum number of seconds to wait for a free slot (None waits forever)
+        :raises TwikeyError: when no slot became available within the timeout
+        """
+        self._evict_if_due()
+        # counted as in use while waiting, so the tenant (and its semaphore) can't be evicted meanwhile
+        tenant = self._tenant(api_key, private_key, borrow=True)
+        if not tenant.semaphore.acquire(timeout=timeout):
+            with self._lock:
+                tenant.in_use -= 1
+            raise TwikeyError(
+                ctx="Pool",
+                error_code="Concurrency",
+                error="Too many concurrent calls for %s" % api_key[0:10],
+            )
+        try:
+            yield tenant.client
+        finally:
+            with self._lock:
+                tenant.in_use -= 1
+                tenant.last_used = time.monotonic()
+            tenant.semaphore.release()
+
+    def refresh_tokens(self, max_logins=None) -> int:
+        """
+        Log in again for all clients whose token expired, eg. from a background thread so
+        callers never pay for the login.
+
+        :param max_logins: limit the number of logins done in this call to spread them over time
+        :return: number of logins done
+        """
+        with self._lock:
+            clients = [
+                t.client for t in self._tenants.values() if t.client.token_expired()
+            ]
+        if max_logins is not None:
+            clients = clients[:max_logins]
+        for client in clients:
+            try:
+                client.refresh_token_if_required()
+            except TwikeyError as e:
+                self.logger.warning(
+                    "Unable to refresh token for %s: %s", client.api_key[0:10], e
+                )
+        return len(clients)
+
+    def evict_idle(self) -> int:
+        """
+        Remove the clients that weren't used during the last idle_timeout seconds
+
+        :return: number of evicted clients
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._last_eviction = now
+            idle = [
+                key
+                for key, tenant in self._tenants.items()
+                if tenant.in_use == 0 and now - tenant.last_used > self.idle_timeout
+            ]
+            for key in idle:
+                del self._tenants[key]
+        if idle:
+            self.logger.debug("Evicted %d idle clients", len(idle))
+        return len(idle)
+
+    def close(self):
+        with self._lock:
+            self._tenants.clear()
+        self.session.close()
+
+    def _evict_if_due(self):
+        if time.monotonic() - self._last_eviction > min(self.idle_timeout, 60):
+            self.evict_idle()
+
+    def _tenant(self, api_key, private_key, borrow=False):
+        with self._lock:
+            tenant = self._tenants.get(api_key)
+            if tenant is None:
+                client = TwikeyClient(
+                    api_key,
+                    self.base_url,
+                    user_agent=self.user_agent,
+                    private_key=private_key,
+                    session=self.session,
+                    token_store=self.token_store,
+                    scheduler=self.scheduler,
+                )
+                client.token_lifetime = TwikeyClient.token_lifetime - random.uniform(
+                    0, self.refresh_jitter
+                )
+                tenant = _Tenant(client, self.max_per_tenant)
+                self._tenants[api_key] = tenant
+            tenant.last_used = time.monotonic()
+            if borrow:
+                tenant.in_use += 1
+            return tenant
+
+    def __len__(self):
+        return len(self._tenants)
+
+    def __contains__(self, api_key):
+        return api_key in self._tenants
+
+
+class _Tenant(object):
+    __slots__ = ["client", "semaphore", "in_use", "last_used"]
+
+    def __init__(self, client, max_concurrent):
+        self.client = client
+        self.semaphore = threading.BoundedSemaphore(max_concurrent)
+        self.in_use = 0
+        self.last_used = time.monotonic()
@@ -1,5 +1,6 @@
 import requests
 
+from .feed import FeedEngine
 from .model.refund_request import NewBeneficiaryRequest, DisableBeneficiaryRequest, NewRefundRequest, \
     NewRefundBatchRequest
 from .model.refund_response import Refund, RefundBatch, GetbeneficiarieResponse, RefundFeed, Beneficiary
@@ -35,11 +36,11 @@ class RefundService(object):
         data = request.to_request()
         try:
             self.client.refresh_token_if_required()
-            response = requests.post(
+            response = self.client.session.post(
                 url=url,
                 data=data,
                 headers=self.client.headers(),
-                timeout=15,
+                timeout=self.client.timeout("refund.create_beneficiary_account"),
             )
             if "ApiErrorCode" in response.headers:
                 raise self.client.raise_error("Create beneficiary", response)
@@ -72,11 +73,11 @@ class RefundService(object):
         data = request.to_request()
         try:
             self.client.refresh_token_if_required()
-            response = requests.post(
+            response = self.client.session.post(
                 url=url,
                 data=data,
                 headers=self.client.headers(),
-                timeout=15,
+                timeout=self.client.timeout("refund.create"),
             )
             if "ApiErrorCode" in response.headers:
                 raise self.client.raise_error("Create refund", response)
@@ -107,18 +108,22 @@ class RefundService(object):
         """
 
         url = self.client.instance_url("/transfer/detail")
-        try:
-            self.client.refresh_token_if_required()
-            headers = self.client.headers("application/json")
-            response = requests.get(url=url, params={"id": refund_id}, headers=headers, timeout=15)
-            if response.status_code != 200:
-                raise self.client.raise_error("Transfer detail", response)
-            _links = response.json()["Entries"]
-            if _links and len(_links) > 0:
-                return Refund(_links[0])
-            raise self.client.raise_error("Missing entry")
-        except requests.exceptions.RequestException as e:
-            raise self.client.raise_error_from_request("Transaction detail", e)
+
+        def details():
+            try:
+                self.client.refresh_token_if_required()
+                headers = self.client.headers("application/json")
+                response = self.client.session.get(url=url, params={"id": refund_id}, headers=headers, timeout=self.client.timeout("refund.details"))
+                if response.status_code != 200:
+                    raise self.client.raise_error("Transfer detail", response)
+                _links = response.json()["Entries"]
+                if _links and len(_links) > 0:
+                    return Refund(_links[0])
+                raise self.client.raise_error("Missing entry")
+            except requests.exceptions.RequestException as e:
+                raise self.client.raise_error_from_request("Transaction detail", e)
+
+        return self.client.coalesce(url, {"id": refund_id}, details)
 
     def remove(self, refund_id: str):
         """
@@ -143,7 +148,7 @@ class RefundService(object):
         url = self.client.instance_url(f"/transfer?id={refund_id}")
         try:
             self.client.refresh_token_if_required()
-            response = requests.delete(url=url, headers=self.client.headers(), timeout=15)
+            response = self.client.session.delete(url=url, headers=self.client.headers(), timeout=self.client.timeout("refund.remove"))
             response.raise_for_status()
             if "ApiErrorCode" in response.headers:
                 raise self.client.raise_error("Remove Refund", response)
@@ -175,11 +180,11 @@ class RefundService(object):
         data = request.to_request()
         try:
             self.client.refresh_token_if_required()
-            response = requests.post(
+            response = self.client.session.post(
                 url=url,
                 data=data,
                 headers=self.client.headers(),
-                timeout=15,
+                timeout=self.client.timeout("refund.create_batch"),
             )
             if "ApiErrorCode" in response.headers:
                 raise self.client.raise_error("Create batch refunds", response)
@@ -212,11 +217,11 @@ class RefundService(object):
         data = request.to_request()
         try:
             self.client.refresh_token_if_required()
-            response = requests.get(
+            response = self.client.session.get(
                 url=url,
                 params=data,
                 headers=self.client.headers(),
-                timeout=15,
+                timeout=self.client.timeout("refund.batch_detail"),
             )
             if "ApiErrorCode" in response.headers:
                 raise self.client.raise_error("Batch detail", response)
@@ -246,10 +251,10 @@ class RefundService(object):
         url = self.client.instance_url("/transfers/beneficiaries")
         try:
             self.client.refresh_token_if_required()
-            response = requests.get(
+            response = self.client.session.get(
                 url=url,
                 headers=self.client.headers(),
-                timeout=15,
+                timeout=self.client.timeout("refund.get_beneficiary_accounts"),
             )
             if "ApiErrorCode" in response.headers:
                 raise self.client.raise_error("get beneficiaries", response)
@@ -280,17 +285,17 @@ class RefundService(object):
         url = self.client.instance_url(f"/transfers/beneficiaries/{request.iban}?customerNumber={request.customer_number}")
         try:
             self.client.refresh_token_if_required()
-            response = requests.delete(
+            response = self.client.session.delete(
                 url=url,
                 headers=self.client.headers(),
-                timeout=15,
+                timeout=self.client.timeout("refund.disable_beneficiary_accounts"),
             )
             if "ApiErrorCode" in response.headers:
                 raise self.client.raise_error("disable beneficiaries", response)
         except requests.exceptions.RequestException as e:
             raise self.client.raise_error_from_request("disable beneficiaries", e)
 
-    def feed(self, refund_feed: RefundFeed):
+    def feed(self, refund_feed: RefundFeed, start_position=False):
         """
         See https://www.twikey.com/api/#get-credit-transfer-feed
 
@@ -304,36 +309,46 @@ class RefundService(object):
         Args:
             refund_feed (RefundFeed): Custom handler class with methods for processing
                 new, updated, or cancelled refund events.
+            start_position (str): Optional position (eg. the value returned by a previous run) to resume after.
 
         Returns:
-            None
+            str: Position of the last page handled.
 
         Raises:
             Exception: If the request to the feed endpoint fails or response is invalid.
         """
 
+        return self.feed_engine().run(refund_feed, start_position)
+
+    def tail(self, refund_feed: RefundFeed, start_position=False, min_interval=1.0, max_interval=60.0):
+        """
+        Keeps reading the refund feed like feed(), polling for new items once it's read until the end,
+        see FeedEngine.tail(). Use feed_engine().tail() to wake or stop it from another thread.
+
+        Args:
+            refund_feed (RefundFeed): Custom handler class, see feed().
+            start_position (str): Optional position (eg. the value returned by a previous run) to resume after.
+            min_interval (float): Seconds between polls right after items were handled.
+            max_interval (float): Maximum seconds between polls while the feed remains empty.
+
+        Returns:
+            str: Position of the last page handled, once the handler asked to stop.
+        """
+
+        return self.feed_engine().tail(refund_feed, start_position, min_interval, max_interval)
+
+    def feed_engine(self) -> FeedEngine:
+        """
+        :return: the engine reading the refund feed, see feed()
+        """
         url = self.client.instance_url("/transfer")
-        try:
-            self.client.refresh_token_if_required()
-            headers = self.client.headers()
-            response = requests.get(
-                url=url,
-                headers=headers,
-                timeout=15,
-            )
-            if "ApiErrorCode" in response.headers:
-                raise self.client.raise_error("Feed refunds", response)
-            feed_response = response.json()
-            while len(feed_response["Entries"]) > 0:
-                for msg in feed_response["Entries"]:
-                    refund_feed.refund(Refund(msg))
-                response = requests.get(
-                    url=url,
-                    headers=self.client.headers(),
-                    timeout=15,
-                )
-                if "ApiErrorCode" in response.headers:
-                    raise self.client.raise_error("Feed refunds", response)
-                feed_response = response.json()
-        except requests.exceptions.RequestException as e:
-            raise self.client.raise_error_from_request("Feed refunds", e)
+        return FeedEngine(
+            self.client, "refund.feed", url, "Entries",
+            _handle_refund, "Feed refunds", decode=Refund,
+        )
+
+
+def _handle_refund(refund_feed, refund) -> bool:
+    # unlike the other feeds, the value returned by the refund handler never stopped the feed
+    refund_feed.refund(refund)
+    return False
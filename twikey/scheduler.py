@@ -0,0 +1,215 @@
+import collections
+import contextvars
+import re
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from .client import TwikeyError
+from . import timeouts as _timeouts
+
+HIGH = "high"
+NORMAL = "normal"
+BULK = "bulk"
+PRIORITIES = (HIGH, NORMAL, BULK)
+
+# (method, path regex, priority) of the calls that aren't normal priority, the first match wins
+DEFAULT_PRIORITY_RULES = (
+    ("POST", r"/invite$", HIGH),
+    ("POST", r"/sign$", HIGH),
+    ("GET", r"/mandate/detail$", HIGH),
+    ("POST", r"/payment/link$", HIGH),
+    ("GET", r"/payment/link$", HIGH),
+    ("*", r"/invoice/bulk$", BULK),
+    ("POST", r"/collect(/import)?$", BULK),
+    ("POST", r"/reporting$", BULK),
+    ("GET", r"/(mandate|invoice|transaction|transfer)$", BULK),  # feeds
+    ("GET", r"/(invoice/payment|payment/link)/feed$", BULK),
+)
+
+_priority = contextvars.ContextVar("twikey_priority", default=None)
+
+
+@contextmanager
+def priority(name: str):
+    """
+    Send all calls made within this block (in this thread or context) with the given priority
+    """
+    if name not in PRIORITIES:
+        raise ValueError("Unknown priority %s" % name)
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class RequestScheduler(object):
+    """
+    Limits the number of concurrent calls, which can be shared by the clients of several merchants.
+
+    Calls are scheduled by priority: high (eg. checkout pages creating a paylink or mandate), normal and bulk
+    (feeds, bulk invoices, collections). A number of slots is reserved for high priority calls and a bulk call
+    only starts when no call of a higher priority is waiting. Within a priority, merchants take turns so a
+    single merchant can't starve the others.
+
+    Attributes:
+        max_concurrent (int): number of calls in flight
+        reserved_high (int): slots only available to high priority calls
+        max_bulk (int): Optional maximum number of bulk calls in flight
+        rules (tuple): (method, path regex, priority) deciding the priority of a call
+    """
+
+    def __init__(
+        self,
+        max_concurrent=16,
+        reserved_high=4,
+        max_bulk=None,
+        rules=DEFAULT_PRIORITY_RULES,
+    ) -> None:
+        if reserved_high >= max_concurrent:
+            raise ValueError("reserved_high should be lower than max_concurrent")
+        self.max_concurrent = max_concurrent
+        self.reserved_high = reserved_high
+        self.max_bulk = max_bulk
+        self.rules = [(method, re.compile(path), prio) for method, path, prio in rules]
+        self._in_flight = dict.fromkeys(PRIORITIES, 0)
+        self._started = dict.fromkeys(PRIORITIES, 0)
+        self._queues = {prio: collections.OrderedDict() for prio in PRIORITIES}
+        self._condition = threading.Condition()
+
+    def classify(self, method: str, url: str) -> str:
+        """
+        :return: the priority of the call, a priority set with priority() takes precedence
+        """
+        prio = _priority.get()
+        if prio is not None:
+            return prio
+        path = urlsplit(url).path
+        for rule_method, path_re, prio in self.rules:
+            if rule_method in ("*", method.upper()) and path_re.search(path):
+                return prio
+        return NORMAL
+
+    def acquire(self, prio: str, tenant=None):
+        """
+        Wait for a slot, bounded by the current deadline
+        """
+        ticket = _Ticket()
+        with self._condition:
+            self._queues[prio].setdefault(tenant, collections.deque()).append(ticket)
+            self._dispatch()
+            while not ticket.granted:
+                remaining = _timeouts.remaining()
+                if remaining is not None and remaining <= 0:
+                    self._cancel(prio, tenant, ticket)
+                    # the calls queued behind this one may be able to start now
+                    self._dispatch()
+                    raise TwikeyError(
+                        ctx=prio,
+                        error_code="DeadlineExceeded",
+                        error="Deadline passed while queued",
+                    )
+                self._condition.wait(timeout=remaining)
+
+    def release(self, prio: str):
+        with self._condition:
+            self._in_flight[prio] -= 1
+            self._dispatch()
+
+    def stats(self) -> dict:
+        """
+        :return: per priority the number of calls in flight, waiting and started
+        """
+        with self._condition:
+            return {
+                prio: {
+                    "in_flight": self._in_flight[prio],
+                    "waiting": sum(len(q) for q in self._queues[prio].values()),
+                    "started": self._started[prio],
+                }
+                for prio in PRIORITIES
+            }
+
+    def _dispatch(self):
+        granted = False
+        for prio in PRIORITIES:
+            queue = self._queues[prio]
+            while queue and self._has_capacity(prio):
+                # round-robin over the tenants waiting with this priority
+                tenant, tickets = queue.popitem(last=False)
+                ticket = tickets.popleft()
+                if tickets:
+                    queue[tenant] = tickets
+                ticket.granted = True
+                granted = True
+                self._in_flight[prio] += 1
+                self._started[prio] += 1
+            if queue:
+                # lower priorities wait behind this one
+                break
+        if granted:
+            self._condition.notify_all()
+
+    def _has_capacity(self, prio) -> bool:
+        in_flight = sum(self._in_flight.values())
+        if prio == HIGH:
+            return in_flight < self.max_concurrent
+        if in_flight >= self.max_concurrent - self.reserved_high:
+            return False
+        return (
+            prio != BULK
+            or self.max_bulk is None
+            or self._in_flight[BULK] < self.max_bulk
+        )
+
+    def _cancel(self, prio, tenant, ticket):
+        tickets = self._queues[prio].get(tenant)
+        if tickets is not None:
+            tickets.remove(ticket)
+            if not tickets:
+                del self._queues[prio][tenant]
+
+
+class ScheduledSession(object):
+    """
+    Wraps the session of a TwikeyClient, every call waits for a slot of the scheduler
+    """
+
+    def __init__(self, session, scheduler: RequestScheduler, tenant=None) -> None:
+        self.session = session
+        self.scheduler = scheduler
+        self.tenant = tenant
+
+    def request(self, method, url, **kwargs):
+        prio = self.scheduler.classify(method, url)
+        self.scheduler.acquire(prio, self.tenant)
+        try:
+            return getattr(self.session, method.lower())(url, **kwargs)
+        finally:
+            self.scheduler.release(prio)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request("PATCH", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+
+class _Ticket(object):
+    __slots__ = ["granted"]
+
+    def __init__(self):
+        self.granted = False
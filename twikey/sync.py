@@ -0,0 +1,293 @@
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class RateLimiter(object):
+    """
+    Token bucket shared by several feeds, allowing on average rate calls per second with bursts up to burst calls
+    """
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class FeedStats(object):
+    """
+    Attributes:
+        name (str): name of the feed
+        position (str): position of the last page handled
+        interval (float): seconds between the current and the next run
+        last_items (int): number of items handled in the last run
+        items (int): number of items handled in total
+        runs (int): number of runs
+        errors (int): number of runs that failed
+        last_error (Exception): error of the last failed run
+        caught_up (float): time.time() the feed was last read until the end
+        lag (float): seconds since the feed was last read until the end, None when it never was
+    """
+
+    __slots__ = [
+        "name",
+        "position",
+        "interval",
+        "last_items",
+        "items",
+        "runs",
+        "errors",
+        "last_error",
+        "caught_up",
+    ]
+
+    def __init__(self, name, position, interval):
+        self.name = name
+        self.position = position
+        self.interval = interval
+        self.last_items = 0
+        self.items = 0
+        self.runs = 0
+        self.errors = 0
+        self.last_error = None
+        self.caught_up = None
+
+    @property
+    def lag(self):
+        if self.caught_up is None:
+            return None
+        return time.time() - self.caught_up
+
+    def __str__(self):
+        return (
+            f"{self.name}: position={self.position}, lag={self.lag}, interval={self.interval}, "
+            f"last_items={self.last_items}, errors={self.errors}"
+        )
+
+
+class FeedOrchestrator(object):
+    """
+    Runs several feeds of a client concurrently, sharing its connection pool and a rate budget.
+
+    Each feed has its own interval: it is read again immediately after a run that handled items and the interval
+    doubles (up to max_interval) while the feed remains empty or fails.
+
+    Sample usage
+
+        orchestrator = FeedOrchestrator(twikey_client, requests_per_second=5)
+        orchestrator.add("mandate", twikey_client.document.feed_engine(), MyDocumentFeed(), position)
+        orchestrator.add("invoice", twikey_client.invoice.feed_engine(), MyInvoiceFeed())
+        orchestrator.add("payment", twikey_client.invoice.payment_engine(), MyPaymentFeed())
+        orchestrator.start()
+        ...
+        print(orchestrator.stats())
+        orchestrator.stop()
+    """
+
+    def __init__(
+        self,
+        client,
+        requests_per_second=None,
+        max_workers=6,
+        min_interval=1.0,
+        max_interval=300.0,
+        checkpoint=None,
+    ) -> None:
+        """
+        :param client: the TwikeyClient reading the feeds
+        :param requests_per_second: Optional rate budget of page requests shared by all feeds
+        :param max_workers: number of feeds read at the same time
+        :param min_interval: seconds between runs of a feed that returned items
+        :param max_interval: maximum seconds between runs of a feed
+        :param checkpoint: Optional callback(name, position) called after every run that handled items
+        """
+        self.client = client
+        self.limiter = (
+            RateLimiter(requests_per_second, burst=max_workers)
+            if requests_per_second
+            else None
+        )
+        self.max_workers = max_workers
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.checkpoint = checkpoint
+        self.logger = logging.getLogger(__name__)
+        self._feeds = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._executor = None
+
+    def add(self, name: str, engine, handler, start_position=False, prefetch=None):
+        """
+        :param name: name of the feed in the stats and checkpoints
+        :param engine: FeedEngine of the feed (eg. twikey_client.invoice.feed_engine())
+        :param handler: the feed handler (eg. an InvoiceFeed)
+        :param start_position: Optional position to resume after
+        :param prefetch: Optional PageQueue of this feed, fetching pages while the previous ones are handled
+        """
+        with self._lock:
+            self._feeds[name] = _Feed(
+                engine,
+                handler,
+                FeedStats(name, start_position, self.min_interval),
+                prefetch,
+            )
+        self._wakeup.set()
+
+    def run_once(self) -> dict:
+        """
+        Read all feeds once, concurrently
+        :return: the stats per feed
+        """
+        with ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="twikey-feed"
+        ) as executor:
+            for feed in list(self._feeds.values()):
+                feed.running = True
+                executor.submit(contextvars.copy_context().run, self._run, feed)
+        return self.stats()
+
+    def start(self):
+        """
+        Keep reading the feeds in the background until stopped
+        """
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="twikey-feed"
+        )
+        self._thread = threading.Thread(
+            target=contextvars.copy_context().run,
+            args=(self._loop,),
+            name="twikey-feeds",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop reading, feeds being read finish their current run
+        """
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def wake(self, name=None):
+        """
+        Read the feed (or all feeds) as soon as possible, eg. after receiving a webhook
+        """
+        with self._lock:
+            for feed in self._feeds.values():
+                if name is None or feed.stats.name == name:
+                    if feed.running:
+                        # the run may have read the feed before the event, read it again once done
+                        feed.woken = True
+                    else:
+                        feed.due = 0.0
+        self._wakeup.set()
+
+    def stats(self) -> dict:
+        """
+        :return: FeedStats per feed name
+        """
+        with self._lock:
+            return {name: feed.stats for name, feed in self._feeds.items()}
+
+    def _loop(self):
+        while not self._stopping.is_set():
+            now = time.monotonic()
+            with self._lock:
+                due = [
+                    feed
+                    for feed in self._feeds.values()
+                    if not feed.running and feed.due <= now
+                ]
+                for feed in due:
+                    feed.running = True
+            for feed in due:
+                self._executor.submit(contextvars.copy_context().run, self._run, feed)
+            with self._lock:
+                waiting = [
+                    feed.due for feed in self._feeds.values() if not feed.running
+                ]
+            self._wakeup.wait(
+                timeout=max(0.0, min(waiting, default=now + self.max_interval) - now)
+            )
+            self._wakeup.clear()
+
+    def _run(self, feed):
+        stats = feed.stats
+        items = feed.engine.items
+        try:
+            try:
+                feed.engine.run(
+                    feed.handler,
+                    stats.position,
+                    throttle=self.limiter and self.limiter.acquire,
+                    prefetch=feed.prefetch,
+                )
+            except Exception as e:
+                self.logger.warning("Reading feed %s failed: %s", stats.name, e)
+                stats.errors += 1
+                stats.last_error = e
+                stats.interval = min(self.max_interval, stats.interval * 2)
+            else:
+                stats.caught_up = time.time()
+                if feed.engine.items > items:
+                    stats.interval = self.min_interval
+                else:
+                    stats.interval = min(self.max_interval, stats.interval * 2)
+            # the pages handled before an error aren't read again either
+            stats.last_items = feed.engine.items - items
+            stats.items += stats.last_items
+            position = feed.engine.position
+            if position != stats.position:
+                stats.position = position
+                if self.checkpoint:
+                    self.checkpoint(stats.name, position)
+        finally:
+            stats.runs += 1
+            with self._lock:
+                feed.running = False
+                feed.due = 0.0 if feed.woken else time.monotonic() + stats.interval
+                feed.woken = False
+            self._wakeup.set()
+
+
+class _Feed(object):
+    __slots__ = ["engine", "handler", "stats", "prefetch", "due", "running", "woken"]
+
+    def __init__(self, engine, handler, stats, prefetch):
+        self.engine = engine
+        self.handler = handler
+        self.stats = stats
+        self.prefetch = prefetch
+        self.due = 0.0
+        self.running = False
+        self.woken = False
@@ -0,0 +1,80 @@
+import contextvars
+import time
+from contextlib import contextmanager
+
+# (connect, read) in seconds for the calls that need more time than the default
+DEFAULT_ENDPOINT_TIMEOUTS = {
+    "invoice.bulk_create": (30, 30),
+    "transaction.batch_send": (60, 60),  # might be large batches
+    "transaction.batch_import": (60, 60),
+    "transaction.reporting_import": (60, 60),
+}
+
+_deadline = contextvars.ContextVar("twikey_deadline", default=None)
+
+
+class Timeouts(object):
+    """
+    Connect and read timeouts of the calls to Twikey.
+
+    Endpoints are named after the service and method (eg. 'invoice.create', 'transaction.feed' or 'login').
+    A timeout can be configured for a single endpoint or for all endpoints of a service (eg. 'invoice')
+    either as a (connect, read) pair or only the read timeout. The configured timeouts take precedence over
+    DEFAULT_ENDPOINT_TIMEOUTS, a single endpoint over its service.
+
+    Attributes:
+        connect (float): default connect timeout in seconds
+        read (float): default read timeout in seconds
+        endpoints (dict): configured timeouts per endpoint or service
+    """
+
+    __slots__ = ["connect", "read", "endpoints"]
+
+    def __init__(self, connect=15, read=15, endpoints=None) -> None:
+        self.connect = connect
+        self.read = read
+        self.endpoints = dict(endpoints or {})
+
+    def get(self, endpoint: str) -> tuple:
+        """
+        :return: (connect, read) timeout of the endpoint
+        """
+        value = self.endpoints.get(endpoint)
+        if value is None:
+            value = self.endpoints.get(endpoint.split(".", 1)[0])
+        if value is None:
+            value = DEFAULT_ENDPOINT_TIMEOUTS.get(endpoint)
+        if value is None:
+            return self.connect, self.read
+        if isinstance(value, (int, float)):
+            return self.connect, value
+        connect, read = value
+        return connect, read
+
+
+@contextmanager
+def deadline(seconds: float):
+    """
+    Limit the time all calls made within this block (in this thread or context) may take, a call that would
+    start after the deadline fails immediately and the timeouts of the others are capped to the remaining time.
+    Nested deadlines can only shorten the outer one.
+    """
+    at = time.monotonic() + seconds
+    outer = _deadline.get()
+    if outer is not None:
+        at = min(at, outer)
+    token = _deadline.set(at)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> float:
+    """
+    :return: seconds left before the current deadline, None without deadline
+    """
+    at = _deadline.get()
+    if at is None:
+        return None
+    return at - time.monotonic()
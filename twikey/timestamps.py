@@ -0,0 +1,44 @@
+import logging
+import re
+from datetime import datetime
+from functools import lru_cache
+
+_FRACTION = re.compile(r"\.(\d+)")
+
+logger = logging.getLogger(__name__)
+
+
+def _fraction(match) -> str:
+    # fromisoformat before python 3.11 only accepts 3 or 6 digits
+    return "." + match.group(1)[:6].ljust(6, "0")
+
+
+@lru_cache(maxsize=4096)
+def parse_timestamp(value):
+    """
+    Parse a timestamp as returned by Twikey (eg. '2024-03-01T10:11:12Z', '2024-03-01T10:11:12.345+01:00'
+    or '2024-03-01'). Feed pages tend to repeat the same timestamps, so the results are cached.
+
+    :param value: the timestamp, None or an empty string are returned as None
+    :return: the datetime, timezone aware unless Twikey returned a local time or a date. A value in an
+             unexpected format is returned as is.
+    """
+    if not value:
+        return None
+    iso = value[:-1] + "+00:00" if value[-1] == "Z" else value
+    try:
+        return datetime.fromisoformat(iso)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(_FRACTION.sub(_fraction, iso, count=1))
+    except ValueError:
+        logger.warning("Unexpected timestamp %r, kept as is", value)
+        return value
+
+
+def raw_timestamp(value):
+    """
+    Keep the timestamp as returned by Twikey, unless TwikeyClient(parse_timestamps=True)
+    """
+    return value
@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on windows
+    fcntl = None
+
+
+class StoredToken(object):
+    """
+    Token obtained by a login, shared between processes via a TokenStore.
+
+    Attributes:
+        token (str): the value of the Authorization header
+        merchant_id (str): the id of the merchant the token belongs to
+        created (float): epoch seconds of the login
+    """
+
+    __slots__ = ["token", "merchant_id", "created"]
+
+    def __init__(self, token, merchant_id, created=None):
+        self.token = token
+        self.merchant_id = merchant_id
+        self.created = created or time.time()
+
+    def age(self) -> float:
+        return time.time() - self.created
+
+    def to_dict(self) -> dict:
+        return {"token": self.token, "merchant_id": self.merchant_id, "created": self.created}
+
+
+class TokenStore(ABC):
+    """
+    Storage for tokens so a login done by one process can be reused by others (and after a restart).
+
+    Implement get, put and delete to provide your own backend (eg. redis or memcached). Overriding lock allows
+    other processes to wait for an ongoing login instead of logging in themselves.
+    """
+
+    @staticmethod
+    def key(api_key: str, base_url: str) -> str:
+        """
+        Key under which the token of an api key is stored, the api key itself is never stored
+        """
+        return hashlib.sha256(("%s|%s" % (base_url, api_key)).encode()).hexdigest()
+
+    @abstractmethod
+    def get(self, key: str) -> StoredToken:
+        pass
+
+    @abstractmethod
+    def put(self, key: str, token: StoredToken):
+        pass
+
+    @abstractmethod
+    def delete(self, key: str):
+        pass
+
+    @contextmanager
+    def lock(self, key: str):
+        yield
+
+
+class FileTokenStore(TokenStore):
+    """
+    Keeps the tokens in a json file, logins are serialised across processes by locking a companion '.lock' file.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._local = threading.local()
+
+    def get(self, key: str) -> StoredToken:
+        entry = self._read().get(key)
+        if entry:
+            return StoredToken(entry["token"], entry["merchant_id"], entry["created"])
+        return None
+
+    def put(self, key: str, token: StoredToken):
+        with self.lock(key):
+            tokens = self._read()
+            tokens[key] = token.to_dict()
+            self._write(tokens)
+
+    def delete(self, key: str):
+        with self.lock(key):
+            tokens = self._read()
+            if tokens.pop(key, None):
+                self._write(tokens)
+
+    @contextmanager
+    def lock(self, key: str):
+        if fcntl is None or getattr(self._local, "locked", False):
+            yield
+            return
+        with open(self.path + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            self._local.locked = True
+            try:
+                yield
+            finally:
+                self._local.locked = False
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, tokens: dict):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".twikey-tokens")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(tokens, f)
+            os.chmod(tmp, 0o600)
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+
+class SqliteTokenStore(TokenStore):
+    """
+    Keeps the tokens in a sqlite database, logins are serialised across processes using a write transaction.
+    """
+
+    def __init__(self, path: str, timeout=30) -> None:
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS twikey_token "
+                "(key TEXT PRIMARY KEY, token TEXT, merchant_id TEXT, created REAL)"
+            )
+
+    def get(self, key: str) -> StoredToken:
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT token, merchant_id, created FROM twikey_token WHERE key = ?", (key,)
+            ).fetchone()
+        if row:
+            return StoredToken(*row)
+        return None
+
+    def put(self, key: str, token: StoredToken):
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO twikey_token (key, token, merchant_id, created) VALUES (?, ?, ?, ?)",
+                (key, token.token, token.merchant_id, token.created),
+            )
+
+    def delete(self, key: str):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM twikey_token WHERE key = ?", (key,))
+
+    @contextmanager
+    def lock(self, key: str):
+        if getattr(self._local, "conn", None) is not None:
+            yield
+            return
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+        conn.execute("BEGIN IMMEDIATE")
+        self._local.conn = conn
+        try:
+            yield
+        finally:
+            self._local.conn = None
+            conn.execute("COMMIT")
+            conn.close()
+
+    @contextmanager
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            # inside lock(), reuse the connection holding the write transaction
+            yield conn
+            return
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
@@ -1,5 +1,9 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
 import requests
 
+from .feed import FeedEngine
 from .model.transaction_request import NewTransactionRequest, StatusRequest, QueryTransactionsRequest, ActionRequest, \
     UpdateRequest, RefundRequest, RemoveTransactionRequest
 from .model.transaction_response import Transaction, TransactionStatusResponse, RefundResponse, TransactionFeed
@@ -35,11 +39,11 @@ class TransactionService(object):
         data = request.to_request()
         try:
             self.client.refresh_token_if_required()
-            response = requests.post(
+            response = self.client.session.post(
                 url=url,
                 data=data,
                 headers=self.client.headers(),
-                timeout=15,
+                timeout=self.client.timeout("transaction.create"),
             )
             response.raise_for_status()
             if "ApiErrorCode" in response.headers:
@@ -47,7 +51,7 @@ class TransactionService(object):
             entries_ = response.json()["Entries"]
             if len(entries_) > 0:
                 first_transaction = entries_[0]
-                return Transaction(first_transaction)
+                return Transaction(first_transaction, self.client.parse_timestamp)
             return response.json()
         except requests.exceptions.RequestException as e:
             raise self.client.raise_error_from_request("Create transaction", e)
@@ -73,15 +77,19 @@ class TransactionService(object):
 
         params = request.to_params()
         url = self.client.instance_url("/transaction/detail")
-        try:
-            self.client.refresh_token_if_required()
-            headers = self.client.headers("application/json")
-            response = requests.get(url=url, params=params, headers=headers, timeout=15)
-            if response.status_code != 200:
-                raise self.client.raise_error("Transaction detail", response)
-            return TransactionStatusResponse(response.json())
-        except requests.exceptions.RequestException as e:
-            raise self.client.raise_error_from_request("Transaction detail", e)
+
+        def status_details():
+            try:
+                self.client.refresh_token_if_required()
+                headers = self.client.headers("application/json")
+                response = self.client.session.get(url=url, params=params, headers=headers, timeout=self.client.timeout("transaction.status_details"))
+                if response.status_code != 200:
+                    raise self.client.raise_error("Transaction detail", response)
+                return TransactionStatusResponse(response.json(), self.client.parse_timestamp)
+            except requests.exceptions.RequestException as e:
+                raise self.client.raise_error_from_request("Transaction detail", e)
+
+        return self.client.coalesce(url, params, status_details)
 
     def query(self, request: QueryTransactionsRequest) -> TransactionStatusResponse:
         """
@@ -103,17 +111,74 @@ class TransactionService(object):
         """
 
         data = request.to_request()
-        url = self.client.instance_url(f"/transaction/query?fromId={data.get('fromId')}")
+        url = self.client.instance_url("/transaction/query")
         try:
             self.client.refresh_token_if_required()
             headers = self.client.headers()
-            response = requests.get(url=url, headers=headers, timeout=15,)
+            response = self.client.session.get(url=url, params=data, headers=headers, timeout=self.client.timeout("transaction.query"),)
             if response.status_code != 200:
                 raise self.client.raise_error("Transaction detail", response)
-            return TransactionStatusResponse(response.json())
+            return TransactionStatusResponse(response.json(), self.client.parse_timestamp)
         except requests.exceptions.RequestException as e:
             raise self.client.raise_error_from_request("Transaction detail", e)
 
+    def iter_query(self, request: QueryTransactionsRequest, checkpoint=None, mandates=None, max_workers=4):
+        """
+        See https://www.twikey.com/api/#query-transactions
+
+        Iterate over all transactions starting from a specific transaction ID, advancing the
+        fromId cursor automatically until no new transactions are returned.
+
+        When a list of mandates is given, one query per mandate is run in parallel (starting from the
+        same fromId) and the transactions are yielded as soon as their page arrives.
+
+        Args:
+            request (QueryTransactionsRequest): the starting point of the query
+            checkpoint (callable): Optional callback receiving a QueryTransactionsRequest from which the
+                query can be resumed, called once all transactions of a page were consumed.
+            mandates (list[str]): Optional list of mandate references to query in parallel
+            max_workers (int): Maximum number of parallel queries when mandates are given
+
+        Returns:
+            Iterator[Transaction]: the transactions in the order they were received per query.
+
+        Raises:
+            TwikeyError: If the request fails or the API returns an error.
+        """
+
+        if not mandates:
+            cursor = _QueryCursor(request.from_id, request.mndt_id)
+            while True:
+                page = cursor.advance(self.query(cursor.request()).entries)
+                if not page:
+                    return
+                yield from page
+                if checkpoint:
+                    checkpoint(cursor.request())
+
+        cursors = [_QueryCursor(request.from_id, mndt_id) for mndt_id in mandates]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = {self._submit_query(executor, c): c for c in cursors}
+            try:
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        cursor = pending.pop(future)
+                        page = cursor.advance(future.result().entries)
+                        if not page:
+                            continue
+                        yield from page
+                        if checkpoint:
+                            checkpoint(cursor.request())
+                        pending[self._submit_query(executor, cursor)] = cursor
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def _submit_query(self, executor, cursor):
+        # run in a copy of the current context so a deadline applies to the parallel queries too
+        return executor.submit(contextvars.copy_context().run, self.query, cursor.request())
+
     def action(self, request: ActionRequest):
         """
         See https://www.twikey.com/api/#action-on-transaction
@@ -137,11 +202,11 @@ class TransactionService(object):
         data = request.to_request()
         try:
             self.client.refresh_token_if_required()
-            response = requests.post(
+            response = self.client.session.post(
                 url=url,
                 data=data,
                 headers=self.client.headers(),
-                timeout=15,
+                timeout=self.client.timeout("transaction.action"),
             )
             response.raise_for_status()
             if "ApiErrorCode" in response.headers:
@@ -173,7 +238,7 @@ class TransactionService(object):
         url = self.client.instance_url("/transaction")
         try:
             self.client.refresh_token_if_required()
-            response = requests.put(url=url, data=data, headers=self.client.headers(), timeout=15)
+            response = self.client.session.put(url=url, data=data, headers=self.client.headers(), timeout=self.client.timeout("transaction.update"))
             response.raise_for_status()
             if "ApiErrorCode" in response.headers:
                 raise self.client.raise_error("Update transaction", response)
@@ -204,7 +269,7 @@ class TransactionService(object):
         url = self.client.instance_url("/transaction/refund")
         try:
             self.client.refresh_token_if_required()
-            response = requests.post(url=url, data=data, headers=self.client.headers(), timeout=15)
+            response = self.client.session.post(url=url, data=data, headers=self.client.headers(), timeout=self.client.timeout("transaction.refund"))
             response.raise_for_status()
             if "ApiErrorCode" in response.headers:
                 raise self.client.raise_error("Update transaction", response)
@@ -240,14 +305,14 @@ class TransactionService(object):
         url = self.client.instance_url(f"/transaction?id={data.get('id')}")
         try:
             self.client.refresh_token_if_required()
-            response = requests.delete(url=url, headers=self.client.headers(), timeout=15)
+            response = self.client.session.delete(url=url, headers=self.client.headers(), timeout=self.client.timeout("transaction.remove"))
             response.raise_for_status()
             if "ApiErrorCode" in response.headers:
                 raise self.client.raise_error("Update transaction", response)
         except requests.exceptions.RequestException as e:
             raise self.client.raise_error_from_request("Update transaction", e)
 
-    def feed(self, transaction_feed: TransactionFeed):
+    def feed(self, transaction_feed: TransactionFeed, start_position=False):
         """
         See https://www.twikey.com/api/#transaction-feed
 
@@ -261,39 +326,45 @@ class TransactionService(object):
         Args:
             transaction_feed (TransactionFeed): Custom handler class with methods for processing
                 new, updated, or cancelled transaction events.
+            start_position (str): Optional position (eg. the value returned by a previous run) to resume after.
 
         Returns:
-            None
+            str: Position of the last page handled.
 
         Raises:
             Exception: If the request to the feed endpoint fails or response is invalid.
         """
 
+        return self.feed_engine().run(transaction_feed, start_position)
+
+    def tail(self, transaction_feed: TransactionFeed, start_position=False, min_interval=1.0, max_interval=60.0):
+        """
+        Keeps reading the transaction feed like feed(), polling for new items once it's read until the end,
+        see FeedEngine.tail(). Use feed_engine().tail() to wake or stop it from another thread.
+
+        Args:
+            transaction_feed (TransactionFeed): Custom handler class, see feed().
+            start_position (str): Optional position (eg. the value returned by a previous run) to resume after.
+            min_interval (float): Seconds between polls right after items were handled.
+            max_interval (float): Maximum seconds between polls while the feed remains empty.
+
+        Returns:
+            str: Position of the last page handled, once the handler asked to stop.
+        """
+
+        return self.feed_engine().tail(transaction_feed, start_position, min_interval, max_interval)
+
+    def feed_engine(self) -> FeedEngine:
+        """
+        :return: the engine reading the transaction feed, see feed()
+        """
         url = self.client.instance_url("/transaction")
-        try:
-            self.client.refresh_token_if_required()
-            response = requests.get(
-                url=url,
-                headers=self.client.headers(),
-                timeout=15,
-            )
-            response.raise_for_status()
-            if "ApiErrorCode" in response.headers:
-                raise self.client.raise_error("Feed transaction", response)
-            feed_response = response.json()
-            while len(feed_response["Entries"]) > 0:
-                for msg in feed_response["Entries"]:
-                    transaction_feed.transaction(Transaction(msg))
-                response = requests.get(
-                    url=url,
-                    headers=self.client.headers(),
-                    timeout=15,
-                )
-                if "ApiErrorCode" in response.headers:
-                    raise self.client.raise_error("Feed transaction", response)
-                feed_response = response.json()
-        except requests.exceptions.RequestException as e:
-            raise self.client.raise_error_from_request("Feed transaction", e)
+        parse_timestamp = self.client.parse_timestamp
+        return FeedEngine(
+            self.client, "transaction.feed", url, "Entries",
+            lambda feed, transaction: feed.transaction(transaction), "Feed transaction",
+            decode=lambda transaction: Transaction(transaction, parse_timestamp),
+        )
 
     def batch_send(self, ct, colltndt=False):
         """
@@ -308,11 +379,11 @@ class TransactionService(object):
             data["colltndt"] = colltndt
         try:
             self.client.refresh_token_if_required()
-            response = requests.post(
+            response = self.client.session.post(
                 url=url,
                 data=data,
                 headers=self.client.headers(),
-                timeout=60,  # might be large batches
+                timeout=self.client.timeout("transaction.batch_send"),
             )
             if "ApiErrorCode" in response.headers:
                 raise self.client.raise_error("Send batch", response)
@@ -329,11 +400,11 @@ class TransactionService(object):
         try:
             self.client.refresh_token_if_required()
             with open(pain008_xml, "rb") as file:
-                response = requests.post(
+                response = self.client.session.post(
                     url=url,
                     data=file,
                     headers=self.client.headers("text/xml"),
-                    timeout=60,  # might be large batches
+                    timeout=self.client.timeout("transaction.batch_import"),
                 )
                 if "ApiErrorCode" in response.headers:
                     raise self.client.raise_error("Import batch", response)
@@ -348,13 +419,36 @@ class TransactionService(object):
         url = self.client.instance_url("/reporting")
         try:
             self.client.refresh_token_if_required()
-            response = requests.post(
+            response = self.client.session.post(
                 url=url,
                 data=reporting_content,
                 headers=self.client.headers(),
-                timeout=60,  # might be large batches
+                timeout=self.client.timeout("transaction.reporting_import"),
             )
             if "ApiErrorCode" in response.headers:
                 raise self.client.raise_error("Import reporting", response)
         except requests.exceptions.RequestException as e:
             raise self.client.raise_error_from_request("Import reporting", e)
+
+
+class _QueryCursor(object):
+    """
+    Keeps track of the fromId of a transaction query, independent of whether the API
+    returns the transaction matching fromId itself or only the ones after it.
+    """
+
+    def __init__(self, from_id, mndt_id=None):
+        self.from_id = from_id
+        self.mndt_id = mndt_id
+        self.last_seen = None
+
+    def request(self) -> QueryTransactionsRequest:
+        return QueryTransactionsRequest(from_id=self.from_id, mndt_id=self.mndt_id)
+
+    def advance(self, entries: list) -> list:
+        if self.last_seen is not None:
+            entries = [tx for tx in entries if int(tx.id) > self.last_seen]
+        if entries:
+            self.last_seen = max(int(tx.id) for tx in entries)
+            self.from_id = self.last_seen
+        return entries
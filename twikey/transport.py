@@ -0,0 +1,141 @@
+import json
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+
+import requests
+
+
+class Http2Session(object):
+    """
+    Drop-in replacement for the requests.Session used by TwikeyClient, sending the requests over HTTP/2
+    using httpx so many concurrent calls are multiplexed over a few connections.
+
+    Errors are mapped onto the requests exceptions, so the services report them as TwikeyError like
+    they do with the default transport. Cookies are never stored. Requires 'pip install httpx[http2]'.
+    """
+
+    def __init__(self, max_connections=100, http2=True, **client_kwargs) -> None:
+        try:
+            import httpx
+        except ImportError as e:  # pragma: no cover - depends on the environment
+            raise ImportError(
+                "HTTP/2 requires httpx, install it using 'pip install httpx[http2]'"
+            ) from e
+        self._httpx = httpx
+        self._client = httpx.Client(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+            cookies=CookieJar(policy=DefaultCookiePolicy(allowed_domains=[])),
+            **client_kwargs,
+        )
+
+    def request(
+        self,
+        method,
+        url,
+        params=None,
+        data=None,
+        json=None,
+        headers=None,
+        timeout=None,
+        **kwargs
+    ):
+        httpx = self._httpx
+        if data is not None and not isinstance(data, dict):
+            # raw bodies (files, xml, ...) are passed as content in httpx
+            kwargs["content"] = data
+            data = None
+        try:
+            response = self._client.request(
+                method,
+                url,
+                params=params,
+                data=data,
+                json=json,
+                headers=headers,
+                timeout=self._timeout(timeout),
+                **kwargs,
+            )
+        except httpx.TimeoutException as e:
+            raise requests.exceptions.Timeout(str(e)) from e
+        except (httpx.ConnectError, httpx.RemoteProtocolError) as e:
+            raise requests.exceptions.ConnectionError(str(e)) from e
+        except httpx.HTTPError as e:
+            raise requests.exceptions.RequestException(str(e)) from e
+        return Http2Response(response)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request("PATCH", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+    def close(self):
+        self._client.close()
+
+    def _timeout(self, timeout):
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+            return self._httpx.Timeout(read, connect=connect, pool=connect)
+        return self._httpx.Timeout(timeout)
+
+
+class Http2Response(object):
+    """
+    Exposes a httpx response with the parts of the requests.Response interface used by the services
+    """
+
+    __slots__ = ["_response"]
+
+    def __init__(self, response) -> None:
+        self._response = response
+
+    @property
+    def status_code(self):
+        return self._response.status_code
+
+    @property
+    def headers(self):
+        return self._response.headers
+
+    @property
+    def text(self):
+        return self._response.text
+
+    @property
+    def content(self):
+        return self._response.content
+
+    @property
+    def url(self):
+        return str(self._response.url)
+
+    @property
+    def http_version(self):
+        return self._response.http_version
+
+    def json(self, **kwargs):
+        try:
+            return self._response.json(**kwargs)
+        except json.JSONDecodeError as e:
+            raise requests.exceptions.JSONDecodeError(e.msg, e.doc, e.pos) from e
+
+    def raise_for_status(self):
+        if self._response.is_error:
+            raise requests.exceptions.HTTPError(
+                "%d Error for url: %s" % (self.status_code, self.url), response=self
+            )
+
+    def __repr__(self):
+        return "<Response [%d]>" % self.status_code
@@ -1,5 +1,15 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from hashlib import sha256
 from hmac import HMAC, compare_digest
+from urllib.parse import parse_qsl, unquote
+
+# parameters identifying a single webhook, when Twikey sends them
+_EVENT_ID_PARAMS = ("eventId",)
 
 
 class Webhook(object):
@@ -27,9 +37,333 @@ class Webhook(object):
     def verify_signature(payload, sig_header, api_key=None):
         if not sig_header:
             return False
-        expected_sign = (
-            HMAC(key=api_key.encode(), msg=payload.encode(), digestmod=sha256)
-            .hexdigest()
-            .upper()
-        )
-        return compare_digest(sig_header, expected_sign)
+        return _verifier(api_key).verify(payload, sig_header)
+
+
+@lru_cache(maxsize=32)
+def _verifier(api_key):
+    return WebhookVerifier(api_key)
+
+
+class WebhookVerifier(object):
+    """
+    Reusable verifier for the X-Signature of webhooks.
+
+    The keyed HMAC state is computed once per api key and copied for every message. Multiple keys
+    can be active at once to allow rotating the api key without rejecting webhooks signed with the old one.
+
+    Sample usage
+
+        verifier = WebhookVerifier(APIKEY)
+        if verifier.verify(request.query_string, request.headers.get('X-Signature')):
+            ...
+    """
+
+    def __init__(self, *api_keys) -> None:
+        self._keys = ()
+        for api_key in api_keys:
+            self.add_key(api_key)
+
+    def add_key(self, api_key):
+        """
+        Accept webhooks signed with this api key (next to the already known keys)
+        """
+        state = HMAC(key=_to_bytes(api_key), digestmod=sha256)
+        self._keys = self._keys + ((api_key, state),)
+
+    def remove_key(self, api_key):
+        """
+        Stop accepting webhooks signed with this api key, eg. once a key rotation is done
+        """
+        self._keys = tuple(entry for entry in self._keys if entry[0] != api_key)
+
+    def sign(self, payload) -> str:
+        """
+        :return: the signature of the payload using the first active key
+        """
+        if not self._keys:
+            raise ValueError("No api key configured")
+        return self._sign(self._keys[0][1], _to_bytes(payload))
+
+    def verify(self, payload, signature) -> bool:
+        """
+        :param payload: the (unquoted) query string as str or bytes
+        :param signature: the value of the X-Signature header
+        :return: whether the payload was signed by one of the active keys
+        """
+        if not signature:
+            return False
+        if isinstance(signature, bytes):
+            signature = signature.decode("ascii", "replace")
+        msg = _to_bytes(payload)
+        matched = False
+        for _, state in self._keys:
+            # check all keys to not leak which one matched through the timing
+            matched |= compare_digest(signature, self._sign(state, msg))
+        return matched
+
+    def verify_batch(self, messages) -> list:
+        """
+        :param messages: iterable of (payload, signature) pairs
+        :return: list of booleans in the same order as the messages
+        """
+        return [self.verify(payload, signature) for payload, signature in messages]
+
+    @staticmethod
+    def _sign(state, msg: bytes) -> str:
+        mac = state.copy()
+        mac.update(msg)
+        return mac.hexdigest().upper()
+
+
+def _to_bytes(value) -> bytes:
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value)
+    return value.encode()
+
+
+class WebhookEvent(object):
+    """
+    A webhook as sent by Twikey, parsed from its query string.
+
+    Attributes:
+        type (str): the type of webhook (eg. contract, payment, invoice, paymentlink, event)
+        params (dict): all parameters of the webhook
+        payload (str): the query string as received
+    """
+
+    __slots__ = ["type", "params", "payload"]
+
+    def __init__(self, payload: str, params: dict) -> None:
+        self.payload = payload
+        self.params = params
+        self.type = params.get("type")
+
+    def get(self, key, default=None):
+        return self.params.get(key, default)
+
+    @property
+    def key(self) -> str:
+        """
+        Identifies the webhook, a redelivery of the same webhook has the same key. That's its event id when
+        present, otherwise all its parameters, including its timestamp when present. Without either, later
+        webhooks with the same parameters have the same key as well.
+        """
+        for name in _EVENT_ID_PARAMS:
+            if self.params.get(name):
+                return "%s=%s" % (name, self.params[name])
+        return "&".join("%s=%s" % item for item in sorted(self.params.items()))
+
+    def __str__(self):
+        return f"{self.__class__.__name__} {self.params}"
+
+
+class ContractEvent(WebhookEvent):
+    """Update of a mandate, fetch the details via the document feed"""
+
+    __slots__ = []
+
+    @property
+    def mandate_number(self):
+        return self.params.get("mndtId")
+
+
+class TransactionEvent(WebhookEvent):
+    """Update of a transaction, fetch the details via the transaction feed"""
+
+    __slots__ = []
+
+    @property
+    def id(self):
+        return self.params.get("id")
+
+    @property
+    def mandate_number(self):
+        return self.params.get("mndtId")
+
+    @property
+    def ref(self):
+        return self.params.get("ref")
+
+
+class InvoiceEvent(WebhookEvent):
+    """Update of an invoice, fetch the details via the invoice feed"""
+
+    __slots__ = []
+
+    @property
+    def id(self):
+        return self.params.get("id")
+
+    @property
+    def number(self):
+        return self.params.get("number")
+
+    @property
+    def state(self):
+        return self.params.get("state")
+
+
+class PaylinkEvent(WebhookEvent):
+    """Update of a payment link, fetch the details via the paylink feed"""
+
+    __slots__ = []
+
+    @property
+    def id(self):
+        return self.params.get("id")
+
+    @property
+    def ref(self):
+        return self.params.get("ref")
+
+    @property
+    def state(self):
+        return self.params.get("status")
+
+
+_EVENT_TYPES = {
+    "contract": ContractEvent,
+    "payment": TransactionEvent,
+    "invoice": InvoiceEvent,
+    "paymentlink": PaylinkEvent,
+}
+
+
+def parse_event(query_string) -> WebhookEvent:
+    """
+    Parse the query string of a webhook as received (so not unquoted yet, as a value may contain '&' or '=')
+    into the matching WebhookEvent.
+    """
+    query_string = _to_str(query_string)
+    params = dict(parse_qsl(query_string, keep_blank_values=True))
+    return _EVENT_TYPES.get(params.get("type"), WebhookEvent)(query_string, params)
+
+
+def _to_str(value) -> str:
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).decode()
+    return value
+
+
+class SeenSet(object):
+    """
+    Bounded set of recently seen keys, keys are forgotten after ttl seconds or when
+    more than max_size keys were added since.
+
+    Unless a webhook carries an event id or timestamp, a later update with the same parameters (eg. a second
+    update of the same mandate) has the same key. The ttl should only cover the time in which Twikey redelivers
+    a webhook.
+    """
+
+    def __init__(self, max_size=10000, ttl=5 * 60) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, key) -> bool:
+        """
+        :return: True if the key was not seen before (and is now remembered)
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            if key in self._seen:
+                return False
+            self._seen[key] = now
+            if len(self._seen) > self.max_size:
+                self._seen.popitem(last=False)
+            return True
+
+    def discard(self, key):
+        with self._lock:
+            self._seen.pop(key, None)
+
+    def _expire(self, now):
+        while self._seen:
+            key, seen_at = next(iter(self._seen.items()))
+            if now - seen_at <= self.ttl:
+                break
+            del self._seen[key]
+
+    def __contains__(self, key):
+        with self._lock:
+            self._expire(time.monotonic())
+            return key in self._seen
+
+    def __len__(self):
+        return len(self._seen)
+
+
+class WebhookDispatcher(object):
+    """
+    Verifies, parses and deduplicates webhooks and runs the registered handlers on a worker pool.
+
+    Sample usage
+
+        dispatcher = WebhookDispatcher(WebhookVerifier(APIKEY))
+
+        @dispatcher.on("invoice")
+        def invoice_updated(event: InvoiceEvent):
+            twikeyClient.invoice.feed(MyInvoiceFeed())
+
+        @app.route('/webhook', methods=['GET'])
+        def webhook(request):
+            if dispatcher.dispatch(request.query_string, request.headers.get('X-Signature')) is None:
+                return 'Forbidden', 403
+            return 'Successfully', 200
+    """
+
+    def __init__(self, verifier: WebhookVerifier = None, max_workers=4, seen: SeenSet = None) -> None:
+        """
+        :param verifier: when given, webhooks with an invalid signature are rejected
+        :param max_workers: number of threads running the handlers
+        :param seen: set of the recently handled webhooks, redeliveries are skipped
+        """
+        self.verifier = verifier
+        self.seen = seen if seen is not None else SeenSet()
+        self.logger = logging.getLogger(__name__)
+        self._handlers = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="twikey-webhook")
+
+    def on(self, event_type, handler=None):
+        """
+        Register a handler for a type of webhook ('*' for all types), usable as decorator
+        """
+        if handler is None:
+            def decorator(fn):
+                self.on(event_type, fn)
+                return fn
+            return decorator
+        self._handlers.setdefault(event_type, []).append(handler)
+        return handler
+
+    def dispatch(self, query_string, signature=None):
+        """
+        :param query_string: the query string of the webhook as received, it's unquoted to verify its signature
+        :param signature: the value of the X-Signature header
+        :return: a Future completing once all handlers ran, False for a redelivered webhook or None when the
+                 signature is invalid
+        """
+        if self.verifier is not None and not self.verifier.verify(unquote(_to_str(query_string)), signature):
+            self.logger.warning("Invalid signature for webhook")
+            return None
+        event = parse_event(query_string)
+        if not self.seen.add(event.key):
+            self.logger.debug("Skipping redelivered webhook %s", event.key)
+            return False
+        return self._executor.submit(self._run, event)
+
+    def _run(self, event: WebhookEvent):
+        try:
+            for handler in self._handlers.get(event.type, []) + self._handlers.get("*", []):
+                handler(event)
+        except Exception:
+            # allow a redelivery to retry this webhook
+            self.seen.discard(event.key)
+            self.logger.exception("Error while handling webhook %s", event.key)
+            raise
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)